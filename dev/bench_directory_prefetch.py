@@ -0,0 +1,159 @@
+#!/usr/bin/env python2.7
+
+"""Measure how long a depth-first walk of a cold tree takes, with and without
+prefetching subdirectories in the background. This runs against a stand-in
+for Drive whose listings each take a fixed amount of time.
+"""
+
+import sys
+import os.path
+dev_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, dev_path)
+
+import argparse
+import time
+
+import gdrivefs.state
+import gdrivefs.cache.volume
+import gdrivefs.cache.prefetch
+
+from gdrivefs.conf import Conf
+from gdrivefs.gdtool.normal_entry import NormalEntry
+
+_ROOT_ID = 'root'
+
+def _build_entry(entry_id, title, parent_id, is_directory=False):
+    raw = {
+        u'id': entry_id,
+        u'title': title,
+        u'mimeType': Conf.get('directory_mimetype') \
+                        if is_directory \
+                        else u'application/octet-stream',
+        u'labels': {},
+        u'lastModifyingUserName': u'bench',
+        u'writersCanShare': True,
+        u'ownerNames': [u'bench'],
+        u'editable': True,
+        u'userPermission': {},
+        u'modifiedDate': u'2014-01-01T00:00:00.000Z',
+        u'parents': [{ u'id': parent_id }] if parent_id else [],
+    }
+
+    if is_directory is False:
+        raw[u'fileSize'] = u'0'
+
+    return NormalEntry('bench', raw)
+
+
+class _FakeAccountInfo(object):
+    root_id = _ROOT_ID
+
+    @staticmethod
+    def get_instance():
+        return _FakeAccountInfo
+
+
+class _FakeDrive(object):
+    """Serves a tree of the given fan-out and depth, slowly. Every directory
+    has the same number of subdirectories and files.
+    """
+
+    def __init__(self, delay_s, fanout, depth):
+        self.__delay_s = delay_s
+        self.__fanout = fanout
+        self.__depth = depth
+
+    def list_files_page(self, parent_id=None, page_token=None,
+                        max_results=None, **kwargs):
+        time.sleep(self.__delay_s)
+
+        level = parent_id.count('-')
+
+        entries = [_build_entry(('%s-f%d' % (parent_id, i)),
+                                ('file_%d' % (i)),
+                                parent_id)
+                   for i
+                   in xrange(self.__fanout)]
+
+        if level < self.__depth:
+            entries += [_build_entry(('%s-%d' % (parent_id, i)),
+                                     ('dir_%d' % (i)),
+                                     parent_id,
+                                     True)
+                        for i
+                        in xrange(self.__fanout)]
+
+        return (entries, None)
+
+
+def _walk(pr, prefetcher, entry_id, path, per_directory_s):
+    """Read each directory, depth-first, the way `find` would."""
+
+    subdirectories = []
+    for (filename, entry) in pr.get_children_entries_from_entry_id(entry_id):
+        if entry.is_directory:
+            subdirectories.append((filename, entry.id))
+
+    if prefetcher is not None:
+        prefetcher.notify_listed(1, path, subdirectories)
+
+    # Stand-in for whatever the walker does with each directory.
+    time.sleep(per_directory_s)
+
+    n = 1
+    for (filename, child_id) in subdirectories:
+        n += _walk(pr, prefetcher, child_id, ('%s/%s' % (path, filename)),
+                   per_directory_s)
+
+    return n
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=float, default=0.1,
+                        help="Seconds that each listing takes.")
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--per-directory', type=float, default=0.01,
+                        help="Seconds spent on each directory.")
+    parser.add_argument('--prefetch-depth', type=int, default=2)
+    parser.add_argument('--prefetch-workers', type=int, default=4)
+
+    args = parser.parse_args()
+
+    drive = _FakeDrive(args.delay, args.fanout, args.depth)
+    gdrivefs.cache.volume.get_gdrive = lambda: drive
+    gdrivefs.cache.volume.AccountInfo = _FakeAccountInfo
+
+    Conf.set('directory_prefetch_depth', args.prefetch_depth)
+    Conf.set('directory_prefetch_workers', args.prefetch_workers)
+
+    pr = gdrivefs.cache.volume.PathRelations.get_instance()
+    pr.register_entry(_build_entry(_ROOT_ID, u'', None, True))
+    pr.register_entry(_build_entry('cold', u'cold', _ROOT_ID, True))
+    pr.register_entry(_build_entry('prefetched', u'prefetched', _ROOT_ID,
+                                   True))
+
+    prefetcher = gdrivefs.cache.prefetch.get_prefetcher()
+
+    print("Fan-out of (%d), depth of (%d), each listing taking (%.2f) "
+          "seconds." % (args.fanout, args.depth, args.delay))
+
+    try:
+        start_at = time.time()
+        n = _walk(pr, None, 'cold', '/cold', args.per_directory)
+        cold_s = time.time() - start_at
+
+        start_at = time.time()
+        _walk(pr, prefetcher, 'prefetched', '/prefetched', args.per_directory)
+        prefetched_s = time.time() - start_at
+    finally:
+        gdrivefs.state.GLOBAL_EXIT_EVENT.set()
+
+    print("Cold      : (%d) directories walked in (%.2f) seconds." %
+          (n, cold_s))
+    print("Prefetched: (%d) directories walked in (%.2f) seconds." %
+          (n, prefetched_s))
+    print("Prefetcher: %s" % (prefetcher.get_stats(),))
+
+if __name__ == '__main__':
+    main()
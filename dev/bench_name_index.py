@@ -0,0 +1,140 @@
+#!/usr/bin/env python2.7
+
+"""Measure how registering, looking-up, and removing children scales with the
+size of a directory, for the per-directory NameIndex and for the linear 
+scanning of (filename, clause) lists that it replaced.
+"""
+
+import sys
+import os.path
+dev_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, dev_path)
+
+import time
+import random
+
+from gdrivefs.cache.name_index import NameIndex
+
+_SIZES = (1000, 10000, 100000)
+
+# Proportion of entries that share a name with a sibling.
+_DUPLICATE_RATIO = 0.05
+
+# How many operations to time against the linear structure (it's too slow to 
+# do all of them at the larger sizes).
+_LINEAR_SAMPLE = 200
+
+def _get_titles(n):
+    titles = [('file_%06d' % (i)) for i in xrange(n)]
+
+    for i in xrange(int(n * _DUPLICATE_RATIO)):
+        titles[random.randrange(n)] = titles[random.randrange(n)]
+
+    return titles
+
+def _linear_add(children, filename_base, clause):
+    i = 0
+    current_variation = filename_base
+    while i <= 255:
+        if not [ child_name_tuple 
+                 for child_name_tuple 
+                 in children 
+                 if child_name_tuple[0] == current_variation ]:
+            children.append((current_variation, clause))
+            return current_variation
+
+        i += 1
+        current_variation = filename_base + (' (%d)' % (i))
+
+def _linear_get(children, filename):
+    found = [ child_tuple[1] 
+              for child_tuple 
+              in children 
+              if child_tuple[0] == filename ]
+
+    return found[0] if found else None
+
+def _linear_remove(children, clause):
+    children[:] = [ child_tuple 
+                    for child_tuple 
+                    in children 
+                    if child_tuple[1] is not clause ]
+
+def _bench_index(titles):
+    index = NameIndex()
+    clauses = [[None, None, None, str(i), False] 
+               for i 
+               in xrange(len(titles))]
+
+    start = time.time()
+    names = [index.add(title, clause) 
+             for (title, clause) 
+             in zip(titles, clauses)]
+    add_s = time.time() - start
+
+    start = time.time()
+    for name in names:
+        index.get(name)
+    get_s = time.time() - start
+
+    start = time.time()
+    for clause in clauses:
+        index.remove(clause[3])
+    remove_s = time.time() - start
+
+    n = float(len(titles))
+    return (add_s / n, get_s / n, remove_s / n)
+
+def _bench_linear(titles):
+    clauses = [[None, None, None, str(i), False] 
+               for i 
+               in xrange(len(titles))]
+
+    # Populate directly (this part isn't being timed).
+    children = []
+    names = set()
+    for title, clause in zip(titles[:-_LINEAR_SAMPLE], 
+                             clauses[:-_LINEAR_SAMPLE]):
+        while title in names:
+            title += '_'
+
+        names.add(title)
+        children.append((title, clause))
+
+    start = time.time()
+    added = [_linear_add(children, title, clause) 
+             for (title, clause) 
+             in zip(titles[-_LINEAR_SAMPLE:], clauses[-_LINEAR_SAMPLE:])]
+    add_s = time.time() - start
+
+    start = time.time()
+    for name in added:
+        _linear_get(children, name)
+    get_s = time.time() - start
+
+    start = time.time()
+    for clause in clauses[-_LINEAR_SAMPLE:]:
+        _linear_remove(children, clause)
+    remove_s = time.time() - start
+
+    n = float(_LINEAR_SAMPLE)
+    return (add_s / n, get_s / n, remove_s / n)
+
+def main():
+    random.seed(0)
+
+    print("%-8s %8s %12s %12s %12s" % 
+          ('', 'entries', 'add (us)', 'get (us)', 'remove (us)'))
+
+    for n in _SIZES:
+        titles = _get_titles(n)
+
+        for label, bench in (('index', _bench_index), 
+                             ('linear', _bench_linear)):
+            (add_s, get_s, remove_s) = bench(titles)
+
+            print("%-8s %8d %12.2f %12.2f %12.2f" % 
+                  (label, n, add_s * 1e6, get_s * 1e6, remove_s * 1e6))
+
+if __name__ == '__main__':
+    main()
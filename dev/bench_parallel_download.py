@@ -0,0 +1,197 @@
+#!/usr/bin/env python2.7
+
+"""Measure download throughput, serially (one connection, chunk by chunk, with
+fixed and with adaptive chunk-sizes, held in memory or streamed to the file)
+and as several ranges at once. This runs against a local stand-in for Drive
+that serves HTTP range requests, with a fixed latency per request and a cap on
+the bandwidth of each connection.
+"""
+
+import sys
+import os.path
+dev_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, dev_path)
+
+import argparse
+import time
+import re
+import os
+import tempfile
+import threading
+import hashlib
+import BaseHTTPServer
+import SocketServer
+
+import httplib2
+
+from gdrivefs.gdtool.http_pool import HttpPool
+from gdrivefs.gdtool.streaming_http import StreamingHttp
+from gdrivefs.gdtool.chunked_download import ChunkedDownload, \
+                                             ParallelDownload, \
+                                             ChunkSizer, \
+                                             DEFAULT_CHUNK_SIZE
+
+_RANGE_RE = re.compile(r'^bytes=(\d+)-(\d+)$')
+
+# Responses are written in pieces of this size, to pace them.
+_WRITE_SIZE = 64 * 1024
+
+
+def _build_handler(data, latency_s, connection_bps):
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency_s)
+
+            m = _RANGE_RE.match(self.headers.get('range', ''))
+            if m is None:
+                (start, end) = (0, len(data) - 1)
+                self.send_response(200)
+            else:
+                start = int(m.group(1))
+                end = min(int(m.group(2)), len(data) - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                                 (start, end, len(data)))
+
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            for offset in xrange(start, end + 1, _WRITE_SIZE):
+                piece = data[offset:min(offset + _WRITE_SIZE, end + 1)]
+                self.wfile.write(piece)
+
+                time.sleep(float(len(piece)) / connection_bps)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _NoCredentials(object):
+    def apply(self, headers):
+        pass
+
+
+def _download_serially(uri, filepath, chunk_sizer=None, http=None):
+    if http is None:
+        http = httplib2.Http()
+
+    with open(filepath, 'wb') as f:
+        downloader = ChunkedDownload(f, http, uri, chunk_sizer=chunk_sizer)
+
+        while 1:
+            (status, done, total_size) = downloader.next_chunk()
+            if done is True:
+                break
+
+def _download_in_parallel(uri, filepath, total_size, range_size, num_workers):
+    pool = HttpPool(httplib2.Http, num_workers)
+
+    downloader = ParallelDownload(
+                    filepath,
+                    pool.borrow,
+                    uri,
+                    total_size,
+                    range_size=range_size,
+                    num_workers=num_workers)
+
+    downloader.download()
+
+def _check(filepath, digest):
+    with open(filepath, 'rb') as f:
+        assert hashlib.md5(f.read()).hexdigest() == digest, \
+               "Downloaded data doesn't match."
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="Seconds before each response starts.")
+    parser.add_argument('--connection-mbps', type=float, default=8,
+                        help="Most MB/s that one connection can carry.")
+    parser.add_argument('--range-mb', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--initial-chunk-kb', type=int, default=128)
+    parser.add_argument('--max-chunk-kb', type=int, default=8192)
+
+    args = parser.parse_args()
+
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    digest = hashlib.md5(data).hexdigest()
+
+    handler = _build_handler(data, args.latency,
+                             args.connection_mbps * 1024 * 1024)
+
+    server = _Server(('127.0.0.1', 0), handler)
+
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+
+    uri = ('http://127.0.0.1:%d/file' % (server.server_address[1],))
+
+    (fd, filepath) = tempfile.mkstemp()
+    os.close(fd)
+
+    print("(%d) MB, (%.2f) seconds of latency per request, (%.1f) MB/s per "
+          "connection, (%d) KB chunks." %
+          (args.size_mb, args.latency, args.connection_mbps,
+           DEFAULT_CHUNK_SIZE // 1024))
+
+    try:
+        start_at = time.time()
+        _download_serially(uri, filepath)
+        serial_s = time.time() - start_at
+
+        _check(filepath, digest)
+
+        chunk_sizer = ChunkSizer(args.initial_chunk_kb * 1024,
+                                 args.max_chunk_kb * 1024)
+
+        start_at = time.time()
+        _download_serially(uri, filepath, chunk_sizer)
+        adaptive_s = time.time() - start_at
+
+        _check(filepath, digest)
+
+        streamed_chunk_sizer = ChunkSizer(args.initial_chunk_kb * 1024,
+                                          args.max_chunk_kb * 1024)
+
+        start_at = time.time()
+        _download_serially(uri, filepath, streamed_chunk_sizer,
+                           StreamingHttp(_NoCredentials()))
+        streamed_s = time.time() - start_at
+
+        _check(filepath, digest)
+
+        start_at = time.time()
+        _download_in_parallel(uri, filepath, len(data),
+                              args.range_mb * 1024 * 1024, args.workers)
+        parallel_s = time.time() - start_at
+
+        _check(filepath, digest)
+    finally:
+        os.remove(filepath)
+        server.shutdown()
+
+    print("Serial  : (%.2f) seconds, (%.1f) MB/s." %
+          (serial_s, args.size_mb / serial_s))
+    print("Adaptive: (%.2f) seconds, (%.1f) MB/s, chunks grew to (%d) KB." %
+          (adaptive_s, args.size_mb / adaptive_s, chunk_sizer.size // 1024))
+    print("Streamed: (%.2f) seconds, (%.1f) MB/s, chunks grew to (%d) KB." %
+          (streamed_s, args.size_mb / streamed_s,
+           streamed_chunk_sizer.size // 1024))
+    print("Parallel: (%.2f) seconds, (%.1f) MB/s, (%d) workers, (%d) MB "
+          "ranges." %
+          (parallel_s, args.size_mb / parallel_s, args.workers,
+           args.range_mb))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python2.7
+
+"""Measure the throughput of path lookups that can be served entirely from 
+cache while other threads are waiting on slow directory listings. This runs 
+against a stand-in for Drive whose listings take a fixed amount of time.
+
+Pass "--locked-io" to hold the PathRelations lock for the duration of each 
+listing, which reproduces how things behaved before listings were fetched 
+outside of the lock.
+"""
+
+import sys
+import os.path
+dev_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, dev_path)
+
+import argparse
+import threading
+import time
+
+import gdrivefs.state
+import gdrivefs.cache.volume
+
+from gdrivefs.conf import Conf
+from gdrivefs.gdtool.normal_entry import NormalEntry
+
+_ROOT_ID = 'root'
+
+def _build_entry(entry_id, title, parent_id, is_directory=False):
+    raw = {
+        u'id': entry_id,
+        u'title': title,
+        u'mimeType': Conf.get('directory_mimetype') \
+                        if is_directory \
+                        else u'application/octet-stream',
+        u'labels': {},
+        u'lastModifyingUserName': u'bench',
+        u'writersCanShare': True,
+        u'ownerNames': [u'bench'],
+        u'editable': True,
+        u'userPermission': {},
+        u'modifiedDate': u'2014-01-01T00:00:00.000Z',
+        u'parents': [{ u'id': parent_id }] if parent_id else [],
+    }
+
+    if is_directory is False:
+        raw[u'fileSize'] = u'0'
+
+    return NormalEntry('bench', raw)
+
+
+class _FakeAccountInfo(object):
+    root_id = _ROOT_ID
+
+    @staticmethod
+    def get_instance():
+        return _FakeAccountInfo
+
+
+class _FakeDrive(object):
+    """Serves listings of cold directories, slowly."""
+
+    def __init__(self, delay_s, locked_io, files_per_directory):
+        self.__delay_s = delay_s
+        self.__locked_io = locked_io
+        self.__files_per_directory = files_per_directory
+
+    def __wait(self):
+        if self.__locked_io is True:
+            with gdrivefs.cache.volume.PathRelations.rlock:
+                time.sleep(self.__delay_s)
+        else:
+            time.sleep(self.__delay_s)
+
+    def list_files(self, parent_id=None, query_is_string=None, **kwargs):
+        self.__wait()
+
+        if query_is_string is not None:
+            return []
+
+        return [_build_entry(('%s-%d' % (parent_id, i)), 
+                             ('file_%d' % (i)), 
+                             parent_id) 
+                for i 
+                in xrange(self.__files_per_directory)]
+
+    def list_files_page(self, page_token=None, max_results=None, **kwargs):
+        return (self.list_files(**kwargs), None)
+
+
+def _run(num_lookup_threads, num_listing_threads, duration_s, 
+         cold_directory_ids):
+    pr = gdrivefs.cache.volume.PathRelations.get_instance()
+
+    stop_ev = threading.Event()
+    lookups = [0] * num_lookup_threads
+    listings = [0] * num_listing_threads
+
+    def lookup(n):
+        i = 0
+        while stop_ev.is_set() is False:
+            pr.get_clause_from_path('/warm/file_%d' % (i % 1000))
+            lookups[n] += 1
+            i += 1
+
+    def listing(n):
+        while stop_ev.is_set() is False and cold_directory_ids:
+            entry_id = cold_directory_ids.pop()
+            pr.get_children_from_entry_id(entry_id)
+            listings[n] += 1
+
+    threads = [threading.Thread(target=lookup, args=(i,)) 
+               for i 
+               in xrange(num_lookup_threads)]
+
+    threads += [threading.Thread(target=listing, args=(i,)) 
+                for i 
+                in xrange(num_listing_threads)]
+
+    for t in threads:
+        t.start()
+
+    time.sleep(duration_s)
+    stop_ev.set()
+
+    for t in threads:
+        t.join()
+
+    return (sum(lookups) / duration_s, sum(listings))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--locked-io', action='store_true')
+    parser.add_argument('--delay', type=float, default=0.5, 
+                        help="Seconds that each listing takes.")
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--lookup-threads', type=int, default=8)
+    parser.add_argument('--listing-threads', type=int, default=4)
+
+    args = parser.parse_args()
+
+    Conf.set('cache_cleanup_check_frequency_s', 1)
+
+    drive = _FakeDrive(args.delay, args.locked_io, 100)
+    gdrivefs.cache.volume.get_gdrive = lambda: drive
+    gdrivefs.cache.volume.AccountInfo = _FakeAccountInfo
+
+    pr = gdrivefs.cache.volume.PathRelations.get_instance()
+
+    # A cached directory to look things up in, and a lot of directories that 
+    # haven't been listed, yet.
+
+    pr.register_entry(_build_entry(_ROOT_ID, u'', None, True))
+    pr.register_entry(_build_entry('warm', u'warm', _ROOT_ID, True))
+
+    for i in xrange(1000):
+        pr.register_entry(_build_entry(('warm-%d' % (i)), 
+                                       ('file_%d' % (i)), 
+                                       'warm'))
+
+    cold_directory_ids = []
+    for i in xrange(10000):
+        entry_id = ('cold-%d' % (i))
+        pr.register_entry(_build_entry(entry_id, entry_id, _ROOT_ID, True))
+        cold_directory_ids.append(entry_id)
+
+    print("Listings take (%.2f) seconds. Locked I/O: %s" % 
+          (args.delay, args.locked_io))
+
+    try:
+        (idle_rate, _) = _run(args.lookup_threads, 0, args.duration, 
+                              cold_directory_ids)
+
+        (busy_rate, listings) = _run(args.lookup_threads, 
+                                     args.listing_threads, 
+                                     args.duration, 
+                                     cold_directory_ids)
+    finally:
+        gdrivefs.state.GLOBAL_EXIT_EVENT.set()
+
+    print("Cached lookups/s with no listings in flight: %.0f" % (idle_rate))
+    print("Cached lookups/s with (%d) listing threads:  %.0f (%d listings "
+          "completed)" % (args.listing_threads, busy_rate, listings))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python2.7
+
+"""Measure how long it takes from starting a mount to the first getattr()
+succeeding, first without a stored discovery document and then with the one
+that the first mount stored. This needs real credentials and FUSE.
+"""
+
+import sys
+import os.path
+dev_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, dev_path)
+
+import argparse
+import subprocess
+import time
+import os
+
+from gdrivefs.conf import Conf
+from gdrivefs.gdtool.discovery_cache import get_document_filepath
+
+_GDFS_FILEPATH = os.path.join(dev_path, 'gdrivefs', 'resources', 'scripts',
+                              'gdfs')
+
+def _is_mounted(mountpoint, parent_dev):
+    try:
+        return os.stat(mountpoint).st_dev != parent_dev
+    except OSError:
+        return False
+
+def _time_mount(auth_storage_filepath, mountpoint, option_string, timeout_s):
+    parent_dev = os.stat(os.path.dirname(mountpoint.rstrip('/'))).st_dev
+
+    cmd = [sys.executable, _GDFS_FILEPATH, auth_storage_filepath, mountpoint]
+    if option_string:
+        cmd += ['-o', option_string]
+
+    start_at = time.time()
+    p = subprocess.Popen(cmd)
+
+    try:
+        # The stat() of the mountpoint is the first getattr().
+        while _is_mounted(mountpoint, parent_dev) is False:
+            if time.time() - start_at > timeout_s:
+                raise Exception("Mount didn't come up within (%d) seconds." %
+                                (timeout_s,))
+
+            time.sleep(0.01)
+
+        return time.time() - start_at
+    finally:
+        subprocess.call(['fusermount', '-u', mountpoint])
+        p.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('auth_storage_file')
+    parser.add_argument('mountpoint')
+    parser.add_argument('-o', '--opt', help="Mount options")
+    parser.add_argument('--timeout', type=int, default=60)
+
+    args = parser.parse_args()
+
+    auth_storage_filepath = os.path.abspath(args.auth_storage_file)
+    mountpoint = os.path.abspath(args.mountpoint)
+
+    Conf.set('auth_cache_filepath', auth_storage_filepath)
+
+    # The mount only looks somewhere else if we were told to.
+    if args.opt:
+        for option in args.opt.split(','):
+            (k, _, v) = option.partition('=')
+            if k == 'discovery_document_filepath':
+                Conf.set(k, v)
+
+    document_filepath = get_document_filepath()
+    if os.path.exists(document_filepath):
+        os.remove(document_filepath)
+
+    cold_s = _time_mount(auth_storage_filepath, mountpoint, args.opt,
+                         args.timeout)
+
+    warm_s = _time_mount(auth_storage_filepath, mountpoint, args.opt,
+                         args.timeout)
+
+    print("Without a stored discovery document: (%.2f) seconds." % (cold_s,))
+    print("With a stored discovery document   : (%.2f) seconds." % (warm_s,))
+
+if __name__ == '__main__':
+    main()
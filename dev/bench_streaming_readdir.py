@@ -0,0 +1,171 @@
+#!/usr/bin/env python2.7
+
+"""Measure how long it takes for a reader of a cold directory to receive its
+first installment of entries (what the first getdents() returns to `ls`), and
+all of them, when the listing is collected up-front versus when it's streamed
+a page at a time. The kernel is modeled as taking a fixed number of entries 
+per readdir() and asking for the rest at the offset where it left off, as it 
+does with FUSE. This runs against a stand-in for Drive whose pages each take a
+fixed amount of time.
+"""
+
+import sys
+import os.path
+dev_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, dev_path)
+
+import argparse
+import time
+
+import gdrivefs.state
+import gdrivefs.cache.volume
+
+from gdrivefs.conf import Conf
+from gdrivefs.gdtool.normal_entry import NormalEntry
+from gdrivefs.gdfs.dir_listing import DirectoryListings
+
+_ROOT_ID = 'root'
+
+def _build_entry(entry_id, title, parent_id, is_directory=False):
+    raw = {
+        u'id': entry_id,
+        u'title': title,
+        u'mimeType': Conf.get('directory_mimetype') \
+                        if is_directory \
+                        else u'application/octet-stream',
+        u'labels': {},
+        u'lastModifyingUserName': u'bench',
+        u'writersCanShare': True,
+        u'ownerNames': [u'bench'],
+        u'editable': True,
+        u'userPermission': {},
+        u'modifiedDate': u'2014-01-01T00:00:00.000Z',
+        u'parents': [{ u'id': parent_id }] if parent_id else [],
+    }
+
+    if is_directory is False:
+        raw[u'fileSize'] = u'0'
+
+    return NormalEntry('bench', raw)
+
+
+class _FakeAccountInfo(object):
+    root_id = _ROOT_ID
+
+    @staticmethod
+    def get_instance():
+        return _FakeAccountInfo
+
+
+class _FakeDrive(object):
+    """Serves paged listings, slowly."""
+
+    def __init__(self, delay_s, num_files, page_size):
+        self.__delay_s = delay_s
+        self.__num_files = num_files
+        self.__page_size = page_size
+
+    def list_files_page(self, parent_id=None, page_token=None,
+                        max_results=None, **kwargs):
+        time.sleep(self.__delay_s)
+
+        start = int(page_token or 0)
+        stop = min(start + self.__page_size, self.__num_files)
+
+        entries = [_build_entry(('%s-%d' % (parent_id, i)),
+                                ('file_%d' % (i)),
+                                parent_id)
+                   for i
+                   in xrange(start, stop)]
+
+        next_page_token = str(stop) if stop < self.__num_files else None
+
+        return (entries, next_page_token)
+
+
+def _read(list_children, entry_id, per_buffer, per_entry_s):
+    """Read the directory in installments of `per_buffer` entries."""
+
+    listings = DirectoryListings()
+    path = '/' + entry_id
+
+    def build_items():
+        for (filename, entry) in list_children(entry_id):
+            yield (filename, None)
+
+    start_at = time.time()
+    first_at = None
+    offset = 0
+
+    while 1:
+        items = listings.produce(path, offset, build_items)
+        n = 0
+
+        for (filename, stat_result, item_offset) in items:
+            # The buffer is full. This one is produced again next time.
+            if n == per_buffer:
+                break
+
+            # Stand-in for building the stat() and filling the buffer.
+            stop_at = time.time() + per_entry_s
+            while time.time() < stop_at:
+                pass
+
+            offset = item_offset
+            n += 1
+
+        items.close()
+
+        if first_at is None:
+            first_at = time.time()
+
+        if n < per_buffer:
+            break
+
+    return (first_at - start_at, time.time() - start_at, offset)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=float, default=0.2,
+                        help="Seconds that each page takes.")
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--per-buffer', type=int, default=100,
+                        help="Entries that the kernel takes per readdir().")
+    parser.add_argument('--per-entry', type=float, default=0.00002,
+                        help="Seconds spent consuming each entry.")
+
+    args = parser.parse_args()
+
+    drive = _FakeDrive(args.delay, args.files, args.page_size)
+    gdrivefs.cache.volume.get_gdrive = lambda: drive
+    gdrivefs.cache.volume.AccountInfo = _FakeAccountInfo
+
+    pr = gdrivefs.cache.volume.PathRelations.get_instance()
+    pr.register_entry(_build_entry(_ROOT_ID, u'', None, True))
+    pr.register_entry(_build_entry('collected', u'collected', _ROOT_ID, True))
+    pr.register_entry(_build_entry('streamed', u'streamed', _ROOT_ID, True))
+
+    print("(%d) files in pages of (%d), each taking (%.2f) seconds." %
+          (args.files, args.page_size, args.delay))
+
+    try:
+        collected = _read(pr.get_children_entries_from_entry_id,
+                          'collected',
+                          args.per_buffer,
+                          args.per_entry)
+
+        streamed = _read(pr.iterate_children_entries_from_entry_id,
+                         'streamed',
+                         args.per_buffer,
+                         args.per_entry)
+    finally:
+        gdrivefs.state.GLOBAL_EXIT_EVENT.set()
+
+    for (name, (first_s, total_s, n)) in (('Collected', collected),
+                                          ('Streamed', streamed)):
+        print("%-9s: first installment after (%.2f) seconds, (%d) entries "
+              "after (%.2f) seconds." % (name, first_s, n, total_s))
+
+if __name__ == '__main__':
+    main()
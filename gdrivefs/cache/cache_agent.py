@@ -1,25 +1,205 @@
 import logging
 import threading
-import time
-import datetime
+import weakref
+import atexit
+import Queue
 
 #import gdrivefs.report
 
 import gdrivefs.state
 
 from gdrivefs.conf import Conf
+from gdrivefs.time_support import get_monotonic_time
 from gdrivefs.cache.cache_registry import CacheRegistry, CacheFault
+from gdrivefs.gdtool.rate_limiter import priority, PRIORITY_PREFETCH
+from gdrivefs.general.metrics import labels
 
 _logger = logging.getLogger(__name__)
 _logger.setLevel(logging.INFO)
 
 
+class _CleanupScheduler(object):
+    """Expires the entries of every cache-agent from a single thread. It 
+    sleeps until the earliest entry of any agent is due (but never longer than
+    the configured check-frequency), and then only visits what has expired.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__agents = weakref.WeakSet()
+
+        self.__t = None
+        self.__t_quit_ev = threading.Event()
+        self.__t_wake_ev = threading.Event()
+
+    def register(self, agent):
+        with self.__lock:
+            self.__agents.add(agent)
+
+            if self.__t is None:
+                _logger.info("Starting cache-cleanup thread.")
+
+                self.__t = threading.Thread(target=self.__cleanup)
+                self.__t.daemon = True
+                self.__t.start()
+
+    def unregister(self, agent):
+        with self.__lock:
+            self.__agents.discard(agent)
+
+    def wake(self):
+        """Do a pass now (e.g. because a cache is over its limits)."""
+
+        self.__t_wake_ev.set()
+
+    def __cleanup(self):
+        _logger.info("Cache-cleanup thread running.")
+
+        while self.__t_quit_ev.is_set() is False and \
+                  gdrivefs.state.GLOBAL_EXIT_EVENT.is_set() is False:
+            with self.__lock:
+                agents = list(self.__agents)
+
+            cleanup_interval_s = Conf.get('cache_cleanup_check_frequency_s')
+            wake_at = get_monotonic_time() + cleanup_interval_s
+
+            self.__t_wake_ev.clear()
+
+            for agent in agents:
+                try:
+                    next_expiry = agent.cleanup_expired()
+                    agent.evict_over_limit()
+                except:
+                    _logger.exception("Cache clean-up failed for resource "
+                                      "[%s].", agent.resource_name)
+                    continue
+
+                if next_expiry is not None and next_expiry < wake_at:
+                    wake_at = next_expiry
+
+            del agents
+
+            wait_s = wake_at - get_monotonic_time()
+            if wait_s > 0:
+                self.__t_wake_ev.wait(wait_s)
+
+        _logger.info("Cache-cleanup thread terminating.")
+
+    def stop(self):
+        _logger.info("Stopping cache-cleanup thread.")
+
+        self.__t_quit_ev.set()
+        self.__t_wake_ev.set()
+
+        with self.__lock:
+            t = self.__t
+
+        if t is not None:
+            t.join()
+
+_scheduler = _CleanupScheduler()
+
+# The clean-up thread is a daemon, so it won't keep the process alive, but it
+# calls into the agents (and the modules that they use), so stop it before the
+# interpreter starts tearing those down.
+atexit.register(_scheduler.stop)
+
+
+class _Refresher(object):
+    """Re-retrieves stale entries in the background, on a small pool of 
+    threads, with at most one refresh in progress for any given entry.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__q = Queue.Queue()
+        self.__in_flight = set()
+        self.__threads = []
+        self.__quit_ev = threading.Event()
+
+    def __start_workers(self):
+        num_workers = int(Conf.get('cache_refresh_workers'))
+
+        _logger.info("Starting (%d) cache-refresh threads.", num_workers)
+
+        for i in xrange(num_workers):
+            t = threading.Thread(target=self.__refresh)
+            t.daemon = True
+            t.start()
+
+            self.__threads.append(t)
+
+    def schedule(self, agent, key):
+        """Queue a refresh of the given entry. Return False if one is already
+        queued or running.
+        """
+
+        in_flight_key = (agent.resource_name, key)
+
+        with self.__lock:
+            if in_flight_key in self.__in_flight:
+                return False
+
+            self.__in_flight.add(in_flight_key)
+
+            if not self.__threads:
+                self.__start_workers()
+
+        self.__q.put((agent, key))
+        return True
+
+    def __refresh(self):
+        _logger.info("Cache-refresh thread running.")
+
+        while self.__quit_ev.is_set() is False and \
+                gdrivefs.state.GLOBAL_EXIT_EVENT.is_set() is False:
+            try:
+                (agent, key) = self.__q.get(timeout=1)
+            except Queue.Empty:
+                continue
+
+            try:
+                _logger.debug("Refreshing stale entry [%s] under resource "
+                              "[%s].", key, agent.resource_name)
+
+                # Nobody is waiting on this.
+                with priority(PRIORITY_PREFETCH), labels(op='refresh'):
+                    agent.fault_handler(agent.resource_name, key)
+            except:
+                _logger.exception("Could not refresh stale entry [%s] under "
+                                  "resource [%s].", key, agent.resource_name)
+            finally:
+                with self.__lock:
+                    self.__in_flight.discard((agent.resource_name, key))
+
+        _logger.info("Cache-refresh thread terminating.")
+
+    def stop(self):
+        self.__quit_ev.set()
+
+        with self.__lock:
+            threads = list(self.__threads)
+
+        for t in threads:
+            t.join()
+
+_refresher = _Refresher()
+
+# A refresh may be in the middle of calling the fault-handler. Let it finish
+# (the workers check for us every second) rather than have it fail part-way
+# through the interpreter's teardown.
+atexit.register(_refresher.stop)
+
+
 class CacheAgent(object):
     """A particular namespace within the cache."""
 
     registry        = None
     resource_name   = None
     max_age         = None
+    max_count       = None
+    max_bytes       = None
+    max_stale_age   = None
 
     fault_handler       = None
     cleanup_pretrigger  = None
@@ -28,7 +208,8 @@ class CacheAgent(object):
     report_source_name  = None
 
     def __init__(self, resource_name, max_age, fault_handler=None, 
-                 cleanup_pretrigger=None):
+                 cleanup_pretrigger=None, max_count=None, max_bytes=None, 
+                 max_stale_age=None, cleanup_lock=None):
         _logger.debug("CacheAgent(%s,%s,%s,%s)" % (resource_name, max_age, 
                                                    type(fault_handler), 
                                                    cleanup_pretrigger))
@@ -36,6 +217,26 @@ class CacheAgent(object):
         self.registry = CacheRegistry.get_instance(resource_name)
         self.resource_name = resource_name
         self.max_age = max_age
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+
+        # If given, an entry that is older than max_age but not older than 
+        # this is still returned, and is refreshed in the background.
+        self.max_stale_age = max_stale_age
+        self.__stale_hits = 0
+
+        # While something vouches for our entries (see extend_validity()), 
+        # they don't expire by age.
+        self.__valid_until = None
+        self.__lease_hits = 0
+
+        if max_count is not None or max_bytes is not None:
+            self.registry.set_limits(resource_name, max_count, max_bytes)
+
+        # If given, the lock that our entries are set under (see 
+        # CacheRegistry.set_cleanup_lock()).
+        if cleanup_lock is not None:
+            self.registry.set_cleanup_lock(resource_name, cleanup_lock)
 
         self.fault_handler = fault_handler
         self.cleanup_pretrigger = cleanup_pretrigger
@@ -43,13 +244,10 @@ class CacheAgent(object):
 #        self.report = Report.get_instance()
 #        self.report_source_name = ("cache-%s" % (self.resource_name))
 
-        self.__t = None
-        self.__t_quit_ev = threading.Event()
-
-        self.__start_cleanup()
+        _scheduler.register(self)
 
     def __del__(self):
-        self.__stop_cleanup()
+        _scheduler.unregister(self)
 
 # TODO(dustin): Currently disabled. The system doesn't rely on it, and it's 
 #               just another thread that unnecessarily runs, and trips up our 
@@ -79,66 +277,105 @@ class CacheAgent(object):
 #
 #        Timers.get_instance().register_timer('status', status_timer)
 
-    def __cleanup(self):
-        """Scan the current cache and determine items old-enough to be 
-        removed.
+    @property
+    def expire_age(self):
+        """The age past which an entry is no longer used at all."""
+
+        if self.max_stale_age is not None:
+            return self.max_stale_age
+
+        return self.max_age
+
+    def extend_validity(self, lease_s):
+        """Declare that our entries are known to be current (e.g. because 
+        every change is being applied to them as it happens), and that they 
+        shouldn't expire by age for the next `lease_s` seconds. Age-based 
+        expiry resumes if this isn't called again before then.
         """
 
-        cleanup_interval_s = Conf.get('cache_cleanup_check_frequency_s')
+        self.__valid_until = get_monotonic_time() + lease_s
 
-        _logger.info("Cache-cleanup thread running: %s", self)
+    def revoke_validity(self):
+        """Resume age-based expiry immediately."""
 
-        while self.__t_quit_ev.is_set() is False and \
-                  gdrivefs.state.GLOBAL_EXIT_EVENT.is_set() is False:
-            _logger.debug("Doing clean-up for cache resource with name [%s]." % 
-                          (self.resource_name))
+        if self.__valid_until is None:
+            return
 
-            cache_dict = self.registry.list_raw(self.resource_name)
+        _logger.info("Validity of cache resource [%s] revoked.", 
+                     self.resource_name)
 
-            total_keys = [ (key, value_tuple[1]) for key, value_tuple \
-                                in cache_dict.iteritems() ]
+        self.__valid_until = None
+        _scheduler.wake()
 
-            cleanup_keys = [ key for key, value_tuple \
-                                in cache_dict.iteritems() \
-                                if (datetime.datetime.now() - value_tuple[1]).seconds > \
-                                        self.max_age ]
+    def __is_valid_by_lease(self):
+        valid_until = self.__valid_until
+        return valid_until is not None and get_monotonic_time() < valid_until
 
-            _logger.debug("Found (%d) entries to clean-up from entry-cache." % 
-                          (len(cleanup_keys)))
+    def cleanup_expired(self):
+        """Remove the entries that have expired. Return the (monotonic) time 
+        at which the next one will, or None if we're empty.
+        """
 
-            if cleanup_keys:
-                for key in cleanup_keys:
-                    _logger.debug("Cache entry [%s] under resource-name [%s] "
-                                  "will be cleaned-up." % 
-                                  (key, self.resource_name))
+        expire_age = self.expire_age
+        if expire_age is None:
+            return None
 
-                    if self.exists(key, no_fault_check=True) == False:
-                        _logger.debug("Entry with ID [%s] has already been "
-                                      "cleaned-up." % (key))
-                    else:
-                        self.remove(key)
-            else:
-                _logger.debug("No cache-cleanup required.")
-                time.sleep(cleanup_interval_s)
+        # Nothing expires until the lease runs out.
+        if self.__is_valid_by_lease() is True:
+            return self.__valid_until
 
-        _logger.info("Cache-cleanup thread terminating: %s", self)
+        _logger.debug("Doing clean-up for cache resource with name [%s]." % 
+                      (self.resource_name))
 
-    def __start_cleanup(self):
-        _logger.info("Starting cache-cleanup thread: %s", self)
+        while 1:
+            removed = self.registry.cleanup_expired(
+                        self.resource_name, 
+                        expire_age, 
+                        cleanup_pretrigger=self.cleanup_pretrigger)
 
-        self.__t = threading.Thread(target=self.__cleanup)
-        self.__t.start()
+            if removed == 0:
+                break
 
-    def __stop_cleanup(self):
-        _logger.info("Stopping cache-cleanup thread: %s", self)
+            _logger.debug("(%d) entries cleaned-up from resource [%s].", 
+                          removed, self.resource_name)
 
-        self.__t_quit_ev.set()
-        self.__t.join()
+        return self.registry.get_next_expiry(self.resource_name, expire_age)
+
+    def evict_over_limit(self):
+        """Evict the least-recently-used entries until we're within our 
+        limits.
+        """
+
+        while self.registry.evict_over_limit(
+                self.resource_name, 
+                cleanup_pretrigger=self.cleanup_pretrigger) > 0:
+            pass
+
+    def touch(self, keys):
+        """Mark the given entries as recently used."""
+
+        self.registry.touch(self.resource_name, keys)
+
+    def get_stats(self):
+        stats = self.registry.get_stats(self.resource_name)
+        stats['stale_hits'] = self.__stale_hits
+        stats['lease_hits'] = self.__lease_hits
+        stats['lease_valid'] = self.__is_valid_by_lease()
+
+        return stats
 
     def set(self, key, value):
         _logger.debug("CacheAgent.set(%s,%s)" % (key, value))
 
-        return self.registry.set(self.resource_name, key, value)
+        old_tuple = self.registry.set(self.resource_name, key, value)
+
+        # Evictions happen on the clean-up thread, since the pre-cleanup 
+        # trigger can't safely run while the caller is in the middle of 
+        # registering something.
+        if self.registry.is_over_limit(self.resource_name) is True:
+            _scheduler.wake()
+
+        return old_tuple
 
     def remove(self, key):
         _logger.debug("CacheAgent.remove(%s)" % (key))
@@ -154,11 +391,16 @@ class CacheAgent(object):
 
         _logger.debug("CacheAgent.get(%s)" % (key))
 
+        is_valid_by_lease = self.__is_valid_by_lease()
+
         try:
-            result = self.registry.get(self.resource_name, 
-                                       key, 
-                                       max_age=self.max_age, 
-                                       cleanup_pretrigger=self.cleanup_pretrigger)
+            (result, age) = self.registry.get_aged(
+                                self.resource_name, 
+                                key, 
+                                max_age=(None 
+                                         if is_valid_by_lease is True 
+                                         else self.expire_age), 
+                                cleanup_pretrigger=self.cleanup_pretrigger)
         except CacheFault:
             _logger.debug("There was a cache-miss while requesting item with "
                           "ID (key).")
@@ -169,14 +411,35 @@ class CacheAgent(object):
             result = self.fault_handler(self.resource_name, key)
             if result is None:
                 raise
+        else:
+            # An entry older than max_age is only returned if the lease vouches
+            # for it, or if we're allowed to return stale entries (in which 
+            # case we have it refreshed).
+            if self.max_age is not None and age > self.max_age:
+                if is_valid_by_lease is True:
+                    # This would've otherwise been retrieved again.
+                    self.__lease_hits += 1
+                else:
+                    _logger.debug("Returning stale entry [%s] under resource "
+                                  "[%s] (%.1f seconds old).", 
+                                  key, self.resource_name, age)
+
+                    self.__stale_hits += 1
+
+                    if self.fault_handler is not None and handle_fault:
+                        _refresher.schedule(self, key)
 
         return result
 
     def exists(self, key, no_fault_check=False):
         _logger.debug("CacheAgent.exists(%s)" % (key))
 
+        max_age = None \
+                    if self.__is_valid_by_lease() is True \
+                    else self.expire_age
+
         return self.registry.exists(self.resource_name, key, 
-                                    max_age=self.max_age,
+                                    max_age=max_age,
                                     cleanup_pretrigger=self.cleanup_pretrigger,
                                     no_fault_check=no_fault_check)
 
@@ -1,7 +1,12 @@
 import logging
+import heapq
+import sys
+import contextlib
 
 from threading import RLock
-from datetime import datetime
+from collections import OrderedDict
+
+from gdrivefs.time_support import get_monotonic_time
 
 _logger = logging.getLogger(__name__)
 _logger.setLevel(logging.INFO)
@@ -11,6 +16,69 @@ class CacheFault(Exception):
     pass
 
 
+def get_approximate_size(value):
+    """Return roughly how many bytes the given value and everything that it
+    references take. Shared objects are only counted once.
+    """
+
+    seen = set()
+    to_visit = [value]
+    size = 0
+
+    while to_visit:
+        o = to_visit.pop()
+        if id(o) in seen:
+            continue
+
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            to_visit.extend(o.iterkeys())
+            to_visit.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            to_visit.extend(o)
+        elif hasattr(o, '__dict__'):
+            to_visit.append(o.__dict__)
+
+    return size
+
+
+class _Resource(object):
+    """The entries and bookkeeping for one namespace."""
+
+    def __init__(self):
+        # key => (value, timestamp), least-recently used first.
+        self.entries = OrderedDict()
+
+        # A min-heap of (timestamp, key). Since every entry in a resource has
+        # the same maximum age, the entry that was set earliest is the next to
+        # expire. Entries that have since been reset or removed are left in
+        # place and skipped when they surface.
+        self.expiries = []
+
+        # Limits (None if unlimited). Sizes are only tracked if there's a byte
+        # limit.
+        self.max_count = None
+        self.max_bytes = None
+        self.sizes = {}
+        self.total_bytes = 0
+
+        # If given, the lock that is held while entries are set, and which is
+        # held while an entry is removed.
+        self.cleanup_lock = None
+
+        self.expirations = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def is_over_limit(self):
+        return (self.max_count is not None and \
+                    len(self.entries) > self.max_count) or \
+               (self.max_bytes is not None and \
+                    self.total_bytes > self.max_bytes)
+
+
 class CacheRegistry(object):
     """The main cache container."""
 
@@ -21,7 +89,7 @@ class CacheRegistry(object):
 
     @staticmethod
     def get_instance(resource_name):
-    
+
         with CacheRegistry.__rlock:
             try:
                 CacheRegistry.__instance;
@@ -29,22 +97,75 @@ class CacheRegistry(object):
                 CacheRegistry.__instance = CacheRegistry()
 
             if resource_name not in CacheRegistry.__instance.__cache:
-                CacheRegistry.__instance.__cache[resource_name] = { }
+                CacheRegistry.__instance.__cache[resource_name] = _Resource()
 
         return CacheRegistry.__instance
 
+    def set_limits(self, resource_name, max_count=None, max_bytes=None):
+        """Bound how many entries, and approximately how many bytes, the given
+        resource can hold. Once exceeded, the least-recently-used entries are
+        evicted by evict_over_limit().
+        """
+
+        _logger.info("Cache resource [%s] limited to (%s) entries and (%s) "
+                     "bytes.", resource_name, max_count, max_bytes)
+
+        with CacheRegistry.__rlock:
+            resource = self.__cache[resource_name]
+
+            if max_bytes is not None and resource.max_bytes is None:
+                for (key, (value, timestamp)) in resource.entries.iteritems():
+                    size = get_approximate_size(value)
+                    resource.sizes[key] = size
+                    resource.total_bytes += size
+            elif max_bytes is None:
+                resource.sizes.clear()
+                resource.total_bytes = 0
+
+            resource.max_count = max_count
+            resource.max_bytes = max_bytes
+
+    def set_cleanup_lock(self, resource_name, lock):
+        """Have removals from the given resource hold `lock`, which whoever
+        sets its entries (and keeps track of them elsewhere) holds while doing
+        so. It's taken before our own lock, and is held while the pre-cleanup
+        trigger runs, so that an entry can't be set again between our
+        deciding to remove it and its removal.
+        """
+
+        with CacheRegistry.__rlock:
+            self.__cache[resource_name].cleanup_lock = lock
+
     def set(self, resource_name, key, value):
 
         _logger.debug("CacheRegistry.set(%s,%s,%s)" % 
                       (resource_name, key, value))
 
+        # Measure before we take the lock.
+        size = get_approximate_size(value) \
+                if self.__cache[resource_name].max_bytes is not None \
+                else None
+
         with CacheRegistry.__rlock:
-            try:
-                old_tuple = self.__cache[resource_name][key]
-            except:
-                old_tuple = None
+            resource = self.__cache[resource_name]
 
-            self.__cache[resource_name][key] = (value, datetime.now())
+            old_tuple = resource.entries.pop(key, None)
+
+            timestamp = get_monotonic_time()
+            resource.entries[key] = (value, timestamp)
+
+            if resource.max_bytes is not None:
+                if size is None:
+                    size = get_approximate_size(value)
+
+                resource.total_bytes += size - resource.sizes.get(key, 0)
+                resource.sizes[key] = size
+
+            heapq.heappush(resource.expiries, (timestamp, key))
+
+            # Don't let the superseded records accumulate.
+            if len(resource.expiries) > 2 * len(resource.entries) + 100:
+                self.__compact(resource)
 
         return old_tuple
 
@@ -54,18 +175,15 @@ class CacheRegistry(object):
                       (resource_name, key, type(cleanup_pretrigger)))
 
         with CacheRegistry.__rlock:
-            try:
-                old_tuple = self.__cache[resource_name][key]
-            except:
-                raise
+            (value, timestamp) = self.__cache[resource_name].entries[key]
 
-            self.__cleanup_entry(resource_name, key, True, 
-                                 cleanup_pretrigger=cleanup_pretrigger)
+        self.__remove_if_unchanged(resource_name, key, timestamp, True, 
+                                   cleanup_pretrigger)
 
-        return old_tuple[0]
+        return value
 
     def get(self, resource_name, key, max_age, cleanup_pretrigger=None):
-        
+
         trigger_given_phrase = ('None' 
                                 if cleanup_pretrigger == None 
                                 else '<given>')
@@ -73,61 +191,293 @@ class CacheRegistry(object):
         _logger.debug("CacheRegistry.get(%s,%s,%s,%s)" % 
                       (resource_name, key, max_age, trigger_given_phrase))
 
+        (value, age) = self.__get(resource_name, key, max_age, 
+                                  cleanup_pretrigger)
+
+        return value
+
+    def get_aged(self, resource_name, key, max_age, cleanup_pretrigger=None):
+        """The same as get(), but return a 2-tuple of the value and how many 
+        seconds ago it was set.
+        """
+
+        _logger.debug("CacheRegistry.get_aged(%s,%s,%s)" % 
+                      (resource_name, key, max_age))
+
+        return self.__get(resource_name, key, max_age, cleanup_pretrigger)
+
+    def __get(self, resource_name, key, max_age, cleanup_pretrigger):
         with CacheRegistry.__rlock:
+            resource = self.__cache[resource_name]
+
             try:
-                (value, timestamp) = self.__cache[resource_name][key]
+                (value, timestamp) = resource.entries[key]
             except:
                 raise CacheFault("NonExist")
 
-            if max_age != None and \
-               (datetime.now() - timestamp).seconds > max_age:
-                self.__cleanup_entry(resource_name, key, False, 
-                                     cleanup_pretrigger=cleanup_pretrigger)
-                raise CacheFault("Stale")
+            age = get_monotonic_time() - timestamp
 
-        return value
+            is_stale = max_age != None and age > max_age
+            if is_stale is False:
+                self.__mark_used(resource, key)
+
+        # The pre-cleanup trigger runs without our lock.
+        if is_stale is True:
+            self.__remove_if_unchanged(resource_name, key, timestamp, False, 
+                                       cleanup_pretrigger)
+
+            raise CacheFault("Stale")
+
+        return (value, age)
+
+    def touch(self, resource_name, keys):
+        """Mark the given entries as recently used, so that they're the last to
+        be evicted. Unknown keys are ignored.
+        """
+
+        resource = self.__cache[resource_name]
+        if resource.max_count is None and resource.max_bytes is None:
+            return
+
+        with CacheRegistry.__rlock:
+            for key in keys:
+                if key in resource.entries:
+                    self.__mark_used(resource, key)
+
+    def __mark_used(self, resource, key):
+        if resource.max_count is None and resource.max_bytes is None:
+            return
+
+        resource.entries[key] = resource.entries.pop(key)
 
     def list_raw(self, resource_name):
-        
+
         _logger.debug("CacheRegistry.list(%s)" % (resource_name))
 
         with CacheRegistry.__rlock:
-            return self.__cache[resource_name]
+            return dict(self.__cache[resource_name].entries)
 
     def exists(self, resource_name, key, max_age, cleanup_pretrigger=None, 
                no_fault_check=False):
 
         _logger.debug("CacheRegistry.exists(%s,%s,%s,%s)" % 
                       (resource_name, key, max_age, cleanup_pretrigger))
-        
+
         with CacheRegistry.__rlock:
             try:
-                (value, timestamp) = self.__cache[resource_name][key]
+                (value, timestamp) = self.__cache[resource_name].entries[key]
             except:
                 return False
 
-            if max_age is not None and not no_fault_check and \
-                    (datetime.now() - timestamp).seconds > max_age:
-                self.__cleanup_entry(resource_name, key, False, 
-                                     cleanup_pretrigger=cleanup_pretrigger)
-                return False
+            is_stale = max_age is not None and not no_fault_check and \
+                       get_monotonic_time() - timestamp > max_age
+
+        # The pre-cleanup trigger runs without our lock.
+        if is_stale is True:
+            self.__remove_if_unchanged(resource_name, key, timestamp, False, 
+                                       cleanup_pretrigger)
+            return False
 
         return True
 
     def count(self, resource_name):
 
-        return len(self.__cache[resource_name])
+        with CacheRegistry.__rlock:
+            return len(self.__cache[resource_name].entries)
+
+    def is_over_limit(self, resource_name):
+        return self.__cache[resource_name].is_over_limit()
+
+    def get_stats(self, resource_name):
+
+        with CacheRegistry.__rlock:
+            resource = self.__cache[resource_name]
+
+            return { 'entries': len(resource.entries),
+                     'bytes': resource.total_bytes,
+                     'max_entries': resource.max_count,
+                     'max_bytes': resource.max_bytes,
+                     'expirations': resource.expirations,
+                     'evictions': resource.evictions,
+                     'evicted_bytes': resource.evicted_bytes }
+
+    def __compact(self, resource):
+        expiries = [(timestamp, key) 
+                    for (key, (value, timestamp)) 
+                    in resource.entries.iteritems()]
+
+        heapq.heapify(expiries)
+        resource.expiries = expiries
+
+    def get_next_expiry(self, resource_name, max_age):
+        """Return the (monotonic) time at which the oldest entry will expire, 
+        or None if there are no entries. This may be early, but never late.
+        """
+
+        with CacheRegistry.__rlock:
+            expiries = self.__cache[resource_name].expiries
+            if not expiries:
+                return None
+
+            return expiries[0][0] + max_age
+
+    def __pop_expired(self, resource, max_age, limit):
+        now = get_monotonic_time()
+        expiries = resource.expiries
+        expired = []
+
+        while expiries and len(expired) < limit and \
+              now - expiries[0][0] > max_age:
+            (timestamp, key) = heapq.heappop(expiries)
+
+            try:
+                current_timestamp = resource.entries[key][1]
+            except KeyError:
+                continue
+
+            if current_timestamp == timestamp:
+                expired.append((key, timestamp))
+
+        return expired
+
+    def __select_evictions(self, resource, limit):
+        count = len(resource.entries)
+        total_bytes = resource.total_bytes
+        selected = []
+
+        for (key, (value, timestamp)) in resource.entries.iteritems():
+            if len(selected) >= limit or \
+               ((resource.max_count is None or count <= resource.max_count) and \
+                (resource.max_bytes is None or \
+                    total_bytes <= resource.max_bytes)):
+                break
+
+            selected.append((key, timestamp))
+
+            count -= 1
+            total_bytes -= resource.sizes.get(key, 0)
+
+        return selected
+
+    @contextlib.contextmanager
+    def __hold_cleanup_lock(self, resource):
+        if resource.cleanup_lock is None:
+            yield
+            return
+
+        with resource.cleanup_lock:
+            yield
 
-    def __cleanup_entry(self, resource_name, key, force, 
-                        cleanup_pretrigger=None):
+    def __remove_if_unchanged(self, resource_name, key, timestamp, force, 
+                              cleanup_pretrigger):
+        """Remove the entry, unless it has been set again since `timestamp`.
+        Return the size that it was recorded as, or None if it wasn't removed.
+
+        The pre-cleanup trigger is invoked without the registry lock held,
+        since it usually needs to take other locks.
+        """
+
+        resource = self.__cache[resource_name]
+
+        with self.__hold_cleanup_lock(resource):
+            with CacheRegistry.__rlock:
+                try:
+                    current_timestamp = resource.entries[key][1]
+                except KeyError:
+                    return None
+
+                if current_timestamp != timestamp:
+                    return None
+
+            if cleanup_pretrigger is not None:
+                _logger.debug("Running pre-cleanup trigger for resource_name "
+                              "[%s] and key [%s]." % (resource_name, key))
+
+                cleanup_pretrigger(resource_name, key, force)
+
+            with CacheRegistry.__rlock:
+                try:
+                    current_timestamp = resource.entries[key][1]
+                except KeyError:
+                    return None
+
+                # Without a cleanup-lock, it may have been set again while the
+                # trigger ran.
+                if current_timestamp != timestamp:
+                    return None
+
+                size = resource.sizes.get(key, 0)
+                self.__delete(resource, key)
+
+                return size
+
+    def __remove_selected(self, resource_name, selected, cleanup_pretrigger):
+        """Remove each of the given (key, timestamp) pairs, as long as the
+        entry hasn't been set again in the meantime. Return the number of
+        entries and bytes removed.
+        """
+
+        removed = 0
+        removed_bytes = 0
+        for (key, timestamp) in selected:
+            size = self.__remove_if_unchanged(resource_name, key, timestamp, 
+                                              False, cleanup_pretrigger)
+
+            if size is not None:
+                removed_bytes += size
+                removed += 1
+
+        return (removed, removed_bytes)
+
+    def cleanup_expired(self, resource_name, max_age, cleanup_pretrigger=None, 
+                        limit=1000):
+        """Remove up to `limit` entries that are older than `max_age`, and 
+        return how many were removed. The cost is proportional to the number of
+        entries that have expired rather than the number of entries. An entry
+        that is set again in the meantime is kept.
+        """
+
+        with CacheRegistry.__rlock:
+            resource = self.__cache[resource_name]
+            expired = self.__pop_expired(resource, max_age, limit)
+
+        (removed, removed_bytes) = self.__remove_selected(resource_name,
+                                                          expired,
+                                                          cleanup_pretrigger)
+
+        with CacheRegistry.__rlock:
+            resource.expirations += removed
+
+        return removed
+
+    def evict_over_limit(self, resource_name, cleanup_pretrigger=None,
+                         limit=1000):
+        """Remove up to `limit` of the least-recently-used entries while the
+        resource is over its limits, and return how many were removed.
+        """
+
+        with CacheRegistry.__rlock:
+            resource = self.__cache[resource_name]
+            selected = self.__select_evictions(resource, limit)
+
+        (removed, removed_bytes) = self.__remove_selected(resource_name,
+                                                          selected,
+                                                          cleanup_pretrigger)
+
+        with CacheRegistry.__rlock:
+            resource.evictions += removed
+            resource.evicted_bytes += removed_bytes
 
-        _logger.debug("Doing clean-up for resource_name [%s] and key "
-                      "[%s]." % (resource_name, key))
+        if removed > 0:
+            _logger.debug("(%d) entries, (%d) bytes, evicted from resource "
+                          "[%s].", removed, removed_bytes, resource_name)
 
-        if cleanup_pretrigger is not None:
-            _logger.debug("Running pre-cleanup trigger for resource_name "
-                          "[%s] and key [%s]." % (resource_name, key))
+        return removed
 
-            cleanup_pretrigger(resource_name, key, force)
+    def __delete(self, resource, key):
+        # The pre-cleanup trigger may have already removed it.
+        resource.entries.pop(key, None)
 
-        del self.__cache[resource_name][key]
+        size = resource.sizes.pop(key, None)
+        if size is not None:
+            resource.total_bytes -= size
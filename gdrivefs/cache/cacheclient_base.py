@@ -29,7 +29,12 @@ class CacheClientBase(object):
 
         self.__cache = CacheAgent(self.child_type, self.max_age, 
                                  fault_handler=self.fault_handler, 
-                                 cleanup_pretrigger=self.cleanup_pretrigger)
+                                 cleanup_pretrigger=self.cleanup_pretrigger,
+                                 max_count=self.get_max_cache_count(),
+                                 max_bytes=self.get_max_cache_bytes(),
+                                 max_stale_age=\
+                                    self.get_max_cache_stale_age_seconds(),
+                                 cleanup_lock=self.get_cleanup_lock())
 
         return self.__cache
 
@@ -60,6 +65,34 @@ class CacheClientBase(object):
         raise NotImplementedError("get_max_cache_age() must be implemented in "
                                   "the CacheClientBase child.")
 
+    def get_max_cache_count(self):
+        """Return the most entries to keep, or None for no limit."""
+
+        return None
+
+    def get_max_cache_bytes(self):
+        """Return approximately how many bytes of entries to keep, or None for
+        no limit.
+        """
+
+        return None
+
+    def get_max_cache_stale_age_seconds(self):
+        """Return the age up to which an expired entry may still be returned 
+        (while it's refreshed in the background), or None to never return 
+        expired entries.
+        """
+
+        return None
+
+    def get_cleanup_lock(self):
+        """Return the lock that entries are always set under, if any. Entries
+        are removed under it, too, so that the pre-cleanup trigger never 
+        removes one that was set again in the meantime.
+        """
+
+        return None
+
     @classmethod
     def get_instance(cls):
         """A helper method to dispense a singleton of whomever is inheriting "
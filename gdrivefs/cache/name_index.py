@@ -0,0 +1,191 @@
+import logging
+import re
+import heapq
+
+from collections import OrderedDict
+
+_logger = logging.getLogger(__name__)
+
+# The most duplicates of a single name that we'll allow in one directory. The
+# first is the bare name, and the rest are "name (1)" through "name (255)".
+MAX_DUPLICATE_SUFFIX = 255
+
+_SUFFIX_RX = re.compile(r'^(.*) \(([0-9]+)\)$')
+
+
+class _SuffixAllocator(object):
+    """Tracks which "name (N)" variations of one base-name have been handed
+    out, so that the lowest free variation can be found without probing every
+    sibling.
+    """
+
+    def __init__(self):
+        # The lowest suffix that has never been handed out.
+        self.next_suffix = 1
+
+        # Suffixes below next_suffix that have since been released. This may
+        # contain stale values (since-reused suffixes), which are discarded as
+        # they're popped.
+        self.released = []
+
+        # How many names are currently allocated against this base.
+        self.count = 0
+
+
+class NameIndex(object):
+    """Maintains the children of one directory, keyed by the unique filename
+    that we present for each of them. This is what a clause's CLAUSE_CHILDREN
+    slot holds.
+
+    Google Drive allows siblings to share a name. We disambiguate by electing
+    the first free variation among "name", "name (1)", "name (2)", ..., and
+    that rule is preserved here. Lookup, insert, and remove are all (amortized)
+    constant-time.
+
+    Iterating produces (filename, clause) 2-tuples, in the order that they
+    were added.
+    """
+
+    def __init__(self, format_suffix=None):
+        if format_suffix is None:
+            format_suffix = lambda i: (' (%d)' % (i))
+
+        self.__format_suffix = format_suffix
+
+        # filename => clause, in the order that the children were added.
+        self.__by_name = OrderedDict()
+
+        # entry-ID => (filename, base filename, suffix)
+        self.__by_id = {}
+
+        # base filename => _SuffixAllocator
+        self.__allocators = {}
+
+    def __len__(self):
+        return len(self.__by_name)
+
+    def __nonzero__(self):
+        return bool(self.__by_name)
+
+    def __iter__(self):
+        return iter(self.__by_name.items())
+
+    def __contains__(self, filename):
+        return filename in self.__by_name
+
+    def __repr__(self):
+        return ("<NAME-INDEX CHILDREN= (%d) BASES= (%d)>" %
+                (len(self.__by_name), len(self.__allocators)))
+
+    def get(self, filename, default=None):
+        """Return the clause registered under the given (disambiguated)
+        filename.
+        """
+
+        return self.__by_name.get(filename, default)
+
+    def get_name(self, entry_id):
+        """Return the filename that the given child was registered under, or
+        None.
+        """
+
+        try:
+            return self.__by_id[entry_id][0]
+        except KeyError:
+            return None
+
+    def has_id(self, entry_id):
+        return entry_id in self.__by_id
+
+    def clauses(self):
+        return [clause for (filename, clause) in self]
+
+    def add(self, filename_base, clause):
+        """Register the given clause under the first free variation of the
+        given name, and return that variation. Return None if there are too
+        many duplicates. The clause's entry-ID (item 3) identifies it.
+        """
+
+        entry_id = clause[3]
+
+        # A child is only listed once under a given parent.
+        existing = self.__by_id.get(entry_id)
+        if existing is not None:
+            return existing[0]
+
+        if filename_base not in self.__by_name:
+            filename = filename_base
+            suffix = 0
+        else:
+            allocator = self.__allocators.get(filename_base)
+            if allocator is None:
+                allocator = _SuffixAllocator()
+                self.__allocators[filename_base] = allocator
+
+            suffix = self.__elect_suffix(filename_base, allocator)
+            if suffix is None:
+                return None
+
+            filename = filename_base + self.__format_suffix(suffix)
+
+        self.__by_name[filename] = clause
+        self.__by_id[entry_id] = (filename, filename_base, suffix)
+
+        if suffix > 0:
+            self.__allocators[filename_base].count += 1
+
+        return filename
+
+    def __elect_suffix(self, filename_base, allocator):
+        # Reuse the lowest suffix that has been released, as long as it wasn't
+        # since taken by an entry whose actual title looks like a variation.
+
+        while allocator.released:
+            suffix = heapq.heappop(allocator.released)
+            candidate = filename_base + self.__format_suffix(suffix)
+            if candidate not in self.__by_name:
+                return suffix
+
+        while allocator.next_suffix <= MAX_DUPLICATE_SUFFIX:
+            suffix = allocator.next_suffix
+            allocator.next_suffix += 1
+
+            candidate = filename_base + self.__format_suffix(suffix)
+            if candidate not in self.__by_name:
+                return suffix
+
+        return None
+
+    def remove(self, entry_id):
+        """Remove the given child. Return the filename that it was registered
+        under, or None if it wasn't a child.
+        """
+
+        try:
+            (filename, filename_base, suffix) = self.__by_id.pop(entry_id)
+        except KeyError:
+            return None
+
+        del self.__by_name[filename]
+
+        if suffix > 0:
+            allocator = self.__allocators[filename_base]
+            allocator.count -= 1
+            heapq.heappush(allocator.released, suffix)
+
+            if allocator.count == 0:
+                del self.__allocators[filename_base]
+        else:
+            # If the entry's real title happened to look like a variation of
+            # another name, that variation is available again.
+
+            m = _SUFFIX_RX.match(filename)
+            if m is not None:
+                (other_base, other_suffix) = m.groups()
+                other_allocator = self.__allocators.get(other_base)
+                if other_allocator is not None and \
+                   int(other_suffix) < other_allocator.next_suffix:
+                    heapq.heappush(other_allocator.released,
+                                   int(other_suffix))
+
+        return filename
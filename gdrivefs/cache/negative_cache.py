@@ -0,0 +1,111 @@
+import logging
+import threading
+
+from collections import OrderedDict
+
+from gdrivefs.time_support import get_monotonic_time
+
+_logger = logging.getLogger(__name__)
+
+
+class NegativeLookupCache(object):
+    """Remembers, for a limited time, that a name was looked-up under a parent
+    and didn't exist, so that repeated probes for the same missing name don't
+    each cost a trip to the server. The oldest records are dropped once we
+    reach the maximum size.
+    """
+
+    def __init__(self, max_entries, ttl_s):
+        self.__max_entries = max_entries
+        self.__ttl_s = ttl_s
+
+        self.__lock = threading.Lock()
+
+        # (parent-ID, name) => expiry time, oldest first.
+        self.__expiries = OrderedDict()
+
+        # parent-ID => set of names
+        self.__by_parent = {}
+
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self):
+        return len(self.__expiries)
+
+    def __remove(self, key):
+        del self.__expiries[key]
+        self.__unindex(key)
+
+    def __unindex(self, key):
+        (parent_id, name) = key
+        names = self.__by_parent[parent_id]
+        names.discard(name)
+
+        if not names:
+            del self.__by_parent[parent_id]
+
+    def add(self, parent_id, name):
+        key = (parent_id, name)
+
+        with self.__lock:
+            if key in self.__expiries:
+                self.__remove(key)
+
+            while len(self.__expiries) >= self.__max_entries:
+                (oldest_key, _) = self.__expiries.popitem(last=False)
+                self.__unindex(oldest_key)
+
+            self.__expiries[key] = get_monotonic_time() + self.__ttl_s
+
+            try:
+                self.__by_parent[parent_id].add(name)
+            except KeyError:
+                self.__by_parent[parent_id] = set([name])
+
+    def contains(self, parent_id, name):
+        """Return True if the name is known not to exist under the parent."""
+
+        key = (parent_id, name)
+
+        with self.__lock:
+            try:
+                expires_at = self.__expiries[key]
+            except KeyError:
+                self.__misses += 1
+                return False
+
+            if get_monotonic_time() >= expires_at:
+                self.__remove(key)
+                self.__misses += 1
+                return False
+
+            self.__hits += 1
+            return True
+
+    def invalidate(self, parent_id, name):
+        key = (parent_id, name)
+
+        with self.__lock:
+            if key in self.__expiries:
+                self.__remove(key)
+
+    def invalidate_parent(self, parent_id):
+        with self.__lock:
+            names = self.__by_parent.pop(parent_id, None)
+            if names is None:
+                return
+
+            for name in names:
+                del self.__expiries[(parent_id, name)]
+
+    def clear(self):
+        with self.__lock:
+            self.__expiries.clear()
+            self.__by_parent.clear()
+
+    def get_stats(self):
+        with self.__lock:
+            return { 'entries': len(self.__expiries),
+                     'hits': self.__hits,
+                     'misses': self.__misses }
@@ -0,0 +1,225 @@
+import logging
+import threading
+import atexit
+
+from collections import deque, OrderedDict
+
+import gdrivefs.state
+
+from gdrivefs.conf import Conf
+from gdrivefs.cache.volume import PathRelations
+from gdrivefs.general.demand_gate import get_demand_gate
+from gdrivefs.gdtool.rate_limiter import priority, PRIORITY_PREFETCH
+from gdrivefs.general.metrics import labels
+
+_logger = logging.getLogger(__name__)
+
+# How many processes' walks we'll keep track of.
+_MAX_TRACKED_WALKS = 1000
+
+def _is_within(path, parent_path):
+    return path == parent_path or \
+           path.startswith(parent_path.rstrip('/') + '/')
+
+
+class _DirectoryPrefetcher(object):
+    """Lists the subdirectories of the directories that are being read, on a
+    small pool of threads, so that a tree-walk (find, rsync, du) finds them
+    already loaded when it gets to them.
+
+    We keep track of where each process is in its walk (the last directory
+    that it read). Queued directories are dropped once their process moves
+    outside of the directory that they were found in. The most recently found
+    directories are prefetched first, since a depth-first walk will get to
+    them next, and nothing is started while somebody is waiting on the server.
+    """
+
+    def __init__(self, max_depth, num_workers, max_queued):
+        self.__max_depth = max_depth
+        self.__num_workers = num_workers
+        self.__max_queued = max_queued
+
+        self.__cond = threading.Condition()
+
+        # (pid, origin path, path, entry-ID, depth), most recent first.
+        self.__q = deque()
+
+        # pid => the path that was most recently read.
+        self.__walks = OrderedDict()
+
+        self.__threads = []
+        self.__quit_ev = threading.Event()
+
+        self.__stats = { 'queued': 0,
+                         'prefetched': 0,
+                         'skipped': 0,
+                         'cancelled': 0,
+                         'dropped': 0,
+                         'failed': 0 }
+
+    def __start_workers(self):
+        _logger.info("Starting (%d) directory-prefetch threads.",
+                     self.__num_workers)
+
+        for i in xrange(self.__num_workers):
+            t = threading.Thread(target=self.__prefetch)
+            t.daemon = True
+            t.start()
+
+            self.__threads.append(t)
+
+    def __queue(self, pid, origin_path, path, subdirectories, depth):
+        """Must be called with the lock held."""
+
+        pr = PathRelations.get_instance()
+
+        # Push them in reverse, so that they come off in order.
+        for (filename, entry_id) in reversed(subdirectories):
+            if pr.are_children_loaded(entry_id) is True:
+                continue
+
+            child_path = ('%s/%s' % (path.rstrip('/'), filename))
+            self.__q.appendleft((pid, origin_path, child_path, entry_id,
+                                 depth))
+
+            self.__stats['queued'] += 1
+
+        # Forget the oldest, first.
+        while len(self.__q) > self.__max_queued:
+            self.__q.pop()
+            self.__stats['dropped'] += 1
+
+        if not self.__threads:
+            self.__start_workers()
+
+        self.__cond.notify_all()
+
+    def notify_listed(self, pid, path, subdirectories):
+        """The given process has read the directory at the given path.
+        `subdirectories` is a list of (filename, entry-ID) 2-tuples.
+        """
+
+        if self.__max_depth <= 0:
+            return
+
+        with self.__cond:
+            self.__walks.pop(pid, None)
+            self.__walks[pid] = path
+
+            while len(self.__walks) > _MAX_TRACKED_WALKS:
+                self.__walks.popitem(last=False)
+
+            if subdirectories:
+                self.__queue(pid, path, path, subdirectories,
+                             self.__max_depth)
+
+    def __is_current(self, pid, origin_path):
+        """Must be called with the lock held."""
+
+        current_path = self.__walks.get(pid)
+
+        return current_path is not None and \
+               _is_within(current_path, origin_path)
+
+    def __get_next(self):
+        """Return the next directory that's still worth prefetching, or None
+        if there isn't one. Must be called with the lock held.
+        """
+
+        while self.__q:
+            item = self.__q.popleft()
+            (pid, origin_path, path, entry_id, depth) = item
+
+            if self.__is_current(pid, origin_path) is True:
+                return item
+
+            self.__stats['cancelled'] += 1
+
+        return None
+
+    def __is_quitting(self):
+        return self.__quit_ev.is_set() is True or \
+               gdrivefs.state.GLOBAL_EXIT_EVENT.is_set() is True
+
+    def __prefetch(self):
+        _logger.info("Directory-prefetch thread running.")
+
+        gate = get_demand_gate()
+        pr = PathRelations.get_instance()
+
+        while self.__is_quitting() is False:
+
+            # Don't compete with anything that somebody's waiting on.
+            if gate.wait_for_idle(timeout_s=1) is False:
+                continue
+
+            with self.__cond:
+                item = self.__get_next()
+                if item is None:
+                    self.__cond.wait(1)
+                    continue
+
+            (pid, origin_path, path, entry_id, depth) = item
+
+            _logger.debug("Prefetching children of [%s] (%s).", path,
+                          entry_id)
+
+            try:
+                with priority(PRIORITY_PREFETCH), labels(op='prefetch'):
+                    subdirectories = pr.prefetch_children(entry_id)
+            except:
+                _logger.exception("Could not prefetch children of [%s] "
+                                  "(%s).", path, entry_id)
+
+                with self.__cond:
+                    self.__stats['failed'] += 1
+
+                continue
+
+            with self.__cond:
+                if subdirectories is None:
+                    self.__stats['skipped'] += 1
+                    continue
+
+                self.__stats['prefetched'] += 1
+
+                if depth > 1 and subdirectories and \
+                   self.__is_current(pid, origin_path) is True:
+                    self.__queue(pid, origin_path, path, subdirectories,
+                                 depth - 1)
+
+        _logger.info("Directory-prefetch thread terminating.")
+
+    def get_stats(self):
+        with self.__cond:
+            stats = dict(self.__stats)
+            stats['pending'] = len(self.__q)
+
+            return stats
+
+    def stop(self):
+        self.__quit_ev.set()
+
+        with self.__cond:
+            self.__cond.notify_all()
+            threads = list(self.__threads)
+
+        for t in threads:
+            t.join()
+
+_instance = None
+def get_prefetcher():
+    global _instance
+
+    if _instance is None:
+        _instance = _DirectoryPrefetcher(
+                        int(Conf.get('directory_prefetch_depth')),
+                        int(Conf.get('directory_prefetch_workers')),
+                        int(Conf.get('directory_prefetch_max_queued')))
+
+        # A listing that's still loading would otherwise be cut off during
+        # teardown and land in PathRelations half-registered; wake the
+        # workers out of their waits and let the current listings finish.
+        atexit.register(_instance.stop)
+
+    return _instance
@@ -0,0 +1,272 @@
+import logging
+import threading
+import sqlite3
+import json
+import os.path
+import Queue
+
+import gdrivefs.state
+
+from gdrivefs.conf import Conf
+
+_logger = logging.getLogger(__name__)
+
+# Increment this whenever the schema or the meaning of what we store changes.
+# A snapshot written with a different version is discarded.
+_SCHEMA_VERSION = 1
+
+_OP_PUT_ENTRY = 0
+_OP_REMOVE_ENTRY = 1
+_OP_SET_CHILDREN_LOADED = 2
+_OP_SET_CHANGE_ID = 3
+_OP_SET_VALUE = 4
+
+# How many queued operations we'll apply in a single transaction.
+_MAX_BATCH_SIZE = 1000
+
+
+class _MetadataSnapshot(object):
+    """Persists the entries that we know about, which directories have been
+    completely listed, and the change-ID that all of that is current as-of, so
+    that a later mount can start with a warm cache and catch-up via the
+    change-feed instead of re-listing everything.
+
+    Writes are queued and applied by a background thread, in order, so
+    recording something never waits on the disk.
+    """
+
+    def __init__(self, filepath):
+        self.__filepath = filepath
+        self.__q = Queue.Queue()
+
+        self.__t = None
+        self.__t_quit_ev = threading.Event()
+
+        self.__initialize()
+
+    def __connect(self):
+        conn = sqlite3.connect(self.__filepath)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        return conn
+
+    def __create_schema(self, conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS state ("
+                     "key TEXT PRIMARY KEY, value TEXT)")
+
+        conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                     "entry_id TEXT PRIMARY KEY, raw_data TEXT)")
+
+        conn.execute("CREATE TABLE IF NOT EXISTS loaded_directories ("
+                     "entry_id TEXT PRIMARY KEY)")
+
+    def __initialize(self):
+        conn = self.__connect()
+
+        try:
+            with conn:
+                self.__create_schema(conn)
+
+                row = conn.execute("SELECT value FROM state "
+                                   "WHERE key = 'version'").fetchone()
+
+                if row is not None and int(row[0]) == _SCHEMA_VERSION:
+                    return
+
+                if row is not None:
+                    _logger.warning("Metadata snapshot [%s] has version "
+                                    "(%s) rather than (%d). Discarding it.",
+                                    self.__filepath, row[0], _SCHEMA_VERSION)
+
+                conn.execute("DELETE FROM state")
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM loaded_directories")
+                conn.execute("INSERT INTO state (key, value) "
+                             "VALUES ('version', ?)", (str(_SCHEMA_VERSION),))
+        finally:
+            conn.close()
+
+    def clear(self):
+        """Discard everything that we've stored. This happens synchronously
+        (nothing should be being written at this point).
+        """
+
+        _logger.info("Clearing metadata snapshot: [%s]", self.__filepath)
+
+        conn = self.__connect()
+
+        try:
+            with conn:
+                conn.execute("DELETE FROM state WHERE key != 'version'")
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM loaded_directories")
+        finally:
+            conn.close()
+
+    def load(self):
+        """Return a 3-tuple of a dictionary of the stored values (e.g. the
+        change-ID), a list of the raw entry-data, and a list of the IDs of the
+        directories whose children were all loaded.
+        """
+
+        conn = self.__connect()
+
+        try:
+            values = dict(conn.execute("SELECT key, value FROM state"))
+
+            entries = [json.loads(raw_data)
+                       for (raw_data,)
+                       in conn.execute("SELECT raw_data FROM entries")]
+
+            loaded_ids = [entry_id
+                          for (entry_id,)
+                          in conn.execute("SELECT entry_id "
+                                          "FROM loaded_directories")]
+        finally:
+            conn.close()
+
+        _logger.info("Loaded (%d) entries and (%d) listed directories from "
+                     "metadata snapshot [%s].",
+                     len(entries), len(loaded_ids), self.__filepath)
+
+        return (values, entries, loaded_ids)
+
+    def put_entry(self, normalized_entry):
+        self.__q.put((_OP_PUT_ENTRY,
+                      normalized_entry.id,
+                      json.dumps(normalized_entry.raw_data)))
+
+    def remove_entry(self, entry_id):
+        self.__q.put((_OP_REMOVE_ENTRY, entry_id))
+
+    def set_children_loaded(self, entry_id, is_loaded=True):
+        self.__q.put((_OP_SET_CHILDREN_LOADED, entry_id, is_loaded))
+
+    def set_change_id(self, change_id):
+        self.__q.put((_OP_SET_CHANGE_ID, change_id))
+
+    def set_value(self, key, value):
+        self.__q.put((_OP_SET_VALUE, key, value))
+
+    def __apply(self, conn, op):
+        op_type = op[0]
+
+        if op_type == _OP_PUT_ENTRY:
+            conn.execute("INSERT OR REPLACE INTO entries (entry_id, raw_data) "
+                         "VALUES (?, ?)", op[1:])
+
+        elif op_type == _OP_REMOVE_ENTRY:
+            conn.execute("DELETE FROM entries WHERE entry_id = ?", op[1:])
+            conn.execute("DELETE FROM loaded_directories WHERE entry_id = ?",
+                         op[1:])
+
+        elif op_type == _OP_SET_CHILDREN_LOADED:
+            if op[2] is True:
+                conn.execute("INSERT OR IGNORE INTO loaded_directories "
+                             "(entry_id) VALUES (?)", (op[1],))
+            else:
+                conn.execute("DELETE FROM loaded_directories "
+                             "WHERE entry_id = ?", (op[1],))
+
+        elif op_type == _OP_SET_CHANGE_ID:
+            conn.execute("INSERT OR REPLACE INTO state (key, value) "
+                         "VALUES ('at_change_id', ?)", (str(op[1]),))
+
+        elif op_type == _OP_SET_VALUE:
+            conn.execute("INSERT OR REPLACE INTO state (key, value) "
+                         "VALUES (?, ?)", op[1:])
+
+    def __write(self):
+        _logger.info("Metadata-snapshot thread running.")
+
+        interval_s = float(Conf.get('metadata_snapshot_flush_interval_s'))
+        conn = self.__connect()
+
+        try:
+            while 1:
+                is_quitting = self.__t_quit_ev.is_set() is True or \
+                              gdrivefs.state.GLOBAL_EXIT_EVENT.is_set() is True
+
+                try:
+                    op = self.__q.get(timeout=interval_s)
+                except Queue.Empty:
+                    if is_quitting is True:
+                        break
+
+                    continue
+
+                # Apply everything that has been queued in one transaction.
+                # Since the operations are applied in order, the stored
+                # change-ID never gets ahead of the entries that it describes.
+
+                ops = [op]
+                while len(ops) < _MAX_BATCH_SIZE:
+                    try:
+                        ops.append(self.__q.get_nowait())
+                    except Queue.Empty:
+                        break
+
+                try:
+                    with conn:
+                        for op in ops:
+                            self.__apply(conn, op)
+                except:
+                    _logger.exception("Could not write (%d) operations to "
+                                      "the metadata snapshot.", len(ops))
+
+                _logger.debug("(%d) operations written to the metadata "
+                              "snapshot.", len(ops))
+        finally:
+            conn.close()
+
+        _logger.info("Metadata-snapshot thread terminating.")
+
+    def start(self):
+        _logger.info("Starting metadata-snapshot thread.")
+
+        self.__t = threading.Thread(target=self.__write)
+        self.__t.daemon = True
+        self.__t.start()
+
+    def stop(self):
+        _logger.info("Stopping metadata-snapshot thread.")
+
+        self.__t_quit_ev.set()
+
+        if self.__t is not None:
+            self.__t.join()
+
+    @property
+    def filepath(self):
+        return self.__filepath
+
+_instance = None
+def open_snapshot():
+    """Open the metadata snapshot, if one is enabled, and return it. Until this
+    is called, get_snapshot() returns None and nothing is recorded.
+    """
+
+    global _instance
+
+    if Conf.get('metadata_snapshot') is not True:
+        _logger.info("Metadata snapshot is disabled.")
+        return None
+
+    if _instance is None:
+        filepath = Conf.get('metadata_snapshot_filepath')
+        if filepath is None:
+            filepath = ('%s.snapshot' % (Conf.get('auth_cache_filepath'),))
+
+        _logger.info("Metadata snapshot will be stored at [%s].", filepath)
+
+        _instance = _MetadataSnapshot(os.path.abspath(filepath))
+
+    return _instance
+
+def get_snapshot():
+    """Return the metadata snapshot, or None if it's disabled or hasn't been
+    opened.
+    """
+
+    return _instance
@@ -1,4 +1,9 @@
 import logging
+import threading
+import sys
+import Queue
+
+import six
 
 from collections    import deque
 from threading      import RLock
@@ -11,16 +16,35 @@ from gdrivefs.gdtool.account_info import AccountInfo
 from gdrivefs.gdtool.normal_entry import NormalEntry
 from gdrivefs.cache.cache_registry import CacheRegistry, CacheFault
 from gdrivefs.cache.cacheclient_base import CacheClientBase
+from gdrivefs.cache.name_index import NameIndex
+from gdrivefs.cache.snapshot import get_snapshot
+from gdrivefs.cache.negative_cache import NegativeLookupCache
+from gdrivefs.general.single_flight import SingleFlight
+from gdrivefs.general.demand_gate import get_demand_gate
+from gdrivefs.general.metrics import get_labels, labels
 from gdrivefs.errors import GdNotFoundError
 
 CLAUSE_ENTRY            = 0 # Normalized entry.
 CLAUSE_PARENT           = 1 # List of parent clauses.
-CLAUSE_CHILDREN         = 2 # List of 2-tuples describing children: (filename, clause)
+CLAUSE_CHILDREN         = 2 # NameIndex of children (iterates as (filename, clause))
 CLAUSE_ID               = 3 # Entry ID.
 CLAUSE_CHILDREN_LOADED  = 4 # All children loaded?
 
 _logger = logging.getLogger(__name__)
 
+def _format_duplicate_suffix(i):
+    return utility.translate_filename_charset(' (%d)' % (i))
+
+def _build_children_index():
+    return NameIndex(format_suffix=_format_duplicate_suffix)
+
+# How many pages of a streamed listing may be waiting to be consumed.
+_MAX_STREAMED_PAGES_AHEAD = 1
+
+# Markers on the queue of a streamed listing (after the pages).
+_STREAM_DONE = 0
+_STREAM_FAILED = 1
+
 def path_resolver(path):
     path_relations = PathRelations.get_instance()
 
@@ -35,6 +59,10 @@ def path_resolver(path):
 class PathRelations(object):
     """Manages physical path representations of all of the entries in our "
     account.
+
+    The lock only guards our own structures. It is never held while we talk to
+    Drive: listings are fetched without it and then merged-in under it, so 
+    lookups of anything already cached never wait on the network.
     """
 
     rlock = RLock()
@@ -43,6 +71,28 @@ class PathRelations(object):
     path_cache = { }
     path_cache_byid = { }
 
+    def __init__(self):
+        # Concurrent loads of the same listing share one request.
+        self.__fetches = SingleFlight()
+
+        # The serial-number of the most recent removal, the serial-number at 
+        # which each entry was last removed (for as long as any fetch is 
+        # in-flight), and the number of fetches that are in-flight. These let 
+        # us avoid resurrecting entries, from a listing that was fetched 
+        # before they were removed.
+        self.__removal_serial = 0
+        self.__removed_at = { }
+        self.__fetches_in_flight = 0
+
+        # Set while we're registering entries from the metadata snapshot (so 
+        # that we don't write them right back to it).
+        self.__is_restoring = False
+
+        # Names that were recently looked-up under a parent, and not found.
+        self.__missing = NegativeLookupCache(
+                            int(Conf.get('negative_cache_max_entries')), 
+                            float(Conf.get('negative_cache_ttl_s')))
+
     @staticmethod
     def get_instance():
 
@@ -55,8 +105,12 @@ class PathRelations(object):
             CacheRegistry.__instance = PathRelations()
             return CacheRegistry.__instance
 
-    def remove_entry_recursive(self, entry_id, is_update=False):
-        """Remove an entry, all children, and any newly orphaned parents."""
+    def remove_entry_recursive(self, entry_id, is_update=False, 
+                               is_eviction=False):
+        """Remove an entry, all children, and any newly orphaned parents. 
+        `is_eviction` indicates that the entry is only being dropped from the 
+        cache, rather than having been removed from the account.
+        """
 
         _logger.debug("Recursively pruning entry with ID [%s].", entry_id)
 
@@ -86,21 +140,23 @@ class PathRelations(object):
             else:
                 stat_files += 1
 
-            result = self.__remove_entry(current_entry_id, is_update)
+            result = self.__remove_entry(current_entry_id, is_update, 
+                                         is_eviction)
 
             removed[current_entry_id] = True
 
             (current_orphan_ids, current_children_clauses) = result
 
-            children_ids_to_remove = [ children[3] for children 
-                                                in current_children_clauses ]
+            children_ids_to_remove = [ child_clause[CLAUSE_ID] 
+                                       for child_clause 
+                                       in current_children_clauses ]
 
             to_remove.extend(current_orphan_ids)
             to_remove.extend(children_ids_to_remove)
 
         return (removed.keys(), (stat_folders + stat_files))
 
-    def __remove_entry(self, entry_id, is_update=False):
+    def __remove_entry(self, entry_id, is_update=False, is_eviction=False):
         """Remove an entry. Updates references from linked entries, but does 
         not remove any other entries. We return a tuple, where the first item 
         is a list of any parents that, themselves, no longer have parents or 
@@ -122,7 +178,7 @@ class PathRelations(object):
             # Clip us from the list of children on each of our parents.
 
             entry_parents = entry_clause[CLAUSE_PARENT]
-            entry_children_tuples = entry_clause[CLAUSE_CHILDREN]
+            entry_children = entry_clause[CLAUSE_CHILDREN]
 
             parents_to_remove = [ ]
             children_to_remove = [ ]
@@ -134,8 +190,17 @@ class PathRelations(object):
                     (parent, parent_parents, parent_children, parent_id, \
                         all_children_loaded) = parent_clause
 
-                    if all_children_loaded and not is_update:
-                        all_children_loaded = False
+                    # If we're just dropping this entry from the cache, the 
+                    # parent no longer has all of its children, so we can't 
+                    # rule names out from its list anymore. If it was 
+                    # removed from the account, the parent's list is still 
+                    # complete.
+                    if all_children_loaded and is_eviction:
+                        parent_clause[CLAUSE_CHILDREN_LOADED] = False
+
+                        snapshot = get_snapshot()
+                        if snapshot is not None:
+                            snapshot.set_children_loaded(parent_id, False)
 
                     # Integrity-check that the parent we're referencing is 
                     # still in the list.
@@ -144,26 +209,23 @@ class PathRelations(object):
                                      "[%s] is not valid." % 
                                      (parent_id, entry_id))
                         continue
-            
-                    old_children_filenames = [ child_tuple[0] for child_tuple 
-                                                in parent_children ]
-
-                    updated_children = [ child_tuple for child_tuple 
-                                         in parent_children 
-                                         if child_tuple[1] != entry_clause ]
 
-                    if parent_children != updated_children:
-                        parent_children[:] = updated_children
-
-                    else:
+                    # Remember that the name no longer exists (unless it's 
+                    # just about to be re-added). Placeholder parents, 
+                    # including those that are themselves being removed, are 
+                    # skipped.
+                    if parent is not None and \
+                       is_update is False and \
+                       is_eviction is False:
+                        filename = parent_children.get_name(entry_id)
+                        if filename is not None:
+                            self.__missing.add(parent_id, filename)
+
+                    if parent_children.remove(entry_id) is None:
                         _logger.error("Entry with ID [%s] referenced parent "
                                       "with ID [%s], but not vice-versa." % 
                                       (entry_id, parent_id))
 
-                    updated_children_filenames = [ child_tuple[0] 
-                                                    for child_tuple
-                                                    in parent_children ]
-
                     # If the parent now has no children and is a placeholder, 
                     # advise that we remove it.
                     if not parent_children and parent == None:
@@ -171,7 +233,7 @@ class PathRelations(object):
 
             # Remove/neutralize entry, now that references have been removed.
 
-            set_placeholder = len(entry_children_tuples) > 0
+            set_placeholder = len(entry_children) > 0
 
             if set_placeholder:
                 # Just nullify the entry information, but leave the clause. We 
@@ -182,8 +244,7 @@ class PathRelations(object):
             else:
                 del self.entry_ll[entry_id]
 
-        children_entry_clauses = [ child_tuple[1] for child_tuple 
-                                    in entry_children_tuples ]
+        children_entry_clauses = entry_children.clauses()
 
         return (parents_to_remove, children_entry_clauses)
 
@@ -207,6 +268,10 @@ class PathRelations(object):
         with PathRelations.rlock:
             cache = EntryCache.get_instance().cache
 
+            if self.__fetches_in_flight > 0:
+                self.__removal_serial += 1
+                self.__removed_at[entry_id] = self.__removal_serial
+
             removed_ids = [ entry_id ]
             if self.is_cached(entry_id):
                 try:
@@ -219,7 +284,12 @@ class PathRelations(object):
 
                 (removed_ids, number_removed) = removed_tuple
 
+            snapshot = get_snapshot()
+
             for removed_id in removed_ids:
+                if snapshot is not None:
+                    snapshot.remove_entry(removed_id)
+
                 if cache.exists(removed_id):
                     try:
                         cache.remove(removed_id)
@@ -249,10 +319,10 @@ class PathRelations(object):
 
             else:
                 for parent_clause in parents:
-                    matching_children = [filename for filename, child_clause 
-                                                  in parent_clause[2] 
-                                                  if child_clause == entry_clause]
-                    if not matching_children:
+                    filename = parent_clause[CLAUSE_CHILDREN].get_name(
+                                entry_clause[CLAUSE_ID])
+
+                    if filename is None:
                         _logger.error("No matching entry-ID [%s] was not "
                                       "found among children of entry's "
                                       "parent with ID [%s] for proper-"
@@ -260,10 +330,19 @@ class PathRelations(object):
                                       (entry_clause[3], parent_clause[3]))
 
                     else:
-                        found[parent_clause[3]] = matching_children[0]
+                        found[parent_clause[3]] = filename
 
         return found
 
+    def __is_same_place(self, current_entry, normalized_entry):
+        """Return True if the entry has the same name under the same parents
+        as it did.
+        """
+
+        return current_entry.title_fs == normalized_entry.title_fs and \
+               set(current_entry.parents or []) == \
+                set(normalized_entry.parents or [])
+
     def register_entry(self, normalized_entry):
 
         with PathRelations.rlock:
@@ -280,18 +359,35 @@ class PathRelations(object):
 #            self.__log.debug("Registering entry with ID [%s] within path-"
 #                             "relations.", entry_id)
 
+            # If it's still under the same name in the same directories (e.g. 
+            # it was just refreshed), it's updated in place: its children, and
+            # whether we have all of them, are still good. Otherwise, it's 
+            # removed and registered again.
+            current_clause = None
             if self.is_cached(entry_id, include_placeholders=False):
-                self.remove_entry_recursive(entry_id, True)
+                current_clause = self.entry_ll[entry_id]
+                if self.__is_same_place(current_clause[CLAUSE_ENTRY], 
+                                        normalized_entry) is False:
+                    self.remove_entry_recursive(entry_id, True)
+                    current_clause = None
 
             cache = EntryCache.get_instance().cache
 
             cache.set(normalized_entry.id, normalized_entry)
 
+            snapshot = get_snapshot()
+            if snapshot is not None and self.__is_restoring is False:
+                snapshot.put_entry(normalized_entry)
+
+            if current_clause is not None:
+                current_clause[CLAUSE_ENTRY] = normalized_entry
+                return current_clause
+
             # We do a linked list using object references.
             # (
             #   normalized_entry, 
             #   [ parent clause, ... ], 
-            #   [ child clause, ... ], 
+            #   NameIndex of child clauses, 
             #   entry-ID,
             #   < boolean indicating that we know about all children >
             # )
@@ -301,7 +397,8 @@ class PathRelations(object):
                 entry_clause[CLAUSE_ENTRY] = normalized_entry
                 entry_clause[CLAUSE_PARENT] = [ ]
             else:
-                entry_clause = [normalized_entry, [ ], [ ], entry_id, False]
+                entry_clause = [normalized_entry, [ ], _build_children_index(), 
+                                entry_id, False]
                 self.entry_ll[entry_id] = entry_clause
 
             entry_parents = entry_clause[CLAUSE_PARENT]
@@ -316,33 +413,24 @@ class PathRelations(object):
                 if self.is_cached(parent_id, include_placeholders=True):
                     parent_clause = self.entry_ll[parent_id]
                 else:
-                    parent_clause = [None, None, [ ], parent_id, False]
+                    parent_clause = [None, None, _build_children_index(), 
+                                     parent_id, False]
                     self.entry_ll[parent_id] = parent_clause
 
                 if parent_clause not in entry_parents:
                     entry_parents.append(parent_clause)
 
-                parent_children = parent_clause[CLAUSE_CHILDREN]
-                filename_base = title_fs
-
                 # Register among the children of this parent, but make sure we 
                 # have a unique filename among siblings.
 
-                i = 0
-                current_variation = filename_base
-                elected_variation = None
-                while i <= 255:
-                    if not [ child_name_tuple 
-                             for child_name_tuple 
-                             in parent_children 
-                             if child_name_tuple[0] == current_variation ]:
-                        elected_variation = current_variation
-                        break
-                        
-                    i += 1
-                    current_variation = filename_base + \
-                                        utility.translate_filename_charset(
-                                            ' (%d)' % (i))
+                parent_children = parent_clause[CLAUSE_CHILDREN]
+                elected_variation = parent_children.add(title_fs, entry_clause)
+
+                self.__missing.invalidate(parent_id, title_fs)
+
+                if elected_variation is not None and \
+                   elected_variation != title_fs:
+                    self.__missing.invalidate(parent_id, elected_variation)
 
                 if elected_variation == None:
                     _logger.error("Could not register entry with ID [%s]. "
@@ -350,65 +438,401 @@ class PathRelations(object):
                                   "that directory." % (entry_id))
                     return
 
-                # Register us in the list of children on this parents 
-                # child-tuple list.
-                parent_children.append((elected_variation, entry_clause))
-
         return entry_clause
 
+    def restore_snapshot(self, raw_entries, loaded_ids):
+        """Register the entries recorded by the metadata snapshot, and flag 
+        the directories that had been completely listed.
+        """
+
+        with PathRelations.rlock:
+            self.__is_restoring = True
+
+            try:
+                for raw_data in raw_entries:
+                    try:
+                        normalized_entry = NormalEntry('snapshot', raw_data)
+                    except:
+                        _logger.exception("Could not normalize entry from "
+                                          "snapshot. Skipping.")
+                        continue
+
+                    self.register_entry(normalized_entry)
+
+                for entry_id in loaded_ids:
+                    if self.is_cached(entry_id):
+                        self.entry_ll[entry_id][CLAUSE_CHILDREN_LOADED] = True
+            finally:
+                self.__is_restoring = False
+
+    def __begin_fetch(self):
+        """Note that we're about to read from Drive, outside of the lock. 
+        Returns a marker to pass to __merge_fetched().
+        """
+
+        with PathRelations.rlock:
+            self.__fetches_in_flight += 1
+            return self.__removal_serial
+
+    def __end_fetch(self):
+        with PathRelations.rlock:
+            self.__fetches_in_flight -= 1
+
+            if self.__fetches_in_flight == 0:
+                self.__removed_at.clear()
+
+    def __merge_fetched(self, fetch_serial, entries):
+        """Register entries that were retrieved outside of the lock, skipping 
+        any that were removed (e.g. by the change-processor) while we were 
+        waiting on them. Must be called with the lock held.
+        """
+
+        for entry in entries:
+            if self.__removed_at.get(entry.id, -1) > fetch_serial:
+                _logger.debug("Entry with ID [%s] was removed while it was "
+                              "being fetched. Not registering.", entry.id)
+                continue
+
+            self.register_entry(entry)
+
+    def __fetch_children(self, parent_id, max_entries=None, 
+                         page_callback=None):
+        """Read and register the children of the given directory, a page at a
+        time, stopping once we have at least `max_entries` (if given). Return a
+        2-tuple of the entries and whether they were all of them, in which case
+        the directory is marked as loaded.
+
+        If `page_callback` is given, it's called with a list of the 
+        (filename, clause) 2-tuples that were registered from each page, as 
+        each page is read, and the entries aren't accumulated.
+        """
+
+        gd = get_gdrive()
+
+        fetch_serial = self.__begin_fetch()
+
+        try:
+            children = []
+            num_children = 0
+            page_token = None
+            while 1:
+                max_results = max_entries - num_children \
+                                if max_entries is not None \
+                                else None
+
+                (entries, page_token) = gd.list_files_page(
+                                            parent_id=parent_id, 
+                                            page_token=page_token, 
+                                            max_results=max_results)
+
+                num_children += len(entries)
+
+                with PathRelations.rlock:
+                    self.__merge_fetched(fetch_serial, entries)
+
+                    if page_callback is not None:
+                        registered = self.__get_registered_children(
+                                        parent_id, 
+                                        entries)
+
+                if page_callback is not None:
+                    page_callback(registered)
+                else:
+                    children += entries
+
+                if page_token is None or \
+                   (max_entries is not None and num_children >= max_entries):
+                    break
+
+            is_complete = (page_token is None)
+
+            with PathRelations.rlock:
+                parent_clause = self.entry_ll.get(parent_id)
+                if is_complete is True and parent_clause is not None:
+                    parent_clause[CLAUSE_CHILDREN_LOADED] = True
+
+                    snapshot = get_snapshot()
+                    if snapshot is not None:
+                        snapshot.set_children_loaded(parent_id)
+        finally:
+            self.__end_fetch()
+
+        return (children, is_complete)
+
+    def __get_registered_children(self, parent_id, entries):
+        """Return (filename, clause) 2-tuples for those of the given entries 
+        that are now registered under the given parent. Must be called with the
+        lock held.
+        """
+
+        parent_clause = self.entry_ll.get(parent_id)
+        if parent_clause is None:
+            return []
+
+        children = parent_clause[CLAUSE_CHILDREN]
+
+        registered = []
+        for entry in entries:
+            filename = children.get_name(entry.id)
+            if filename is not None:
+                registered.append((filename, children.get(filename)))
+
+        return registered
+
+    def __fetch_all_children(self, parent_id, page_callback=None):
+        """Read all of the children of the given directory. This is what 
+        every load under the ('children', <ID>) key runs, whether or not the 
+        pages are being streamed, so that whoever joins one gets the same 
+        result: nothing. The children are in the PathRelations.
+        """
+
+        self.__fetch_children(parent_id, page_callback=page_callback)
+
     def __load_all_children(self, parent_id):
+        with get_demand_gate().demand():
+            self.__fetches.do(
+                ('children', parent_id), 
+                self.__fetch_all_children, 
+                parent_id)
+
+    def __fetch_child_by_name(self, parent_id, child_name):
         gd = get_gdrive()
 
-        with PathRelations.rlock:
-            children = gd.list_files(parent_id=parent_id)
+        fetch_serial = self.__begin_fetch()
+
+        try:
+            children = gd.list_files(
+                            parent_id=parent_id, 
+                            query_is_string=child_name)
+
+            with PathRelations.rlock:
+                self.__merge_fetched(fetch_serial, children)
+
+                # Remember if it doesn't exist, so that we don't have to ask 
+                # again for a while.
+
+                child_name_fs = utility.translate_filename_charset(child_name)
+                parent_clause = self.entry_ll.get(parent_id)
+
+                if parent_clause is not None and \
+                   parent_clause[CLAUSE_CHILDREN].get(child_name_fs) is None:
+                    self.__missing.add(parent_id, child_name_fs)
+        finally:
+            self.__end_fetch()
+
+        return children
+
+    def __load_child_by_name(self, parent_id, child_name):
+        with get_demand_gate().demand():
+            (children, is_shared) = self.__fetches.do(
+                                        ('child', parent_id, child_name), 
+                                        self.__fetch_child_by_name, 
+                                        parent_id, 
+                                        child_name)
+
+        return children
+
+    def read_ahead_children(self, parent_id, max_entries):
+        """Read and register roughly `max_entries` children of the given 
+        directory with a single listing (unless we already have all of them).
+        If that was all of them, the directory is marked as loaded. Return the 
+        entries that were read.
+        """
 
-            child_ids = [ ]
-            if children:
-                for child in children:
-                        self.register_entry(child)
+        if self.are_children_loaded(parent_id) is True:
+            return []
 
-                parent_clause = self.__get_entry_clause_by_id(parent_id)
+        (children, is_complete) = self.__fetch_children(parent_id, 
+                                                        max_entries)
 
-                parent_clause[4] = True
+        _logger.debug("Read-ahead of (%d) children under [%s]. COMPLETE=[%s]",
+                      len(children), parent_id, is_complete)
 
         return children
 
+    def are_children_loaded(self, entry_id):
+        with PathRelations.rlock:
+            entry_clause = self.entry_ll.get(entry_id)
+
+            return entry_clause is not None and \
+                   entry_clause[CLAUSE_CHILDREN_LOADED] is True
+
+    def prefetch_children(self, entry_id):
+        """Load the children of the given directory before anybody asks for 
+        them. Return the (filename, entry-ID) 2-tuples of its subdirectories, 
+        or None if its children were already loaded or are being loaded.
+        """
+
+        if self.are_children_loaded(entry_id) is True or \
+           self.__fetches.is_in_flight(('children', entry_id)):
+            return None
+
+        (_, is_shared) = self.__fetches.do(
+                            ('children', entry_id), 
+                            self.__fetch_all_children, 
+                            entry_id)
+
+        if is_shared is True:
+            return None
+
+        with PathRelations.rlock:
+            entry_clause = self.entry_ll.get(entry_id)
+            if entry_clause is None:
+                return []
+
+            return [(filename, child_clause[CLAUSE_ID])
+                    for (filename, child_clause)
+                    in entry_clause[CLAUSE_CHILDREN]
+                    if child_clause[CLAUSE_ENTRY] is not None and \
+                       child_clause[CLAUSE_ENTRY].is_directory]
+
     def get_children_from_entry_id(self, entry_id):
         """Return the filenames contained in the folder with the given 
         entry-ID.
         """
 
-        with PathRelations.rlock:
-            entry_clause = self.__get_entry_clause_by_id(entry_id)
-            if not entry_clause:
-                message = ("Can not list the children for an unavailable "
-                           "entry with ID [%s]." % (entry_id))
+        entry_clause = self.__get_entry_clause_by_id(entry_id)
+        if not entry_clause:
+            message = ("Can not list the children for an unavailable "
+                       "entry with ID [%s]." % (entry_id))
 
-                _logger.error(message)
-                raise Exception(message)
+            _logger.error(message)
+            raise Exception(message)
 
-            if not entry_clause[4]:
-                self.__load_all_children(entry_id)
+        if not entry_clause[CLAUSE_ENTRY].is_directory:
+            message = ("Could not get child filenames for non-directory with "
+                       "entry-ID [%s]." % (entry_id))
 
-            if not entry_clause[0].is_directory:
-                message = ("Could not get child filenames for non-directory with "
-                           "entry-ID [%s]." % (entry_id))
+            _logger.error(message)
+            raise Exception(message)
 
-                _logger.error(message)
-                raise Exception(message)
+        if not entry_clause[CLAUSE_CHILDREN_LOADED]:
+            self.__load_all_children(entry_id)
 
+        with PathRelations.rlock:
 #            self.__log.debug("(%d) children found.",
 #                             len(entry_clause[CLAUSE_CHILDREN]))
 
-            return entry_clause[CLAUSE_CHILDREN]
+            return list(entry_clause[CLAUSE_CHILDREN])
+
+    def iterate_children_entries_from_entry_id(self, entry_id):
+        """The same as get_children_entries_from_entry_id(), but, if the 
+        children have to be loaded, produce them a page at a time, as they're 
+        read. The next page is read (on another thread, as part of the shared
+        load) while the current one is being consumed, including while a 
+        readdir() that the kernel took an installment of waits to be 
+        continued. The directory is only marked as loaded once the last page 
+        is read.
+        """
+
+        entry_clause = self.__get_entry_clause_by_id(entry_id)
+        if not entry_clause:
+            message = ("Can not list the children for an unavailable "
+                       "entry with ID [%s]." % (entry_id))
+
+            _logger.error(message)
+            raise Exception(message)
+
+        if not entry_clause[CLAUSE_ENTRY].is_directory:
+            message = ("Could not get child filenames for non-directory with "
+                       "entry-ID [%s]." % (entry_id))
+
+            _logger.error(message)
+            raise Exception(message)
+
+        if entry_clause[CLAUSE_CHILDREN_LOADED] or \
+           self.__fetches.is_in_flight(('children', entry_id)):
+            for child_tuple in self.get_children_entries_from_entry_id(entry_id):
+                yield child_tuple
+
+            return
+
+        pages = Queue.Queue(_MAX_STREAMED_PAGES_AHEAD)
+        abandoned_ev = threading.Event()
+
+        def deliver(item):
+            # If we're no longer being consumed, the listing still completes 
+            # (and is registered), but the pages are dropped.
+            while abandoned_ev.is_set() is False:
+                try:
+                    pages.put(item, timeout=1)
+                except Queue.Full:
+                    continue
+                else:
+                    return
+
+        # The listing is attributed to what our caller is doing.
+        labels_ = get_labels()
+
+        def produce():
+            try:
+                with get_demand_gate().demand(), labels(**labels_):
+                    self.__fetches.do(
+                        ('children', entry_id), 
+                        self.__fetch_all_children, 
+                        entry_id, 
+                        page_callback=deliver)
+            except:
+                deliver((_STREAM_FAILED, sys.exc_info()))
+            else:
+                # If another load beat us to it, our callback wasn't used (we 
+                # pick the children up from the PathRelations, below).
+                deliver((_STREAM_DONE, None))
+
+        t = threading.Thread(target=produce)
+        t.daemon = True
+        t.start()
+
+        # A child can come back on more than one page if the directory changes 
+        # while we're paging through it.
+        yielded_ids = set()
+
+        try:
+            while 1:
+                item = pages.get()
+
+                if isinstance(item, list):
+                    for (filename, child_clause) in item:
+                        # It may have been removed since the page was read.
+                        entry = child_clause[CLAUSE_ENTRY]
+                        if entry is None or entry.id in yielded_ids:
+                            continue
+
+                        yielded_ids.add(entry.id)
+                        yield (filename, entry)
+
+                    continue
+
+                (marker, exc_info) = item
+
+                if marker == _STREAM_FAILED:
+                    six.reraise(*exc_info)
+
+                # Finish with anything that is registered under the directory 
+                # but that we haven't produced: children that were registered 
+                # before the listing but weren't on any of its pages, or, if 
+                # another load beat us to it, all of them.
+                for (filename, entry) \
+                        in self.get_children_entries_from_entry_id(entry_id):
+                    if entry.id in yielded_ids:
+                        continue
+
+                    yielded_ids.add(entry.id)
+                    yield (filename, entry)
+
+                break
+        finally:
+            abandoned_ev.set()
 
     def get_children_entries_from_entry_id(self, entry_id):
 
         children_tuples = self.get_children_from_entry_id(entry_id)
 
+        # Skip any that have been removed since we got the list.
         children_entries = [(child_tuple[0], child_tuple[1][CLAUSE_ENTRY]) 
                                 for child_tuple 
-                                in children_tuples]
+                                in children_tuples
+                                if child_tuple[1][CLAUSE_ENTRY] is not None]
 
         return children_entries
 
@@ -416,20 +840,20 @@ class PathRelations(object):
 
 #        self.__log.debug("Getting clause for path [%s].", filepath)
 
-        with PathRelations.rlock:
-            path_results = self.find_path_components_goandget(filepath)
+        path_results = self.find_path_components_goandget(filepath)
 
-            (entry_ids, path_parts, success) = path_results
-            if not success:
-                return None
+        (entry_ids, path_parts, success) = path_results
+        if not success:
+            return None
 
-            entry_id = path_results[0][-1]
-#            self.__log.debug("Found entry with ID [%s].", entry_id)
+        entry_id = path_results[0][-1]
+#        self.__log.debug("Found entry with ID [%s].", entry_id)
 
-            # Make sure the entry is more than a placeholder.
-            self.__get_entry_clause_by_id(entry_id)
+        # Keep the entries along the path from being the first to be evicted.
+        EntryCache.get_instance().cache.touch(entry_ids)
 
-            return self.entry_ll[entry_id]
+        # Make sure the entry is more than a placeholder.
+        return self.__get_entry_clause_by_id(entry_id)
 
     def find_path_components_goandget(self, path):
         """Do the same thing that find_path_components() does, except that 
@@ -437,61 +861,103 @@ class PathRelations(object):
         among the children of the previous path component, and then try again.
         """
 
-        gd = get_gdrive()
-
-        with PathRelations.rlock:
-            previous_results = []
-            i = 0
-            while 1:
-#                self.__log.debug("Attempting to find path-components (go and "
-#                                 "get) for path [%s].  CYCLE= (%d)", path, i)
+        previous_results = []
+        i = 0
+        while 1:
+#            self.__log.debug("Attempting to find path-components (go and "
+#                             "get) for path [%s].  CYCLE= (%d)", path, i)
 
-                # See how many components can be found in our current cache.
+            # See how many components can be found in our current cache.
 
-                result = self.__find_path_components(path)
+            result = self.__find_path_components(path)
 
-                # If we could resolve the entire path, return success.
+            # If we could resolve the entire path, return success.
 
-                if result[2] == True:
-                    return result
+            if result[2] == True:
+                return result
 
-                # If we could not resolve the entire path, and we're no more 
-                # successful than a prior attempt, we'll just have to return a 
-                # partial.
+            # If we could not resolve the entire path, and we're no more 
+            # successful than a prior attempt, we'll just have to return a 
+            # partial.
 
-                num_results = len(result[0])
-                if num_results in previous_results:
-                    return result
+            num_results = len(result[0])
+            if num_results in previous_results:
+                return result
 
-                previous_results.append(num_results)
+            previous_results.append(num_results)
 
-                # Else, we've encountered a component/depth of the path that we 
-                # don't currently know about.
+            # Else, we've encountered a component/depth of the path that we 
+            # don't currently know about.
 # TODO: This is going to be the general area that we'd have to adjust to 
 #        support multiple, identical entries. This currently only considers the 
 #        first result. We should rewrite this to be recursive in order to make 
 #        it easier to keep track of a list of results.
-                # The parent is the last one found, or the root if none.
-                parent_id = result[0][num_results - 1] \
-                                if num_results \
-                                else AccountInfo.get_instance().root_id
-
-                # The child will be the first part that was not found.
-                child_name = result[1][num_results]
-
-                children = gd.list_files(
-                                parent_id=parent_id, 
-                                query_is_string=child_name)
-                
-                for child in children:
-                    self.register_entry(child)
-
-                filenames_phrase = ', '.join([ candidate.id for candidate
-                                                            in children ])
-#                self.__log.debug("(%d) candidate children were found: %s",
-#                                 len(children), filenames_phrase)
+            # The parent is the last one found, or the root if none.
+            parent_id = result[0][num_results - 1] \
+                            if num_results \
+                            else AccountInfo.get_instance().root_id
 
-                i += 1
+            # The child will be the first part that was not found.
+            child_name = result[1][num_results]
+
+            if self.__is_known_missing(parent_id, child_name) is True:
+                return result
+
+            children = self.__load_child_by_name(parent_id, child_name)
+
+            filenames_phrase = ', '.join([ candidate.id for candidate
+                                                        in children ])
+#            self.__log.debug("(%d) candidate children were found: %s",
+#                             len(children), filenames_phrase)
+
+            i += 1
+
+    def __is_known_missing(self, parent_id, child_name):
+        """Return True if we can tell that the child doesn't exist without 
+        asking the server: either we already have all of the parent's children
+        or we recently asked and it wasn't there.
+        """
+
+        child_name_fs = utility.translate_filename_charset(child_name)
+
+        with PathRelations.rlock:
+            parent_clause = self.entry_ll.get(parent_id)
+            if parent_clause is not None and \
+               parent_clause[CLAUSE_ENTRY] is not None and \
+               parent_clause[CLAUSE_CHILDREN_LOADED] is True:
+                return True
+
+        return self.__missing.contains(parent_id, child_name_fs)
+
+    def invalidate_missing(self, entry_id, normalized_entry=None):
+        """Something changed on the server regarding the given entry. Forget 
+        any names that we determined were missing under it, or under any of 
+        its current or new parents.
+        """
+
+        with PathRelations.rlock:
+            parent_ids = set([entry_id])
+
+            if normalized_entry is not None and \
+               normalized_entry.parents is not None:
+                parent_ids.update(normalized_entry.parents)
+
+            entry_clause = self.entry_ll.get(entry_id)
+            if entry_clause is not None and \
+               entry_clause[CLAUSE_PARENT] is not None:
+                parent_ids.update([parent_clause[CLAUSE_ID] 
+                                   for parent_clause 
+                                   in entry_clause[CLAUSE_PARENT]])
+
+            for parent_id in parent_ids:
+                self.__missing.invalidate_parent(parent_id)
+
+    def get_missing_stats(self):
+        """Return the statistics of the names that we remember to be
+        missing.
+        """
+
+        return self.__missing.get_stats()
 
     def __find_path_components(self, path):
         """Given a path, return a list of all Google Drive entries that 
@@ -509,13 +975,14 @@ class PathRelations(object):
         if path in self.path_cache:
             return self.path_cache[path]
 
-        with PathRelations.rlock:
-#            self.__log.debug("Locating entry information for path [%s].", path)
+        root_id = AccountInfo.get_instance().root_id
 
-            root_id = AccountInfo.get_instance().root_id
+        # Ensure that the root node is loaded (this might have to go to the 
+        # server, so we do it before taking the lock).
+        self.__get_entry_clause_by_id(root_id)
 
-            # Ensure that the root node is loaded.
-            self.__get_entry_clause_by_id(root_id)
+        with PathRelations.rlock:
+#            self.__log.debug("Locating entry information for path [%s].", path)
 
             path_parts = path.split('/')
 
@@ -532,24 +999,26 @@ class PathRelations(object):
 #                                 "with ID [%s].",
 #                                 i, child_filename_to_search_fs, entry_ptr)
 
-                current_clause = self.entry_ll[entry_ptr]
+                current_clause = self.entry_ll.get(entry_ptr)
+                if current_clause is None:
+                    # It was removed since we last looked.
+                    return (results, path_parts, False)
             
                 # Search this entry's children for the next filename further down 
                 # in the path among this entry's children. Any duplicates should've 
                 # already beeen handled as entries were stored. We name the variable 
                 # just to emphasize that no ambiguity -as well as- no error will 
                 # occur in the traversal process.
-                first_matching_child_clause = None
-                children = current_clause[2]
+                children = current_clause[CLAUSE_CHILDREN]
             
                 # If they just wanted the "" path (root), return the root-ID.
                 if path == "":
                     found = [ root_id ]
                 else:
-                    found = [ child_tuple[1][3] 
-                              for child_tuple 
-                              in children 
-                              if child_tuple[0] == child_filename_to_search_fs ]
+                    child_clause = children.get(child_filename_to_search_fs)
+                    found = [ child_clause[CLAUSE_ID] ] \
+                                if child_clause is not None \
+                                else [ ]
 
                 if found:
                     results.append(found[0])
@@ -577,10 +1046,20 @@ class PathRelations(object):
             if self.is_cached(entry_id):
                 return self.entry_ll[entry_id]
 
-            else:
-                cache = EntryCache.get_instance().cache
-                normalized_entry = cache.get(entry_id)
-                return self.register_entry(normalized_entry)
+        # Retrieving the entry may require a trip to the server, so we don't 
+        # hold the lock, here. The fault-handler will usually register it for 
+        # us.
+
+        cache = EntryCache.get_instance().cache
+
+        with get_demand_gate().demand():
+            normalized_entry = cache.get(entry_id)
+
+        with PathRelations.rlock:
+            if self.is_cached(entry_id):
+                return self.entry_ll[entry_id]
+
+            return self.register_entry(normalized_entry)
 
     def is_cached(self, entry_id, include_placeholders=False):
 
@@ -598,63 +1077,47 @@ class EntryCache(CacheClientBase):
 #        about = AccountInfo.get_instance()
         self.__gd = get_gdrive()
 
-    def __get_entries_to_update(self, requested_entry_id):
-        # Get more entries than just what was requested, while we're at it.
-
-        parent_ids = self.__gd.get_parents_containing_id(requested_entry_id)
-
-        affected_entries = [requested_entry_id]
-        considered_entries = {}
-        max_readahead_entries = Conf.get('max_readahead_entries')
-        for parent_id in parent_ids:
-            child_ids = self.__gd.get_children_under_parent_id(parent_id)
-
-            for child_id in child_ids:
-                if child_id == requested_entry_id:
-                    continue
-
-                # We've already looked into this entry.
-
-                try:
-                    considered_entries[child_id]
-                    continue
-                except:
-                    pass
-
-                considered_entries[child_id] = True
-
-                # Is it already cached?
-
-                if self.cache.exists(child_id):
-                    continue
-
-                affected_entries.append(child_id)
+    def __do_update_for_missing_entry(self, requested_entry_id):
 
-                if len(affected_entries) >= max_readahead_entries:
-                    break
+        # Get the entry, and then its siblings (with all of their information)
+        # while we're at it. A single listing of each parent is enough for 
+        # that.
 
-        return affected_entries
+        entry = self.__gd.get_entry(requested_entry_id)
 
-    def __do_update_for_missing_entry(self, requested_entry_id):
+        path_relations = PathRelations.get_instance()
+        retrieved = { }
 
-        # Get the entries to update.
+        # If it's in several directories that we don't have yet, get them 
+        # together rather than one at a time as they're needed.
+        unknown_parent_ids = [ parent_id 
+                               for parent_id 
+                               in entry.parents or [] 
+                               if not path_relations.is_cached(parent_id) ]
 
-        affected_entries = self.__get_entries_to_update(requested_entry_id)
+        if len(unknown_parent_ids) > 1:
+            parents = self.__gd.get_entries(unknown_parent_ids)
 
-        # Read the entries, now.
+            for parent in parents.itervalues():
+                path_relations.register_entry(parent)
+                retrieved[parent.id] = parent
 
-# TODO: We have to determine when this is called, and either remove it 
-# (if it's not), or find another way to not have to load them 
-# individually.
+        max_readahead_entries = Conf.get('max_readahead_entries')
+        for parent_id in entry.parents or []:
+            remaining = max_readahead_entries - len(retrieved)
+            if remaining <= 0:
+                break
 
-        retrieved = self.__gd.get_entries(affected_entries)
+            siblings = path_relations.read_ahead_children(parent_id, 
+                                                          remaining)
 
-        # Update the cache.
+            for sibling in siblings:
+                retrieved[sibling.id] = sibling
 
-        path_relations = PathRelations.get_instance()
-
-        for entry_id, entry in retrieved.iteritems():
+        # The listing will usually have included (and registered) it.
+        if requested_entry_id not in retrieved:
             path_relations.register_entry(entry)
+            retrieved[requested_entry_id] = entry
 
         return retrieved
 
@@ -677,8 +1140,27 @@ class EntryCache(CacheClientBase):
         path_relations = PathRelations.get_instance()
 
         if path_relations.is_cached(entry_id):
-            path_relations.remove_entry_recursive(entry_id)
+            path_relations.remove_entry_recursive(entry_id, 
+                                                  is_eviction=True)
 
     def get_max_cache_age_seconds(self):
         return Conf.get('cache_entries_max_age')
 
+    def get_max_cache_stale_age_seconds(self):
+        if Conf.get('cache_stale_while_revalidate') is not True:
+            return None
+
+        return max(int(Conf.get('cache_entries_max_stale_age')), 
+                   self.get_max_cache_age_seconds())
+
+    def get_max_cache_count(self):
+        return int(Conf.get('cache_entries_max_count')) or None
+
+    def get_max_cache_bytes(self):
+        return int(Conf.get('cache_entries_max_bytes')) or None
+
+    def get_cleanup_lock(self):
+        # Entries are only set while they're being registered with 
+        # PathRelations, and the pre-cleanup trigger prunes them from there.
+        return PathRelations.rlock
+
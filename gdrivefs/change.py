@@ -8,6 +8,9 @@ from gdrivefs.conf import Conf
 from gdrivefs.gdtool.account_info import AccountInfo
 from gdrivefs.gdtool.drive import get_gdrive
 from gdrivefs.cache.volume import PathRelations, EntryCache
+from gdrivefs.cache.snapshot import open_snapshot, get_snapshot
+from gdrivefs.gdtool.rate_limiter import priority, PRIORITY_BACKGROUND
+from gdrivefs.general.metrics import labels
 
 _logger = logging.getLogger(__name__)
 _logger.setLevel(logging.WARNING)
@@ -25,6 +28,7 @@ class _ChangeManager(object):
     def mount_init(self):
         """Called when filesystem is first mounted."""
 
+        self.__restore_snapshot()
         self.__start_check()
 
     def mount_destroy(self):
@@ -32,6 +36,52 @@ class _ChangeManager(object):
 
         self.__stop_check()
 
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            snapshot.stop()
+
+    def __restore_snapshot(self):
+        """Load whatever a previous mount recorded, and pick-up the changes 
+        from where it left off. Since we're only restoring when we're also 
+        processing changes, anything that changed while we weren't mounted 
+        will be corrected as we catch-up.
+        """
+
+        snapshot = open_snapshot()
+        if snapshot is None:
+            return
+
+        root_id = AccountInfo.get_instance().root_id
+
+        try:
+            (values, raw_entries, loaded_ids) = snapshot.load()
+        except:
+            _logger.exception("Could not load metadata snapshot. It will be "
+                              "rebuilt.")
+
+            values = {}
+
+        if values.get('root_id') != root_id or 'at_change_id' not in values:
+            _logger.info("Metadata snapshot is empty or is for another "
+                         "account. Starting from change-ID (%d).",
+                         self.at_change_id)
+
+            snapshot.clear()
+        else:
+            PathRelations.get_instance().restore_snapshot(
+                raw_entries, 
+                loaded_ids)
+
+            self.at_change_id = int(values['at_change_id'])
+
+            _logger.info("Restored (%d) entries from metadata snapshot. "
+                         "Catching-up from change-ID (%d).",
+                         len(raw_entries), self.at_change_id)
+
+        snapshot.set_value('root_id', root_id)
+        snapshot.set_change_id(self.at_change_id)
+        snapshot.start()
+
     def __check_changes(self):
         _logger.info("Change-processing thread running.")
 
@@ -43,11 +93,14 @@ class _ChangeManager(object):
             _logger.debug("Checking for changes.")
 
             try:
-                is_done = cm.process_updates()
+                with priority(PRIORITY_BACKGROUND), labels(op='changes'):
+                    is_done = cm.process_updates()
             except:
                 _logger.exception("Squelching an exception that occurred "
                                   "while reading/processing changes.")
 
+                self.__revoke_validity()
+
                 # Force another check, soon.
                 is_done = False
 
@@ -74,6 +127,25 @@ class _ChangeManager(object):
         self.__t_quit_ev.set()
         self.__t.join()
 
+    def __extend_validity(self):
+        """We're caught-up, so every entry that we have is current."""
+
+        if Conf.get('cache_change_feed_validity') is not True:
+            return
+
+        lease_s = int(Conf.get('cache_change_feed_lease_s'))
+        EntryCache.get_instance().cache.extend_validity(lease_s)
+
+    def __revoke_validity(self):
+        """We may be missing changes, so let the entries expire by age 
+        again.
+        """
+
+        if Conf.get('cache_change_feed_validity') is not True:
+            return
+
+        EntryCache.get_instance().cache.revoke_validity()
+
     def process_updates(self):
         """Process any changes to our files. Return True if everything is up to
         date or False if we need to be run again.
@@ -109,11 +181,21 @@ class _ChangeManager(object):
                 _logger.exception("There was a problem while processing change"
                                   " with ID (%d). No more changes will be "
                                   "applied." % (change_id))
+
+                self.__revoke_validity()
                 return False
 
             self.at_change_id = change_id
 
-        return (next_page_token is None)
+            snapshot = get_snapshot()
+            if snapshot is not None:
+                snapshot.set_change_id(change_id)
+
+        if next_page_token is None:
+            self.__extend_validity()
+            return True
+
+        return False
 
     def __apply_change(self, change_id, change_tuple):
         """Apply changes to our filesystem reported by GD. All we do is remove 
@@ -132,6 +214,11 @@ class _ChangeManager(object):
                      "and is-visible of [%s]",
                      change_id, entry_id, is_visible)
 
+        # Forget anything that we determined didn't exist in any of the 
+        # affected directories.
+
+        PathRelations.get_instance().invalidate_missing(entry_id, entry)
+
         # First, remove any current knowledge from the system.
 
         _logger.debug("Removing all trace of entry with ID [%s] "
@@ -23,20 +23,114 @@ class Conf(object):
     extension_mapping_filepath          = '/etc/gdfs/extension_mapping.json'
     query_decay_intermed_prefix_length  = 7
     file_jobthread_max_idle_time        = 60
-    file_chunk_size_kb                  = 1024
     file_download_temp_max_age_s        = 86400
     file_default_mime_type              = 'application/octet-stream'
+
+    # Downloads start with small chunks (so that the first bytes arrive 
+    # quickly) and grow them, according to the bandwidth and round-trip time 
+    # that we see, up to the maximum.
+    file_chunk_initial_size_kb          = 128
+    file_chunk_size_kb                  = 8192
+
+    # Write downloads to their files as they arrive, reading no more than this
+    # at a time, rather than holding each chunk in memory. (The blocks of 
+    # opened files are always written as they arrive.)
+    file_download_streaming             = True
+    file_download_buffer_kb             = 64
+
+    # Opened files are fetched in blocks of this size as they're read, rather 
+    # than downloaded whole when they're opened (the rest is fetched if they're
+    # written). Zero disables this.
+    file_block_size_kb                  = 1024
+
+    # While an opened file is being read sequentially, fetch up to this much 
+    # ahead of the reads, in the background. Zero disables this.
+    file_readahead_max_kb               = 8192
+
+    # Files of at least this size are downloaded as several ranges at once, 
+    # each on its own pooled connection. Zero disables this.
+    file_download_parallel_min_kb       = 32 * 1024
+    file_download_range_kb              = 16 * 1024
+    file_download_parallel_workers      = 4
+
     change_check_frequency_s            = 3
     hidden_flags_list_local             = [u'trashed', u'restricted']
     hidden_flags_list_remote            = [u'trashed']
     cache_cleanup_check_frequency_s     = 60
     cache_entries_max_age               = 8 * 60 * 60
+
     cache_status_post_frequency_s       = 10
 
+    # Bound the entry cache by count and by (approximate) size. The least-
+    # recently-used entries are evicted past these. Zero means unlimited.
+    cache_entries_max_count             = 0
+    cache_entries_max_bytes             = 0
+
+    # Rather than blocking on the server when an entry has expired, return it 
+    # and refresh it in the background, unless it's older than the maximum 
+    # stale-age.
+    cache_stale_while_revalidate        = False
+    cache_entries_max_stale_age         = 24 * 60 * 60
+    cache_refresh_workers               = 2
+
+    # Don't expire entries by age while the change-feed is being kept up with 
+    # (since every change is applied as it happens). Age-based expiry resumes 
+    # if we fall behind for longer than the lease, or if polling fails.
+    cache_change_feed_validity          = False
+    cache_change_feed_lease_s           = 60
+
+    # Persist what we know about the account so that a remount starts warm and
+    # only has to catch-up on changes. This is off unless asked for, since it 
+    # writes the metadata of the whole account to disk. Unless a path is 
+    # given, the snapshot is stored alongside the credentials file.
+    metadata_snapshot                   = False
+    metadata_snapshot_filepath          = None
+    metadata_snapshot_flush_interval_s  = 2
+
 # Deimplementing report functionality.
 #    report_emit_frequency_s             = 60
 
     google_discovery_service_url        = DISCOVERY_URI
+
+    # Where to keep our copy of the discovery document, and how long to use it
+    # before retrieving it again (an old copy is still used if the retrieval
+    # fails). Unless a path is given, it's stored alongside the credentials 
+    # file.
+    discovery_document_filepath         = None
+    discovery_document_max_age_s        = 7 * 24 * 60 * 60
+
+    # Once Drive says that we're going too fast, pace our calls with a token-
+    # bucket that all threads share, starting from the maximum rate. The rate 
+    # is cut whenever Drive says so again, and raised gradually while calls 
+    # succeed. Prefetching and change-polling wait behind anything that 
+    # somebody is waiting on.
+    api_rate_limit                      = True
+    api_rate_min_per_s                  = 1
+    api_rate_max_per_s                  = 100
+    api_rate_burst                      = 20
+    api_rate_increase_per_s             = 1
+    api_rate_decrease_factor            = 0.5
+
+    # Make a second request for a metadata read (getting an entry, looking-up
+    # a name) that's taking longer than the given percentile of recent ones,
+    # and use whichever answer arrives first. No more than the given 
+    # percentage of calls are hedged (with zero, latencies are only tracked).
+    hedge_requests                      = False
+    hedge_percentile                    = 95
+    hedge_budget_percent                = 5
+
+    # Where to export the per-call and per-operation metrics, and how often:
+    # a statsd server ("host:port"), and/or a file in the Prometheus text 
+    # format (e.g. for node_exporter's textfile collector).
+    metrics_statsd_address              = None
+    metrics_prometheus_filepath         = None
+    metrics_export_interval_s           = 10
+
+    # How many ETags (and the responses that they're for) to remember, so that
+    # repeated reads of an entry (or of the account information) can be made
+    # conditionally. Zero disables this.
+    etag_cache_max_entries              = 1000
+
     default_buffer_read_blocksize       = 65536
     default_mimetype                    = 'application/octet-stream'
     directory_mimetype                  = u'application/vnd.google-apps.folder'
@@ -44,6 +138,18 @@ class Conf(object):
     default_perm_file_editable          = '666'
     default_perm_file_noneditable       = '444'
 
+    # How many names that were found not to exist to remember, and for how 
+    # long.
+    negative_cache_max_entries          = 10000
+    negative_cache_ttl_s                = 60
+
+    # When a directory is read, list its subdirectories (down to the given 
+    # depth) in the background, ahead of a tree-walk getting to them. Zero 
+    # disables this.
+    directory_prefetch_depth            = 0
+    directory_prefetch_workers          = 2
+    directory_prefetch_max_queued       = 1000
+
     # How many extra entries to retrieve when an entry is accessed that is not
     # currently cached.
     max_readahead_entries = 10
@@ -0,0 +1,177 @@
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# The most that we'll ask for in one request, however many adjacent blocks are
+# missing.
+_MAX_FETCH_BYTES = 8 * 1024 * 1024
+
+
+class _RangeWriter(object):
+    """Writes a fetched range into place in the local file as it arrives. 
+    The file is only held for each piece, so reads of the blocks that we 
+    already have aren't held up for the whole fetch.
+    """
+
+    def __init__(self, fh, file_lock, offset):
+        self.__fh = fh
+        self.__file_lock = file_lock
+        self.__offset = offset
+
+    def write(self, data):
+        with self.__file_lock:
+            self.__fh.seek(self.__offset)
+            self.__fh.write(data)
+
+        self.__offset += len(data)
+
+    def tell(self):
+        return self.__offset
+
+
+class BlockCache(object):
+    """Keeps a sparse, local copy of a remote file, a block at a time. Blocks
+    are fetched (in runs of adjacent missing blocks) as they're read, and a
+    bitmap records which are present. Blocks that another thread is already
+    fetching are waited on rather than fetched again.
+    """
+
+    def __init__(self, fh, size, block_size, fetch, is_complete=False):
+        """`fh` is the local file (sized to `size`), and `fetch(f, offset,
+        length)` writes that range of the remote file to `f` (which starts at
+        `offset`).
+        """
+
+        self.__fh = fh
+        self.__size = size
+        self.__block_size = block_size
+        self.__fetch = fetch
+
+        num_blocks = (size + block_size - 1) // block_size
+
+        self.__present = bytearray([1 if is_complete else 0] * num_blocks)
+        self.__num_present = num_blocks if is_complete else 0
+
+        # block-index => threading.Event, set when the fetch finishes (or
+        # fails).
+        self.__in_flight = {}
+
+        self.__lock = threading.Lock()
+
+        # Serializes our seeks on the file.
+        self.__file_lock = threading.Lock()
+
+        self.__max_run = max(1, _MAX_FETCH_BYTES // block_size)
+
+    def __get_runs(self, blocks):
+        """Group ascending block-indices into runs of adjacent blocks, no
+        longer than the most that we'll fetch at once.
+        """
+
+        runs = []
+        for i in blocks:
+            if runs and runs[-1][1] == i and \
+               runs[-1][1] - runs[-1][0] < self.__max_run:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1])
+
+        return runs
+
+    def __fetch_run(self, first, last):
+        """Fetch blocks [first, last) and write them into place."""
+
+        offset = first * self.__block_size
+        length = min(last * self.__block_size, self.__size) - offset
+
+        _logger.debug("Fetching blocks (%d)-(%d): (%d) bytes at offset (%d).",
+                      first, last - 1, length, offset)
+
+        f = _RangeWriter(self.__fh, self.__file_lock, offset)
+        self.__fetch(f, offset, length)
+
+        with self.__file_lock:
+            self.__fh.flush()
+
+        if f.tell() - offset != length:
+            raise IOError("Expected (%d) bytes at offset (%d) but received "
+                          "(%d)." % (length, offset, f.tell() - offset))
+
+        with self.__lock:
+            for i in xrange(first, last):
+                self.__present[i] = 1
+                self.__num_present += 1
+                self.__in_flight.pop(i).set()
+
+    def ensure(self, offset, length):
+        """Make sure that the given range is present locally."""
+
+        end = min(offset + length, self.__size)
+        if offset >= end:
+            return
+
+        first = offset // self.__block_size
+        last = (end - 1) // self.__block_size
+
+        while 1:
+            claimed = []
+            waits = []
+
+            with self.__lock:
+                for i in xrange(first, last + 1):
+                    if self.__present[i] == 1:
+                        continue
+
+                    e = self.__in_flight.get(i)
+                    if e is not None:
+                        waits.append(e)
+                    else:
+                        self.__in_flight[i] = threading.Event()
+                        claimed.append(i)
+
+            if not claimed and not waits:
+                return
+
+            try:
+                for (run_first, run_last) in self.__get_runs(claimed):
+                    self.__fetch_run(run_first, run_last)
+            finally:
+                # Release whatever we failed to fetch, so that somebody else
+                # can try.
+                with self.__lock:
+                    for i in claimed:
+                        e = self.__in_flight.get(i)
+                        if e is not None and self.__present[i] == 0:
+                            del self.__in_flight[i]
+                            e.set()
+
+            for e in waits:
+                e.wait()
+
+            # Whatever we waited on may have failed. Check again.
+            if not waits:
+                return
+
+    def read(self, offset, length):
+        self.ensure(offset, length)
+
+        with self.__file_lock:
+            self.__fh.seek(offset)
+            return self.__fh.read(length)
+
+    def materialize(self):
+        """Fetch whatever we don't have yet."""
+
+        self.ensure(0, self.__size)
+
+    @property
+    def is_complete(self):
+        with self.__lock:
+            return self.__num_present == len(self.__present)
+
+    def get_stats(self):
+        with self.__lock:
+            return { 'blocks': len(self.__present),
+                     'present': self.__num_present,
+                     'in_flight': len(self.__in_flight) }
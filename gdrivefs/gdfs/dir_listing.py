@@ -0,0 +1,144 @@
+import logging
+import threading
+
+from gdrivefs.time_support import get_monotonic_time
+
+_logger = logging.getLogger(__name__)
+
+# How long a listing that was cut short waits to be continued before it's
+# dropped.
+_MAX_IDLE_S = 60
+
+
+class _Listing(object):
+    def __init__(self, items, offset):
+        self.items = items
+        self.offset = offset
+
+        # An item that was produced but not taken (the kernel's buffer was
+        # full).
+        self.pending = None
+
+        self.parked_at = None
+
+
+class DirectoryListings(object):
+    """Produces directory listings in installments. The kernel reads a
+    directory a buffer at a time, and asks for the rest at the offset of the
+    last entry that fit. A listing that's cut short is kept under its path and
+    that offset, so that the next installment carries on from it rather than
+    starting over (and so that the entries of a directory that is still being
+    listed reach the reader as they arrive).
+    """
+
+    def __init__(self, max_idle_s=_MAX_IDLE_S):
+        self.__max_idle_s = max_idle_s
+
+        self.__lock = threading.Lock()
+
+        # (path, offset) => _Listing
+        self.__parked = {}
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__parked)
+
+    def __expire(self, now):
+        """Remove the listings that haven't been continued in time. Return
+        them, so that they can be closed outside of the lock.
+        """
+
+        expired = []
+        for key, listing in self.__parked.items():
+            if now - listing.parked_at > self.__max_idle_s:
+                del self.__parked[key]
+                expired.append(listing)
+
+        return expired
+
+    def __close(self, listings):
+        for listing in listings:
+            try:
+                listing.items.close()
+            except:
+                _logger.exception("Could not close abandoned listing.")
+
+    def __take(self, path, offset):
+        """Return the listing that was cut short at the given offset, if 
+        any. A listing is always started over at zero.
+        """
+
+        with self.__lock:
+            listing = None
+            if offset > 0:
+                listing = self.__parked.pop((path, offset), None)
+
+            expired = self.__expire(get_monotonic_time())
+
+        self.__close(expired)
+        return listing
+
+    def __park(self, path, listing):
+        key = (path, listing.offset)
+        listing.parked_at = get_monotonic_time()
+
+        with self.__lock:
+            replaced = self.__parked.pop(key, None)
+            self.__parked[key] = listing
+
+            expired = self.__expire(listing.parked_at)
+
+        if replaced is not None:
+            expired.append(replaced)
+
+        self.__close(expired)
+
+    def produce(self, path, offset, build_items):
+        """Produce (name, stat, offset) tuples from `offset` onward. If a
+        listing was cut short there, it's continued. Otherwise,
+        `build_items()` is called for a generator of (name, stat) tuples for
+        the whole directory, and the first `offset` of them are skipped.
+        """
+
+        listing = self.__take(path, offset)
+
+        if listing is None:
+            if offset > 0:
+                _logger.debug("Listing of [%s] at offset (%d) is not being "
+                              "continued. Starting over.", path, offset)
+
+            items = build_items()
+
+            for i in xrange(offset):
+                try:
+                    next(items)
+                except StopIteration:
+                    return
+
+            listing = _Listing(items, offset)
+
+        is_parked = False
+
+        try:
+            while 1:
+                if listing.pending is None:
+                    try:
+                        listing.pending = next(listing.items)
+                    except StopIteration:
+                        break
+
+                (name, stat_result) = listing.pending
+                yield (name, stat_result, listing.offset + 1)
+
+                listing.pending = None
+                listing.offset += 1
+        except GeneratorExit:
+            # The reader stopped before we were done (the last item that we
+            # produced didn't fit). Keep the rest for the next installment.
+            self.__park(path, listing)
+            is_parked = True
+
+            raise
+        finally:
+            if is_parked is False:
+                listing.items.close()
@@ -1,14 +1,56 @@
 import logging
 import re
+import types
 import fuse
 
 from os.path import split
 from fuse import FuseOSError, fuse_get_context
 
 from gdrivefs.errors import GdNotFoundError
+from gdrivefs.general.metrics import get_metrics, labels
+from gdrivefs.time_support import get_monotonic_time
 
 _logger = logging.getLogger(__name__)
 
+def _record_op(op, started_at, e=None):
+    metrics = get_metrics()
+
+    metrics.increment('fuse_ops_total', op=op)
+    metrics.observe('fuse_op_seconds', get_monotonic_time() - started_at, 
+                    op=op)
+
+    if e is not None:
+        errno = e.errno if isinstance(e, FuseOSError) else 0
+        metrics.increment('fuse_errors_total', op=op, errno=errno)
+
+def _measure_generator(op, g):
+    """Label and time the production of a generator's items (e.g. readdir),
+    rather than just its creation.
+    """
+
+    started_at = get_monotonic_time()
+
+    try:
+        while 1:
+            # Only label the production of each item; our consumer runs 
+            # between them.
+            with labels(op=op):
+                try:
+                    item = next(g)
+                except StopIteration:
+                    break
+
+            yield item
+    except GeneratorExit:
+        g.close()
+        _record_op(op, started_at)
+        raise
+    except Exception as e:
+        _record_op(op, started_at, e)
+        raise
+
+    _record_op(op, started_at)
+
 def dec_hint(argument_names=[], excluded=[], prefix='', otherdata_cb=None):
     """A decorator for the calling of functions to be emphasized in the 
     logging. Displays prefix and suffix information in the logs.
@@ -67,9 +109,22 @@ def dec_hint(argument_names=[], excluded=[], prefix='', otherdata_cb=None):
 
             suffix = ''
 
+            # What's done on Drive's side is labeled with the operation that 
+            # it was done for.
+            op = f.__name__
+            started_at = get_monotonic_time()
+            is_generator = False
+
             try:
-                result = f(*args, **kwargs)
+                with labels(op=op):
+                    result = f(*args, **kwargs)
+
+                if isinstance(result, types.GeneratorType):
+                    is_generator = True
+                    result = _measure_generator(op, result)
             except FuseOSError as e:
+                _record_op(op, started_at, e)
+
                 if e.errno not in (fuse.ENOENT,):
                     _logger.error("FUSE error [%s] (%s) will be forwarded "
                                   "back to GDFS from [%s]: %s", 
@@ -77,9 +132,13 @@ def dec_hint(argument_names=[], excluded=[], prefix='', otherdata_cb=None):
                                   str(e))
                 raise
             except Exception as e:
+                _record_op(op, started_at, e)
                 _logger.exception("There was an exception in [%s]", f.__name__)
                 suffix = (' (E(%s): "%s")' % (e.__class__.__name__, str(e)))
                 raise
+            else:
+                if is_generator is False:
+                    _record_op(op, started_at)
             finally:
                 _logger.debug("%s<<<<<<<<<< %s(%d) (%d)%s", 
                               prefix, f.__name__, sn, pid, suffix)
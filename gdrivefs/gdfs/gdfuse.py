@@ -10,7 +10,7 @@ import pprint
 
 from errno import ENOENT, EIO, ENOTDIR, ENOTEMPTY, EPERM, EEXIST
 from fuse import FUSE, Operations, FuseOSError, c_statvfs, fuse_get_context, \
-                 LoggingMixIn
+                 LoggingMixIn, c_stat, set_st_attrs
 from time import mktime, time
 from sys import argv, exit, excepthook
 from mimetypes import guess_type
@@ -35,7 +35,15 @@ from gdrivefs.gdtool.account_info import AccountInfo
 from gdrivefs.gdfs.fsutility import strip_export_type, split_path,\
                                     build_filepath, dec_hint
 from gdrivefs.gdfs.displaced_file import DisplacedFile
+from gdrivefs.gdfs.dir_listing import DirectoryListings
 from gdrivefs.cache.volume import path_resolver
+from gdrivefs.cache.prefetch import get_prefetcher
+from gdrivefs.gdtool.drive import get_coalescing_stats
+from gdrivefs.gdtool.rate_limiter import get_rate_limiter
+from gdrivefs.gdtool.etag_cache import get_etag_cache
+from gdrivefs.gdtool.hedging import get_hedger
+from gdrivefs.general.metrics import get_metrics, start_exporter, \
+                                     stop_exporter
 from gdrivefs.errors import GdNotFoundError
 from gdrivefs.time_support import get_flat_normal_fs_time_from_epoch
 
@@ -49,6 +57,29 @@ _logger = logging.getLogger(__name__)
 def set_datetime_tz(datetime_obj, tz):
     return datetime_obj.replace(tzinfo=tz)
 
+def _register_metrics_collectors():
+    """Have the statistics that our components keep exported along with 
+    our metrics.
+    """
+
+    metrics = get_metrics()
+
+    metrics.register_collector('coalescing', get_coalescing_stats, 
+                               label_name='method')
+    metrics.register_collector('entry_cache', 
+                               EntryCache.get_instance().cache.get_stats)
+    metrics.register_collector('negative_cache', 
+                               PathRelations.get_instance().get_missing_stats)
+    metrics.register_collector('http_pool', get_gdrive().get_http_pool_stats)
+    metrics.register_collector('rate_limiter', get_rate_limiter().get_stats)
+    metrics.register_collector('etag_cache', get_etag_cache().get_stats)
+    metrics.register_collector('prefetch', get_prefetcher().get_stats)
+
+    hedger = get_hedger()
+    if hedger is not None:
+        metrics.register_collector('hedging', hedger.get_stats, 
+                                   label_name='method')
+
 def get_entry_or_raise(raw_path, allow_normal_for_missing=False):
     try:
         result = split_path(raw_path, path_resolver)
@@ -95,6 +126,10 @@ def get_entry_or_raise(raw_path, allow_normal_for_missing=False):
     return (entry_clause[CLAUSE_ENTRY], path, filename)
 
 
+# Listings that the kernel will ask us to continue.
+_listings = DirectoryListings()
+
+
 class _GdfsMixin(object):
     """The main filesystem class."""
 
@@ -173,16 +208,10 @@ class _GdfsMixin(object):
 
     @dec_hint(['path', 'offset'])
     def readdir(self, path, offset):
-        """A generator returning one base filename at a time."""
-
-        # We expect "offset" to always be (0).
-        if offset != 0:
-            _logger.warning("readdir() has been invoked for path [%s] and "
-                            "non-zero offset (%d). This is not allowed.",
-                            path, offset)
-
-# TODO: Once we start working on the cache, make sure we don't make this call, 
-#       constantly.
+        """Return a generator of the entries of the directory from the given 
+        offset onward. The kernel takes them a buffer at a time, so a reader 
+        sees the first entries of a directory that is still being listed.
+        """
 
         path_relations = PathRelations.get_instance()
 
@@ -199,28 +228,45 @@ class _GdfsMixin(object):
         if not entry_clause:
             raise FuseOSError(ENOENT)
 
-        try:
-            entry_tuples = path_relations.get_children_entries_from_entry_id \
-                            (entry_clause[CLAUSE_ID])
-        except:
-            _logger.exception("Could not render list of filenames under path "
-                              "[%s].", path)
+        def build_items():
+            # If the children haven't been loaded, they're produced as each 
+            # page of the listing arrives.
+            entry_tuples = \
+                path_relations.iterate_children_entries_from_entry_id(
+                    entry_clause[CLAUSE_ID])
 
-            raise FuseOSError(EIO)
+            yield (utility.translate_filename_charset('.'), None)
+            yield (utility.translate_filename_charset('..'), None)
 
-        yield utility.translate_filename_charset('.')
-        yield utility.translate_filename_charset('..')
+            subdirectories = []
 
-        for (filename, entry) in entry_tuples:
+            try:
+                for (filename, entry) in entry_tuples:
+                    if entry.is_directory:
+                        subdirectories.append((filename, entry.id))
 
-            # Decorate any file that -requires- a mime-type (all files can 
-            # merely accept a mime-type)
-            if entry.requires_mimetype:
-                filename += utility.translate_filename_charset('#')
-        
-            yield (filename,
-                   self.__build_stat_from_entry(entry),
-                   0)
+                    # Decorate any file that -requires- a mime-type (all files
+                    # can merely accept a mime-type)
+                    if entry.requires_mimetype:
+                        filename += utility.translate_filename_charset('#')
+
+                    yield (filename, self.__build_stat_from_entry(entry))
+            except GeneratorExit:
+                raise
+            except:
+                _logger.exception("Could not render list of filenames under "
+                                  "path [%s].", path)
+
+                raise FuseOSError(EIO)
+            finally:
+                entry_tuples.close()
+
+            # Get a head-start on the directories that a tree-walk will read 
+            # next.
+            (uid, gid, pid) = fuse_get_context()
+            get_prefetcher().notify_listed(pid, path, subdirectories)
+
+        return _listings.produce(path, offset, build_items)
 
     @dec_hint(['raw_path', 'length', 'offset', 'fh'])
     def read(self, raw_path, length, offset, fh):
@@ -790,6 +836,9 @@ class _GdfsMixin(object):
         else:
             _logger.warning("We were told not to monitor changes.")
 
+        _register_metrics_collectors()
+        start_exporter()
+
     @dec_hint(['path'])
     def destroy(self, path):
         """Called on filesystem destruction. Path is always /."""
@@ -798,16 +847,37 @@ class _GdfsMixin(object):
             _logger.info("Stopping change-monitor.")
             get_change_manager().mount_destroy()
 
+        stop_exporter()
+
+    def __load_full_raw_data(self, entry):
+        """We only retrieve the fields that we need, so go and get the rest 
+        before the original data is listed or read.
+        """
+
+        if entry.has_full_raw_data is True:
+            return
+
+        try:
+            entry.set_full_raw_data(get_gdrive().get_entry_raw(entry.id))
+        except:
+            _logger.exception("Could not retrieve the complete resource "
+                              "for entry with ID [%s].", entry.id)
+
     @dec_hint(['path'])
     def listxattr(self, raw_path):
         (entry, path, filename) = get_entry_or_raise(raw_path)
 
+        self.__load_full_raw_data(entry)
+
         return entry.xattr_data.keys()
 
     @dec_hint(['path', 'name', 'position'])
     def getxattr(self, raw_path, name, position=0):
         (entry, path, filename) = get_entry_or_raise(raw_path)
 
+        if name.startswith('user.original.'):
+            self.__load_full_raw_data(entry)
+
         try:
             return entry.xattr_data[name] + "\n"
         except:
@@ -820,6 +890,31 @@ else:
     class GDriveFS(_GdfsMixin, Operations):
         pass
 
+
+class _GdfsFUSE(FUSE):
+    """fusepy hands readdir() the file-handle rather than the offset that the
+    kernel wants the listing continued from, so a directory could only be
+    returned whole. We pass the offset instead (we don't use directory 
+    handles).
+    """
+
+    def readdir(self, path, buf, filler, offset, fip):
+        for item in self.operations('readdir', path.decode(self.encoding), 
+                                    offset):
+            (name, attrs, item_offset) = item
+
+            if attrs:
+                st = c_stat()
+                set_st_attrs(st, attrs)
+            else:
+                st = None
+
+            # This is non-zero once the kernel's buffer is full.
+            if filler(buf, name.encode(self.encoding), st, item_offset) != 0:
+                break
+
+        return 0
+
 def mount(auth_storage_filepath, mountpoint, debug=None, nothreads=None, 
           option_string=None):
 
@@ -890,7 +985,7 @@ def mount(auth_storage_filepath, mountpoint, debug=None, nothreads=None,
     # Make sure we can connect.
     gdrivefs.gdtool.account_info.AccountInfo().get_data()
 
-    fuse = FUSE(
+    fuse = _GdfsFUSE(
             GDriveFS(), 
             mountpoint, 
             debug=debug, 
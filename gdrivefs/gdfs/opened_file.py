@@ -5,6 +5,7 @@ import os
 import tempfile
 import shutil
 import threading
+import time
 
 import fuse
 
@@ -18,6 +19,8 @@ from gdrivefs.cache.volume import PathRelations, EntryCache, path_resolver, \
                                   CLAUSE_ID, CLAUSE_ENTRY
 from gdrivefs.gdtool.drive import get_gdrive
 from gdrivefs.general.buffer_segments import BufferSegments
+from gdrivefs.gdfs.block_cache import BlockCache
+from gdrivefs.gdfs.readahead import Readahead
 
 _logger = logging.getLogger(__name__)
 
@@ -203,9 +206,14 @@ class OpenedFile(object):
 
         self.__fh = None
 
-        # We need to load this up-front. Since we can't do partial updates, we 
-        # have to keep one whole, local copy, apply updates to it, and then 
-        # post it on flush.
+        # If set, the file is fetched block-by-block as it's read.
+        self.__blocks = None
+        self.__readahead = None
+
+        # Since we can't do partial updates, we have to keep one whole, local 
+        # copy, apply updates to it, and then post it on flush. Where we can, 
+        # we only fetch the parts that are read, and only fetch the rest when 
+        # something is written.
 # TODO(dustin): Until we finish working on the download-agent so that we can 
 #               have a way to orchestrate concurrent handles on the same file, 
 #               we'll just have to accept the fact that concurrent access will 
@@ -278,6 +286,8 @@ class OpenedFile(object):
 
             self.__fh = open(self.__temp_filepath, 'w+')
             self.__fh.write(stub_data)
+        elif self.__is_lazy(entry) is True:
+            self.__open_sparse(entry)
         else:
             _logger.debug("Executing the download: [%s] => [%s]", 
                           entry.id, self.__temp_filepath)
@@ -309,6 +319,91 @@ class OpenedFile(object):
         _logger.debug("Established base file-data for [%s]: [%s]", 
                       entry, self.__temp_filepath)
 
+    def __is_lazy(self, entry):
+        """Return True if we can fetch the given entry in parts. Exports have 
+        to be downloaded whole.
+        """
+
+        return int(Conf.get('file_block_size_kb')) > 0 and \
+               self.mime_type == entry.mime_type and \
+               self.mime_type in entry.download_links
+
+    def __get_mtime_epoch(self, entry):
+        return time.mktime(entry.modified_date.timetuple())
+
+    def __open_sparse(self, entry):
+        """Set up a local file to be filled-in as it's read. If a complete 
+        copy from an earlier download is still current, it's used as-is.
+        """
+
+        gd_mtime_epoch = self.__get_mtime_epoch(entry)
+
+        try:
+            st = os.stat(self.__temp_filepath)
+        except OSError:
+            is_complete = False
+        else:
+            is_complete = st.st_mtime == gd_mtime_epoch and \
+                          st.st_size == entry.file_size
+
+        if is_complete is True:
+            _logger.info("Using the still-current local copy of [%s].", 
+                         entry.id)
+
+            self.__fh = open(self.__temp_filepath, 'r+')
+        else:
+            _logger.info("Entry [%s] will be fetched as it's read.", entry.id)
+
+            self.__fh = open(self.__temp_filepath, 'w+')
+            self.__fh.truncate(entry.file_size)
+
+        def fetch(f, offset, length):
+            gd = get_gdrive()
+            gd.download_range(entry, self.mime_type, f, offset, length)
+
+        block_size = int(Conf.get('file_block_size_kb')) * 1024
+        self.__blocks = BlockCache(
+                            self.__fh, 
+                            entry.file_size, 
+                            block_size, 
+                            fetch, 
+                            is_complete=is_complete)
+
+        max_readahead_b = int(Conf.get('file_readahead_max_kb')) * 1024
+        if is_complete is False and max_readahead_b > 0:
+            self.__readahead = Readahead(
+                                self.__blocks, 
+                                entry.file_size, 
+                                min(block_size, max_readahead_b), 
+                                max_readahead_b)
+
+        self.__gd_mtime_epoch = gd_mtime_epoch
+        self.__is_dirty = False
+        self.__is_loaded = is_complete
+
+    def __check_loaded(self):
+        """If the last of the blocks has arrived, date the file so that it 
+        can be reused by later opens.
+        """
+
+        if self.__is_loaded is False and self.__blocks.is_complete is True:
+            os.utime(self.__temp_filepath, 
+                     (time.time(), self.__gd_mtime_epoch))
+
+            self.__is_loaded = True
+
+    def __materialize(self):
+        """Make sure that we have the whole file, before it's changed."""
+
+        if self.__blocks is None or self.__is_loaded is True:
+            return
+
+        _logger.info("Fetching the rest of [%s] before it's written.", 
+                     self.__entry_id)
+
+        self.__blocks.materialize()
+        self.__check_loaded()
+
     @dec_hint(['offset', 'data'], ['data'], 'OF')
     def add_update(self, offset, data):
         """Queue an update to this file."""
@@ -316,6 +411,8 @@ class OpenedFile(object):
         _logger.debug("Applying update for offset (%d) and length (%d).",
                       offset, len(data))
 
+        self.__materialize()
+
         self.__is_dirty = True
         self.__fh.seek(offset)
         self.__fh.write(data)
@@ -377,8 +474,15 @@ class OpenedFile(object):
 
         st = os.stat(self.__temp_filepath)
 
-        self.__fh.seek(offset)
-        data = self.__fh.read(length)
+        if self.__blocks is not None:
+            data = self.__blocks.read(offset, length)
+            self.__check_loaded()
+
+            if self.__readahead is not None and self.__is_loaded is False:
+                self.__readahead.notify_read(offset, len(data))
+        else:
+            self.__fh.seek(offset)
+            data = self.__fh.read(length)
 
         len_ = len(data)
 
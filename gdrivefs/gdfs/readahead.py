@@ -0,0 +1,82 @@
+import logging
+import threading
+
+from gdrivefs.gdtool.rate_limiter import priority, PRIORITY_PREFETCH
+from gdrivefs.general.metrics import get_metrics, labels
+
+_logger = logging.getLogger(__name__)
+
+# How far a read may be from where the last one ended and still count as
+# sequential. The kernel may issue a stream's reads a little out of order.
+_SEQUENTIAL_SLACK_B = 128 * 1024
+
+
+class Readahead(object):
+    """Watches the reads on one handle and, while they're sequential, fetches
+    ahead of them in the background. The window doubles with every sequential
+    read, up to a maximum, and collapses on a random one.
+    """
+
+    def __init__(self, blocks, size, initial_window_b, max_window_b):
+        self.__blocks = blocks
+        self.__size = size
+        self.__initial_window_b = initial_window_b
+        self.__max_window_b = max_window_b
+
+        self.__lock = threading.Lock()
+
+        self.__next_offset = None
+        self.__window_b = 0
+        self.__is_running = False
+
+    def __is_sequential(self, offset):
+        return self.__next_offset is not None and \
+               abs(offset - self.__next_offset) <= _SEQUENTIAL_SLACK_B
+
+    def __fetch(self, offset, length):
+        try:
+            with priority(PRIORITY_PREFETCH), labels(op='readahead'):
+                self.__blocks.ensure(offset, length)
+        except:
+            _logger.exception("Readahead of (%d) bytes at offset (%d) "
+                              "failed.", length, offset)
+        finally:
+            with self.__lock:
+                self.__is_running = False
+
+    def notify_read(self, offset, length):
+        """A read was served. Fetch ahead of it, if it looks like part of a
+        stream.
+        """
+
+        with self.__lock:
+            if self.__is_sequential(offset) is True:
+                self.__window_b = min(self.__max_window_b,
+                                      max(self.__initial_window_b,
+                                          self.__window_b * 2))
+            else:
+                self.__window_b = 0
+
+            start = offset + length
+            self.__next_offset = start
+
+            if self.__window_b == 0 or self.__is_running is True or \
+               start >= self.__size:
+                return
+
+            self.__is_running = True
+            window_b = self.__window_b
+
+        _logger.debug("Reading ahead (%d) bytes at offset (%d).", window_b,
+                      start)
+
+        get_metrics().increment('file_readahead_total')
+
+        t = threading.Thread(target=self.__fetch, args=(start, window_b))
+        t.daemon = True
+        t.start()
+
+    @property
+    def window_b(self):
+        with self.__lock:
+            return self.__window_b
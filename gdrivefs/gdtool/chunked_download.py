@@ -1,15 +1,127 @@
 import logging
 import time
 import random
+import threading
+import sys
+import Queue
 
+from collections import deque
+
+import six
 import oauth2client
 import apiclient.http
 import apiclient.errors
 
+from gdrivefs.general.metrics import get_metrics, get_labels, labels
+from gdrivefs.time_support import get_monotonic_time
+from gdrivefs.gdtool.streaming_http import StreamingHttp
+
 DEFAULT_CHUNK_SIZE = 1024 * 512
+DEFAULT_RANGE_SIZE = 1024 * 1024 * 16
+DEFAULT_NUM_WORKERS = 4
+DEFAULT_NUM_RETRIES = 5
+
+# Size chunks so that the round-trip is no more than this fraction of each 
+# request.
+_CHUNK_RTT_OVERHEAD = 0.1
+
+# How many of the most recent chunks we estimate from.
+_CHUNK_SAMPLES = 16
 
 _logger = logging.getLogger(__name__)
 
+
+class ChunkSizer(object):
+    """Chooses the size of each chunk of a download. We start small, so 
+    that the first bytes arrive quickly, and grow (at most doubling each time) 
+    toward the size at which the round-trip is a small part of each request, 
+    given the bandwidth and round-trip time that we've observed. We halve after
+    an error.
+    """
+
+    def __init__(self, initial_size, max_size):
+        self.__min_size = min(initial_size, max_size)
+        self.__max_size = max_size
+        self.__size = self.__min_size
+
+        # (size, elapsed), for the most recent chunks.
+        self.__samples = deque(maxlen=_CHUNK_SAMPLES)
+
+        self.__rtt_s = None
+        self.__bandwidth_bps = None
+
+    def __set_size(self, size):
+        size = int(max(self.__min_size, min(self.__max_size, size)))
+        if size != self.__size:
+            _logger.debug("Chunk-size changing from (%d) to (%d). RTT=(%s) "
+                          "BANDWIDTH=(%s)", 
+                          self.__size, size, self.__rtt_s, 
+                          self.__bandwidth_bps)
+
+            get_metrics().increment(
+                'download_chunk_resizes_total', 
+                direction=('up' if size > self.__size else 'down'))
+
+            self.__size = size
+
+    def __estimate(self):
+        """Fit elapsed = RTT + size / bandwidth to the recent chunks. We can
+        only do this once they vary in size.
+        """
+
+        n = len(self.__samples)
+        mean_size = sum([size_b for (size_b, elapsed_s)
+                                in self.__samples]) / float(n)
+        mean_elapsed_s = sum([elapsed_s for (size_b, elapsed_s)
+                                        in self.__samples]) / float(n)
+
+        variance = sum([(size_b - mean_size) ** 2
+                        for (size_b, elapsed_s)
+                        in self.__samples])
+
+        if variance == 0:
+            return
+
+        covariance = sum([(size_b - mean_size) * (elapsed_s - mean_elapsed_s)
+                          for (size_b, elapsed_s)
+                          in self.__samples])
+
+        s_per_b = covariance / variance
+        if s_per_b <= 0:
+            return
+
+        self.__bandwidth_bps = 1.0 / s_per_b
+        self.__rtt_s = max(0.0, mean_elapsed_s - s_per_b * mean_size)
+
+    def on_chunk(self, size_b, elapsed_s):
+        self.__samples.append((size_b, elapsed_s))
+        self.__estimate()
+
+        if self.__bandwidth_bps is None:
+            # We can't tell the transfer from the round-trip, yet.
+            target = self.__size * 2
+        else:
+            target = self.__bandwidth_bps * self.__rtt_s * \
+                     (1 - _CHUNK_RTT_OVERHEAD) / _CHUNK_RTT_OVERHEAD
+
+        self.__set_size(min(target, self.__size * 2))
+
+    def on_error(self):
+        self.__set_size(self.__size // 2)
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def bandwidth_bps(self):
+        return self.__bandwidth_bps
+
+    @property
+    def rtt_s(self):
+        return self.__rtt_s
+
+
 # TODO(Dustin): Refactor this to be nice. It's largely just copy+pasted.
 
 
@@ -20,22 +132,31 @@ class ChunkedDownload(object):
     """
 
     @oauth2client.util.positional(4)
-    def __init__(self, fd, http, uri, chunksize=DEFAULT_CHUNK_SIZE, start_at=0):
+    def __init__(self, fd, http, uri, chunksize=DEFAULT_CHUNK_SIZE, start_at=0,
+                 end_at=None, chunk_sizer=None):
         """Constructor.
 
         Args:
           fd: io.Base or file object, The stream in which to write the downloaded
             bytes.
-          http: The httplib2 resource.
+          http: The httplib2 resource, or a StreamingHttp (to write the
+            chunks to `fd` as they arrive rather than reading them whole).
           uri: The URL to be downloaded.
           chunksize: int, File will be downloaded in chunks of this many bytes.
+          start_at: int, The offset to start downloading from.
+          end_at: int, The last offset to download (inclusive), or None for
+            the rest of the file.
+          chunk_sizer: ChunkSizer, Chooses the size of each chunk (rather than
+            `chunksize`).
         """
 
         self._fd = fd
         self._http = http
         self._uri = uri
         self._chunksize = chunksize
+        self._chunk_sizer = chunk_sizer
         self._progress = start_at
+        self._end_at = end_at
         self._total_size = None
         self._done = False
 
@@ -63,9 +184,16 @@ class ChunkedDownload(object):
           httplib2.HttpLib2Error if a transport error has occured.
         """
 
+        chunksize = self._chunksize
+        if self._chunk_sizer is not None:
+            chunksize = self._chunk_sizer.size
+
+        last = self._progress + chunksize
+        if self._end_at is not None:
+            last = min(last, self._end_at)
+
         headers = {
-            'range': 'bytes=%d-%d' % (
-                self._progress, self._progress + self._chunksize)
+            'range': 'bytes=%d-%d' % (self._progress, last)
             }
 
         for retry_num in xrange(num_retries + 1):
@@ -78,22 +206,54 @@ class ChunkedDownload(object):
                                 "following status: %d", 
                                 retry_num, self._uri, resp.status)
 
-            resp, content = self._http.request(self._uri, headers=headers)
+            started_at = get_monotonic_time()
+
+            try:
+                if isinstance(self._http, StreamingHttp) is True:
+                    (resp, content, received_size_b) = \
+                        self._http.stream(self._uri, headers, self._fd)
+                else:
+                    resp, content = self._http.request(self._uri, 
+                                                       headers=headers)
+
+                    received_size_b = len(content)
+            except:
+                if self._chunk_sizer is not None:
+                    self._chunk_sizer.on_error()
+
+                raise
+
+            elapsed_s = get_monotonic_time() - started_at
+
             if resp.status < 500:
                 break
 
-        _logger.debug("Received chunk of size (%d).", len(content))
+            if self._chunk_sizer is not None:
+                self._chunk_sizer.on_error()
+
+        _logger.debug("Received chunk of size (%d) in (%.3f) seconds.", 
+                      received_size_b, elapsed_s)
 
         if resp.status in [200, 206]:
+            metrics = get_metrics()
+            metrics.increment('download_chunks_total')
+            metrics.increment('download_chunk_bytes_total', received_size_b)
+            metrics.observe('download_chunk_seconds', elapsed_s)
+
+            if self._chunk_sizer is not None:
+                self._chunk_sizer.on_chunk(received_size_b, elapsed_s)
+
             try:
                 if resp['content-location'] != self._uri:
                     self._uri = resp['content-location']
             except KeyError:
                 pass
 
-            received_size_b = len(content)
             self._progress += received_size_b
-            self._fd.write(content)
+
+            # If it was streamed, it's already been written.
+            if content is not None:
+                self._fd.write(content)
 
             # This seems to be the most correct method to get the filesize, but 
             # we've seen it not exist.
@@ -137,7 +297,8 @@ class ChunkedDownload(object):
             _logger.debug("Checking if done. PROGRESS=(%d) TOTAL-SIZE=(%d)", 
                           self._progress, self._total_size)
 
-            if self._progress == self._total_size:
+            if self._progress == self._total_size or \
+               self._end_at is not None and self._progress > self._end_at:
                 self._done = True
 
             return (apiclient.http.MediaDownloadProgress(
@@ -147,3 +308,162 @@ class ChunkedDownload(object):
                     self._total_size)
         else:
             raise apiclient.errors.HttpError(resp, content, uri=self._uri)
+
+
+class ParallelDownload(object):
+    """Download a file of known size as several ranges at once, each over its
+    own connection, writing each into place in a preallocated (sparse) file.
+    A range that fails is retried from where it got to, without disturbing the
+    others.
+    """
+
+    def __init__(self, filepath, borrow_http, uri, total_size, 
+                 range_size=DEFAULT_RANGE_SIZE, num_workers=DEFAULT_NUM_WORKERS, 
+                 chunksize=DEFAULT_CHUNK_SIZE, num_retries=DEFAULT_NUM_RETRIES, 
+                 initial_chunksize=None):
+        """Constructor.
+
+        Args:
+          filepath: str, The file to write to.
+          borrow_http: callable, Returns a context-manager that lends a
+            connection.
+          uri: The URL to be downloaded.
+          total_size: int, The size of the file.
+          range_size: int, The file is split into ranges of this many bytes.
+          num_workers: int, How many ranges to download at once.
+          chunksize: int, Each range is requested in chunks of this many
+            bytes.
+          num_retries: int, How many times to retry each range.
+          initial_chunksize: int, If given, each connection starts with chunks
+            of this many bytes and adapts them, up to `chunksize`.
+        """
+
+        self._filepath = filepath
+        self._borrow_http = borrow_http
+        self._uri = uri
+        self._total_size = total_size
+        self._range_size = range_size
+        self._num_workers = num_workers
+        self._chunksize = chunksize
+        self._num_retries = num_retries
+        self._initial_chunksize = initial_chunksize
+
+        self._failed_ev = threading.Event()
+
+        # Stubs for testing.
+        self._sleep = time.sleep
+        self._rand = random.random
+
+    def _is_retriable(self, e):
+        if isinstance(e, apiclient.errors.HttpError):
+            return e.resp.status >= 500 or e.resp.status == 429
+
+        return True
+
+    def _download_range(self, f, start, end, chunk_sizer):
+        """Download bytes [start, end] into place, retrying from wherever a
+        failed attempt got to.
+        """
+
+        offset = start
+        retry_num = 0
+
+        while 1:
+            try:
+                with self._borrow_http() as http:
+                    f.seek(offset)
+                    downloader = ChunkedDownload(
+                                    f, 
+                                    http, 
+                                    self._uri, 
+                                    chunksize=self._chunksize, 
+                                    start_at=offset, 
+                                    end_at=end, 
+                                    chunk_sizer=chunk_sizer)
+
+                    while 1:
+                        (status, done, total_size) = downloader.next_chunk()
+                        if done is True:
+                            return
+
+                        if f.tell() == offset:
+                            raise IOError("No data was received for the "
+                                          "range at offset (%d)." % (offset,))
+
+                        offset = f.tell()
+                        retry_num = 0
+            except Exception as e:
+                offset = f.tell()
+
+                if retry_num >= self._num_retries or \
+                   self._is_retriable(e) is False or \
+                   self._failed_ev.is_set() is True:
+                    raise
+
+                retry_num += 1
+
+                _logger.warning("Retry #%d for range (%d)-(%d) of [%s] from "
+                                "offset (%d): %s", 
+                                retry_num, start, end, self._uri, offset, 
+                                str(e))
+
+                self._sleep(self._rand() * 2**retry_num)
+
+    def _work(self, ranges, errors, labels_):
+        # What we learn about the connection carries over between ranges.
+        chunk_sizer = None
+        if self._initial_chunksize is not None:
+            chunk_sizer = ChunkSizer(self._initial_chunksize, self._chunksize)
+
+        with labels(**labels_), open(self._filepath, 'r+b') as f:
+            while self._failed_ev.is_set() is False:
+                try:
+                    (start, end) = ranges.get_nowait()
+                except Queue.Empty:
+                    return
+
+                _logger.debug("Downloading range (%d)-(%d).", start, end)
+
+                try:
+                    self._download_range(f, start, end, chunk_sizer)
+                except:
+                    errors.append(sys.exc_info())
+                    self._failed_ev.set()
+
+    def download(self):
+        """Download the whole file. Raise the first error that a range 
+        couldn't recover from.
+        """
+
+        # Preallocate, sparsely.
+        with open(self._filepath, 'wb') as f:
+            f.truncate(self._total_size)
+
+        ranges = Queue.Queue()
+        for start in xrange(0, self._total_size, self._range_size):
+            end = min(start + self._range_size, self._total_size) - 1
+            ranges.put((start, end))
+
+        num_workers = min(self._num_workers, ranges.qsize())
+
+        _logger.info("Downloading (%d) bytes as (%d) ranges with (%d) "
+                     "workers.", 
+                     self._total_size, ranges.qsize(), num_workers)
+
+        errors = []
+        labels_ = get_labels()
+
+        threads = []
+        for i in xrange(num_workers):
+            t = threading.Thread(target=self._work, 
+                                 args=(ranges, errors, labels_))
+            t.daemon = True
+            t.start()
+
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+        if errors:
+            six.reraise(*errors[0])
@@ -0,0 +1,143 @@
+import logging
+import json
+import time
+import os
+import os.path
+import tempfile
+
+import uritemplate
+
+from apiclient.discovery import build_from_document
+from apiclient.errors import HttpError
+
+from gdrivefs.conf import Conf
+
+_logger = logging.getLogger(__name__)
+
+# Increment this whenever the format of what we store changes. A document
+# stored with a different version is ignored (and replaced).
+_FORMAT_VERSION = 1
+
+def get_document_filepath():
+    filepath = Conf.get('discovery_document_filepath')
+    if filepath is None:
+        filepath = ('%s.discovery' % (Conf.get('auth_cache_filepath'),))
+
+    return os.path.abspath(filepath)
+
+def _fetch(http, service_name, version, discovery_url):
+    url = uritemplate.expand(discovery_url, { 'api': service_name,
+                                              'apiVersion': version })
+
+    _logger.info("Retrieving discovery document: [%s]", url)
+
+    (response, content) = http.request(url)
+
+    if response.status >= 400:
+        raise HttpError(response, content, uri=url)
+
+    # Make sure that it's usable before we keep it.
+    _check_document(json.loads(content), service_name, version)
+
+    return content
+
+def _check_document(document, service_name, version):
+    if document.get('name') != service_name or \
+       document.get('version') != version:
+        raise ValueError("Discovery document is for [%s] [%s] rather than "
+                         "[%s] [%s]." % (document.get('name'),
+                                         document.get('version'),
+                                         service_name, version))
+
+def _load(filepath, service_name, version, discovery_url):
+    """Return a 2-tuple of the stored document and when it was retrieved, or
+    None if there isn't one or it isn't for what we want.
+    """
+
+    try:
+        with open(filepath) as f:
+            stored = json.load(f)
+    except IOError:
+        return None
+    except ValueError:
+        _logger.warning("Stored discovery document [%s] is corrupt. "
+                        "Ignoring.", filepath)
+        return None
+
+    if stored.get('format_version') != _FORMAT_VERSION or \
+       stored.get('discovery_url') != discovery_url:
+        _logger.info("Stored discovery document [%s] is from a different "
+                     "version or URL. Ignoring.", filepath)
+        return None
+
+    document = stored['document']
+
+    try:
+        _check_document(json.loads(document), service_name, version)
+    except ValueError:
+        _logger.warning("Stored discovery document [%s] is not for the API "
+                        "that we want. Ignoring.", filepath)
+        return None
+
+    return (document, stored['retrieved_at'])
+
+def _store(filepath, discovery_url, document):
+    stored = { 'format_version': _FORMAT_VERSION,
+               'discovery_url': discovery_url,
+               'retrieved_at': time.time(),
+               'document': document }
+
+    # Write it alongside and then move it into place, so that we never leave
+    # a partial document.
+    (fd, temp_filepath) = tempfile.mkstemp(dir=os.path.dirname(filepath),
+                                           prefix='.discovery.')
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(stored, f)
+
+        os.rename(temp_filepath, filepath)
+    except:
+        os.remove(temp_filepath)
+        raise
+
+def build_client(service_name, version, http, discovery_url):
+    """Build a client from a stored copy of the discovery document, retrieving
+    it (and storing it) if we don't have one or it's too old. If it can't be
+    retrieved, a copy that's too old is used anyway.
+    """
+
+    filepath = get_document_filepath()
+    stored = _load(filepath, service_name, version, discovery_url)
+
+    max_age_s = int(Conf.get('discovery_document_max_age_s'))
+
+    if stored is not None:
+        (document, retrieved_at) = stored
+        age_s = time.time() - retrieved_at
+
+        if 0 <= age_s < max_age_s:
+            _logger.debug("Building client from stored discovery document "
+                          "[%s] (%d seconds old).", filepath, age_s)
+
+            return build_from_document(document, base=discovery_url,
+                                       http=http)
+
+    try:
+        document = _fetch(http, service_name, version, discovery_url)
+    except:
+        if stored is None:
+            raise
+
+        _logger.exception("Could not retrieve a new discovery document. "
+                          "Using the old one at [%s].", filepath)
+
+        (document, retrieved_at) = stored
+    else:
+        try:
+            _store(filepath, discovery_url, document)
+        except:
+            _logger.exception("Could not store discovery document at [%s].",
+                              filepath)
+
+    return build_from_document(document, base=discovery_url, http=http)
@@ -10,9 +10,10 @@ import tempfile
 import pprint
 import functools
 import threading
+import contextlib
+import copy
 
-from apiclient.discovery import build
-from apiclient.http import MediaFileUpload
+from apiclient.http import MediaFileUpload, BatchHttpRequest
 from apiclient.errors import HttpError
 
 from datetime import datetime
@@ -22,6 +23,7 @@ from os import makedirs, stat, utime
 from dateutil.tz import tzlocal, tzutc
 
 import gdrivefs.config
+import gdrivefs.config.download_agent
 import gdrivefs.gdtool.chunked_download
 
 from gdrivefs.errors import AuthorizationFaultError, MustIgnoreFileError, \
@@ -29,7 +31,16 @@ from gdrivefs.errors import AuthorizationFaultError, MustIgnoreFileError, \
 from gdrivefs.conf import Conf
 from gdrivefs.gdtool.oauth_authorize import get_auth
 from gdrivefs.gdtool.normal_entry import NormalEntry
-from gdrivefs.time_support import get_flat_normal_fs_time_from_dt
+from gdrivefs.time_support import get_flat_normal_fs_time_from_dt, \
+                                   get_monotonic_time
+from gdrivefs.general.single_flight import SingleFlight
+from gdrivefs.gdtool.http_pool import HttpPool
+from gdrivefs.gdtool.streaming_http import StreamingHttp
+from gdrivefs.gdtool.discovery_cache import build_client
+from gdrivefs.gdtool.etag_cache import get_etag_cache
+from gdrivefs.gdtool.rate_limiter import get_rate_limiter
+from gdrivefs.gdtool.hedging import get_hedger
+from gdrivefs.general.metrics import get_metrics, labels
 from gdrivefs.gdfs.fsutility import split_path_nolookups, \
                                     escape_filename_for_query
 
@@ -39,18 +50,90 @@ _CONF_SERVICE_VERSION = 'v2'
 _MAX_EMPTY_CHUNKS = 3
 _DEFAULT_UPLOAD_CHUNK_SIZE_B = 1024 * 1024
 
+# The most calls that the API accepts in one batch-request.
+_MAX_BATCH_SIZE = 100
+
+# The largest page that files.list and changes.list will return.
+_MAX_PAGE_SIZE = 1000
+
+# Just the parts of a file resource that NormalEntry uses (plus the ETag, for
+# conditional requests).
+_ENTRY_FIELDS = ('kind,etag,id,title,mimeType,labels,parents(id),'
+                 'lastModifyingUserName,writersCanShare,ownerNames,editable,'
+                 'userPermission,embedLink,fileSize,fileExtension,md5Checksum,'
+                 'imageMediaMetadata,exportLinks,downloadUrl,modifiedDate,'
+                 'modifiedByMeDate,lastViewedByMeDate')
+
+_FILE_LIST_FIELDS = ('kind,nextPageToken,items(%s)' % 
+                     (_ENTRY_FIELDS,))
+
+_CHANGE_LIST_FIELDS = ('kind,largestChangeId,nextPageToken,'
+                       'items(id,fileId,deleted,file(%s))' % (_ENTRY_FIELDS,))
+
+_CHILD_LIST_FIELDS = 'kind,items(id)'
+
+_RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
 logging.getLogger('apiclient.discovery').setLevel(logging.WARNING)
 
 _logger = logging.getLogger(__name__)
 
+def _is_rate_limit_error(e):
+    """Return True if the HttpError says that we're making calls too 
+    quickly.
+    """
+
+    if e.resp.status == 429:
+        return True
+    elif e.resp.status != 403 or not e.content:
+        return False
+
+    try:
+        error = json.loads(e.content)
+    except ValueError:
+        _logger.error("Non-JSON error: [%s]", e.content) 
+        return False
+
+    error = error.get('error', error)
+
+    try:
+        reason = error['errors'][0]['reason']
+    except (KeyError, IndexError, TypeError):
+        return False
+
+    return reason in _RATE_LIMIT_REASONS
+
+def _get_error_class(e):
+    if isinstance(e, HttpError):
+        return ('%s_%d' % (e.__class__.__name__, e.resp.status))
+
+    return e.__class__.__name__
+
+def _backoff(n):
+    """Sleep before reattempt `n` (from zero)."""
+
+    sleep_s = (2 ** n) + random.randint(0, 1000) / 1000
+
+    metrics = get_metrics()
+    metrics.increment('drive_retries_total')
+    metrics.increment('drive_backoff_seconds_total', sleep_s)
+
+    time.sleep(sleep_s)
+
+# Whether the current thread is in a call that's being counted.
+_marshall_state = threading.local()
+
 def _marshall(f):
     """A method wrapper that will reauth and/or reattempt where reasonable.
+    Every call is counted and timed, labeled by the method and by whatever
+    the calling thread is labeled with (e.g. the FUSE operation). A call that
+    is made from within another is only counted as part of that one.
     """
 
     auto_refresh = True
+    name = f.__name__.lstrip('_')
 
-    @functools.wraps(f)
-    def wrapper(*args, **kwargs):
+    def invoke(*args, **kwargs):
         # Now, try to invoke the mechanism. If we succeed, return 
         # immediately. If we get an authorization-fault (a resolvable 
         # authorization problem), fall through and attempt to fix it. Allow 
@@ -65,28 +148,17 @@ def _marshall(f):
                                   "error (%s). Trying again [%s]: %s",
                                   e.__class__.__name__, str(e), n)
 
-                time.sleep((2 ** n) + random.randint(0, 1000) / 1000)
+                _backoff(n)
             except HttpError as e:
-                if e.content == '':
-                    raise
-
-                try:
-                    error = json.loads(e.content)
-                except ValueError:
-                    _logger.error("Non-JSON error while doing chunked "
-                                  "download: [%s]", e.content) 
-                    raise e
-
-                if error.get('code') == 403 and \
-                   error.get('errors')[0].get('reason') \
-                        in ['rateLimitExceeded', 'userRateLimitExceeded']:
-                    # Apply exponential backoff.
+                if _is_rate_limit_error(e) is True:
+                    # The shared rate-limiter has already slowed everybody 
+                    # down. Apply exponential backoff to this call, too.
                     _logger.exception("There was a transient HTTP "
                                       "error (%s). Trying again (%d): "
                                       "%s",
                                       e.__class__.__name__, str(e), n)
 
-                    time.sleep((2 ** n) + random.randint(0, 1000) / 1000)
+                    _backoff(n)
                 else:
                     # Other error, re-raise.
                     raise
@@ -109,65 +181,211 @@ def _marshall(f):
                 _logger.info("Refresh seemed successful. Reattempting "
                              "action [%s].", action)
 
+                get_metrics().increment('drive_retries_total')
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        # A call made from within another (e.g. rename() calling 
+        # update_entry()) is part of that one, which is what's counted.
+        if getattr(_marshall_state, 'is_counting', False) is True:
+            return invoke(*args, **kwargs)
+
+        metrics = get_metrics()
+
+        with labels(method=name):
+            started_at = get_monotonic_time()
+            _marshall_state.is_counting = True
+
+            try:
+                return invoke(*args, **kwargs)
+            except Exception as e:
+                metrics.increment('drive_errors_total', 
+                                  error=_get_error_class(e))
+                raise
+            finally:
+                _marshall_state.is_counting = False
+
+                metrics.increment('drive_calls_total')
+                metrics.observe('drive_call_seconds', 
+                                get_monotonic_time() - started_at)
+
+    return wrapper
+
+_coalescer = SingleFlight()
+_coalescing_stats_lock = threading.Lock()
+
+# Method name => [calls, coalesced calls]
+_coalescing_stats = {}
+
+def _coalesce(f):
+    """A method wrapper for idempotent reads. If a call with the same 
+    arguments is already in progress (on any thread), wait for it and share its
+    result rather than making another request.
+    """
+
+    name = f.__name__
+
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+
+        (result, is_shared) = _coalescer.do(key, f, self, *args, **kwargs)
+
+        with _coalescing_stats_lock:
+            try:
+                stats = _coalescing_stats[name]
+            except KeyError:
+                stats = [0, 0]
+                _coalescing_stats[name] = stats
+
+            stats[0] += 1
+            if is_shared is True:
+                stats[1] += 1
+
+        if is_shared is True:
+            _logger.debug("Call to [%s] was coalesced with one already in "
+                          "progress.", name)
+
+            # Each caller gets its own list.
+            if isinstance(result, list):
+                result = list(result)
+
+        return result
+
     return wrapper
 
+def get_coalescing_stats():
+    """Return a dictionary of method-name to a dictionary of how many calls
+    were made and how many of those shared the result of another.
+    """
+
+    with _coalescing_stats_lock:
+        return dict([(name, { 'calls': calls, 'coalesced': coalesced })
+                     for (name, (calls, coalesced))
+                     in _coalescing_stats.iteritems()])
+
+
+class _CountingHttp(object):
+    """Wraps a connection-object to count the bytes of the responses that are
+    received through it.
+    """
+
+    def __init__(self, http):
+        self.__http = http
+
+        def request(*args, **kwargs):
+            (response, content) = http.request(*args, **kwargs)
+
+            if content:
+                get_metrics().increment('drive_response_bytes_total', 
+                                        len(content))
+
+            return (response, content)
+
+        # The client looks for the credentials on the request method.
+        if hasattr(http.request, 'credentials'):
+            request.credentials = http.request.credentials
+
+        self.request = request
+
+    def __getattr__(self, name):
+        return getattr(self.__http, name)
+
 
 class GdriveAuth(object):
+    """Holds the one client that all threads use. Since httplib2 isn't 
+    thread-safe, every request is executed with a connection borrowed from a 
+    shared pool rather than with the client's own.
+    """
+
     def __init__(self):
         self.__client = None
+        self.__client_lock = threading.Lock()
         self.__authorize = get_auth()
         self.__check_authorization()
-        self.__http = None
+        self.__http_pool = HttpPool(
+                            self.__build_authed_http, 
+                            gdrivefs.config.download_agent.HTTP_POOL_SIZE)
+
+        self.__streaming_http_pool = HttpPool(
+                                        self.__build_streaming_http, 
+                                        gdrivefs.config.download_agent.\
+                                            HTTP_POOL_SIZE)
 
     def __check_authorization(self):
         self.__credentials = self.__authorize.get_credentials()
 
-    def get_authed_http(self):
-        if self.__http is None:
-            self.__check_authorization()
-            _logger.debug("Getting authorized HTTP tunnel.")
-                
-            http = Http()
-            self.__credentials.authorize(http)
+    def __build_authed_http(self):
+        self.__check_authorization()
+        _logger.debug("Getting authorized HTTP tunnel.")
+            
+        http = Http()
+        self.__credentials.authorize(http)
+
+        _logger.debug("Got authorized tunnel.")
+
+        return http
 
-            _logger.debug("Got authorized tunnel.")
+    def __build_streaming_http(self):
+        self.__check_authorization()
+
+        return StreamingHttp(
+                self.__credentials, 
+                buffer_size=int(Conf.get('file_download_buffer_kb')) * 1024)
+
+    def borrow_http(self):
+        """Return a context-manager that lends an authorized connection to 
+        the current thread.
+        """
 
-            self.__http = http
+        return self.__http_pool.borrow()
 
-        return self.__http
+    def borrow_streaming_http(self):
+        """Return a context-manager that lends a connection that downloads 
+        straight to a file.
+        """
+
+        return self.__streaming_http_pool.borrow()
+
+    def get_http_pool_stats(self):
+        return self.__http_pool.get_stats()
 
     def get_client(self):
-        if self.__client is None:
-            authed_http = self.get_authed_http()
-        
-            # Build a client from the passed discovery document path
-            
-            discoveryUrl = Conf.get('google_discovery_service_url')
-# TODO: We should cache this, since we have, so often, had a problem 
-#       retrieving it. If there's no other way, grab it directly, and then pass
-#       via a file:// URI.
-        
-            try:
-                client = build(_CONF_SERVICE_NAME, 
-                               _CONF_SERVICE_VERSION, 
-                               http=authed_http, 
-                               discoveryServiceUrl=discoveryUrl)
-            except HttpError as e:
-                # We've seen situations where the discovery URL's server is down,
-                # with an alternate one to be used.
-                #
-                # An error here shouldn't leave GDFS in an unstable state (the 
-                # current command should just fail). Hoepfully, the failure is 
-                # momentary, and the next command succeeds.
-
-                _logger.exception("There was an HTTP response-code of (%d) while "
-                                  "building the client with discovery URL [%s].",
-                                  e.resp.status, discoveryUrl)
-                raise
+        with self.__client_lock:
+            if self.__client is None:
+                self.__client = self.__build_client()
+
+            return self.__client
 
-            self.__client = client
+    def __build_client(self):
+        # The client keeps this one for itself, but it's only used to retrieve
+        # the discovery document.
+        authed_http = self.__build_authed_http()
+    
+        # Build a client from our copy of the discovery document, since we 
+        # have, so often, had a problem retrieving it.
+        
+        discoveryUrl = Conf.get('google_discovery_service_url')
+    
+        try:
+            client = build_client(_CONF_SERVICE_NAME, 
+                                  _CONF_SERVICE_VERSION, 
+                                  authed_http, 
+                                  discoveryUrl)
+        except HttpError as e:
+            # We've seen situations where the discovery URL's server is down,
+            # with an alternate one to be used.
+            #
+            # An error here shouldn't leave GDFS in an unstable state (the 
+            # current command should just fail). Hoepfully, the failure is 
+            # momentary, and the next command succeeds.
+
+            _logger.exception("There was an HTTP response-code of (%d) while "
+                              "building the client with discovery URL [%s].",
+                              e.resp.status, discoveryUrl)
+            raise
 
-        return self.__client
+        return client
 
 
 class _GdriveManager(object):
@@ -179,21 +397,121 @@ class _GdriveManager(object):
     def __init__(self):
         self.__auth = GdriveAuth()
 
+    def __call(self, f, count=1, borrow_http=None):
+        """Invoke f() with a borrowed connection, once the rate-limiter says
+        that we can make `count` calls, and tell the rate-limiter how it went.
+        The connection comes from the pool for metadata calls unless 
+        `borrow_http` (returning a context-manager) is given.
+        """
+
+        if borrow_http is None:
+            borrow_http = self.__borrow_metadata_http
+
+        rate_limiter = get_rate_limiter()
+        rate_limiter.acquire(count)
+
+        try:
+            with borrow_http() as http:
+                result = f(http)
+        except HttpError as e:
+            if _is_rate_limit_error(e) is True:
+                rate_limiter.on_throttled()
+
+            raise
+
+        rate_limiter.on_success()
+        return result
+
+    @contextlib.contextmanager
+    def __borrow_metadata_http(self):
+        with self.__auth.borrow_http() as http:
+            yield _CountingHttp(http)
+
+    def __execute(self, request):
+        return self.__call(lambda http: request.execute(http=http))
+
+    def __execute_hedgeable(self, build_request, hedge_name=None):
+        """Execute the request built by build_request(). If `hedge_name` is 
+        given, the request is idempotent and may be hedged (made a second 
+        time, if it's slow), when hedging is enabled.
+        """
+
+        def execute():
+            # Each attempt gets its own request.
+            return self.__execute(build_request())
+
+        hedger = get_hedger() if hedge_name is not None else None
+
+        if hedger is not None:
+            return hedger.call(hedge_name, execute)
+
+        return execute()
+
+    def __execute_conditional(self, key, build_request, build_result, 
+                              hedge_name=None):
+        """Execute the request built by build_request(), sending the ETag 
+        from the last time that it was made, and build the result from the 
+        response with build_result(). If nothing has changed, the result is 
+        built from the response that we got then. Every call builds its own 
+        result, since callers are free to modify what they're given.
+
+        If `hedge_name` is given, the request is idempotent and may be hedged
+        (made a second time, if it's slow), when hedging is enabled.
+        """
+
+        etag_cache = get_etag_cache()
+
+        cached = etag_cache.get(key)
+
+        def build_conditional_request():
+            request = build_request()
+
+            if cached is not None:
+                request.headers['If-None-Match'] = cached[0]
+
+            return request
+
+        try:
+            response = self.__execute_hedgeable(build_conditional_request, 
+                                                hedge_name=hedge_name)
+        except HttpError as e:
+            if cached is None or e.resp.status != 304:
+                raise
+
+            _logger.debug("Request [%s] was not modified.", key)
+
+            etag_cache.mark_not_modified()
+            return build_result(copy.deepcopy(cached[1]))
+
+        etag = response.get(u'etag')
+        if etag is not None:
+            etag_cache.set(key, etag, copy.deepcopy(response))
+
+        return build_result(response)
+
+    def get_http_pool_stats(self):
+        return self.__auth.get_http_pool_stats()
+
     def __assert_response_kind(self, response, expected_kind):
         actual_kind = response[u'kind']
         if actual_kind != unicode(expected_kind):
             raise ValueError("Received response of type [%s] instead of "
                              "[%s]." % (actual_kind, expected_kind))
 
+    @_coalesce
     @_marshall
     def get_about_info(self):
         """Return the 'about' information for the drive."""
 
         client = self.__auth.get_client()
-        response = client.about().get().execute()
-        self.__assert_response_kind(response, 'drive#about')
 
-        return response
+        def build_result(response):
+            self.__assert_response_kind(response, 'drive#about')
+            return response
+
+        return self.__execute_conditional(('about',), 
+                                          client.about().get, 
+                                          build_result)
 
     @_marshall
     def list_changes(self, start_change_id=None, page_token=None):
@@ -205,9 +523,11 @@ class _GdriveManager(object):
 
         client = self.__auth.get_client()
 
-        response = client.changes().list(
+        response = self.__execute(client.changes().list(
                     pageToken=page_token, 
-                    startChangeId=start_change_id).execute()
+                    startChangeId=start_change_id,
+                    maxResults=_MAX_PAGE_SIZE,
+                    fields=_CHANGE_LIST_FIELDS))
 
         self.__assert_response_kind(response, 'drive#changeList')
 
@@ -246,6 +566,7 @@ class _GdriveManager(object):
 
         return (largest_change_id, next_page_token, changes)
 
+    @_coalesce
     @_marshall
     def get_parents_containing_id(self, child_id, max_results=None):
         
@@ -255,11 +576,12 @@ class _GdriveManager(object):
 
         _logger.info("Listing entries over child with ID [%s].", child_id)
 
-        response = client.parents().list(fileId=child_id).execute()
+        response = self.__execute(client.parents().list(fileId=child_id))
         self.__assert_response_kind(response, 'drive#parentList')
 
         return [ entry[u'id'] for entry in response[u'items'] ]
 
+    @_coalesce
     @_marshall
     def get_children_under_parent_id(self,
                                      parent_id,
@@ -288,10 +610,11 @@ class _GdriveManager(object):
         _logger.info("Listing entries under parent with ID [%s].  QUERY= "
                      "[%s]", parent_id, query)
 
-        response = client.children().list(
+        response = self.__execute(client.children().list(
                     q=query, 
                     folderId=parent_id,
-                    maxResults=max_results).execute()
+                    maxResults=max_results,
+                    fields=_CHILD_LIST_FIELDS))
 
         self.__assert_response_kind(response, 'drive#childList')
 
@@ -299,8 +622,33 @@ class _GdriveManager(object):
 
     @_marshall
     def get_entries(self, entry_ids):
-        retrieved = { }
+        """Retrieve several entries, batching the requests. Return a 
+        dictionary of entry-IDs to entries.
+        """
+
+        # Drop duplicates, but keep the order.
+        unique_ids = []
+        seen = set()
         for entry_id in entry_ids:
+            if entry_id not in seen:
+                seen.add(entry_id)
+                unique_ids.append(entry_id)
+
+        retrieved = { }
+        failed_ids = []
+        for i in xrange(0, len(unique_ids), _MAX_BATCH_SIZE):
+            batch_ids = unique_ids[i:i + _MAX_BATCH_SIZE]
+
+            if len(batch_ids) == 1:
+                failed_ids.extend(batch_ids)
+                continue
+
+            self.__get_entries_batch(batch_ids, retrieved, failed_ids)
+
+        # Anything that we couldn't get in a batch (or that was alone) is 
+        # retrieved directly, so that it gets the normal retry and error 
+        # handling.
+        for entry_id in failed_ids:
             try:
                 entry = self.get_entry(entry_id)
             except:
@@ -314,33 +662,74 @@ class _GdriveManager(object):
 
         return retrieved
 
+    def __get_entries_batch(self, entry_ids, retrieved, failed_ids):
+        """Do one batch-request for the given entries. What's retrieved is 
+        added to `retrieved`, and the IDs of what wasn't to `failed_ids`.
+        """
+
+        _logger.debug("Retrieving (%d) entries in a batch.", len(entry_ids))
+
+        client = self.__auth.get_client()
+
+        def handle_response(request_id, response, exception):
+            entry_id = entry_ids[int(request_id)]
+
+            if exception is not None:
+                _logger.debug("Batched retrieval of entry [%s] failed: %s",
+                              entry_id, exception)
+
+                if isinstance(exception, HttpError) and \
+                   _is_rate_limit_error(exception) is True:
+                    get_rate_limiter().on_throttled()
+
+                failed_ids.append(entry_id)
+                return
+
+            self.__assert_response_kind(response, 'drive#file')
+            retrieved[entry_id] = NormalEntry('direct_read', response)
+
+        batch = BatchHttpRequest(callback=handle_response)
+        for (i, entry_id) in enumerate(entry_ids):
+            batch.add(client.files().get(fileId=entry_id, 
+                                         fields=_ENTRY_FIELDS), 
+                      request_id=str(i))
+
+        # Each call in the batch counts against our rate.
+        self.__call(lambda http: batch.execute(http=http), 
+                    count=len(entry_ids))
+
+    @_coalesce
     @_marshall
     def get_entry(self, entry_id):
         client = self.__auth.get_client()
 
-        response = client.files().get(fileId=entry_id).execute()
-        self.__assert_response_kind(response, 'drive#file')
+        def build_result(response):
+            self.__assert_response_kind(response, 'drive#file')
+            return NormalEntry('direct_read', response)
 
-        return NormalEntry('direct_read', response)
+        return self.__execute_conditional(
+                ('file', entry_id), 
+                lambda: client.files().get(fileId=entry_id, 
+                                           fields=_ENTRY_FIELDS), 
+                build_result,
+                hedge_name='get_entry')
 
+    @_coalesce
     @_marshall
-    def list_files(self, query_contains_string=None, query_is_string=None, 
-                   parent_id=None):
-        
-        _logger.info("Listing all files. CONTAINS=[%s] IS=[%s] "
-                     "PARENT_ID=[%s]",
-                     query_contains_string 
-                        if query_contains_string is not None 
-                        else '<none>', 
-                     query_is_string 
-                        if query_is_string is not None 
-                        else '<none>', 
-                     parent_id 
-                        if parent_id is not None 
-                        else '<none>')
+    def get_entry_raw(self, entry_id):
+        """Return the complete file resource, rather than just what we 
+        normally retrieve.
+        """
 
         client = self.__auth.get_client()
 
+        response = self.__execute(client.files().get(fileId=entry_id))
+        self.__assert_response_kind(response, 'drive#file')
+
+        return response
+
+    def __build_list_query(self, query_contains_string=None, 
+                           query_is_string=None, parent_id=None):
         query_components = []
 
         if parent_id:
@@ -360,42 +749,103 @@ class _GdriveManager(object):
             for hidden_flag in hidden_flags:
                 query_components.append("%s = false" % (hidden_flag))
 
-        query = ' and '.join(query_components) if query_components else None
+        return ' and '.join(query_components) if query_components else None
 
-        page_token = None
-        page_num = 0
-        entries = []
-        while 1:
-            _logger.debug("Doing request for listing of files with page-"
-                          "token [%s] and page-number (%d): %s",
-                          page_token, page_num, query)
+    @_marshall
+    def list_files_page(self, query_contains_string=None, query_is_string=None, 
+                        parent_id=None, page_token=None, max_results=None):
+        """Return one page of a file-listing, as a 2-tuple of the entries and 
+        the token for the next page (None if this was the last).
+        """
+
+        client = self.__auth.get_client()
+
+        query = self.__build_list_query(
+                    query_contains_string=query_contains_string, 
+                    query_is_string=query_is_string, 
+                    parent_id=parent_id)
+
+        _logger.debug("Doing request for listing of files with page-"
+                      "token [%s]: %s", page_token, query)
 
-            result = client.files().list(q=query, pageToken=page_token).\
-                        execute()
+        if max_results is None:
+            max_results = _MAX_PAGE_SIZE
 
+        def build_result(result):
             self.__assert_response_kind(result, 'drive#fileList')
 
-            _logger.debug("(%d) entries were presented for page-number "
-                          "(%d).", len(result[u'items']), page_num)
+            _logger.debug("(%d) entries were presented for page.", 
+                          len(result[u'items']))
 
+            entries = []
             for entry_raw in result[u'items']:
                 try:
                     entry = NormalEntry('list_files', entry_raw)
                 except:
-                    _logger.exception("Could not normalize raw-data for entry "
-                                      "with ID [%s].", entry_raw[u'id'])
+                    _logger.exception("Could not normalize raw-data for "
+                                      "entry with ID [%s].", entry_raw[u'id'])
                     raise
 
                 entries.append(entry)
 
-            if u'nextPageToken' not in result:
+            return (entries, result.get(u'nextPageToken'))
+
+        # A look-up of a single name is as latency-sensitive as getting an 
+        # entry.
+        hedge_name = 'list_files_by_name' \
+                        if query_is_string is not None \
+                        else None
+
+        # Listings aren't made conditionally. Whole pages of entries would 
+        # have to be kept for that, outside of the entry-cache's budget.
+        response = self.__execute_hedgeable(
+            lambda: client.files().list(q=query, 
+                                        pageToken=page_token, 
+                                        maxResults=max_results,
+                                        fields=_FILE_LIST_FIELDS), 
+            hedge_name=hedge_name)
+
+        return build_result(response)
+
+    @_coalesce
+    def list_files(self, query_contains_string=None, query_is_string=None, 
+                   parent_id=None):
+        
+        _logger.info("Listing all files. CONTAINS=[%s] IS=[%s] "
+                     "PARENT_ID=[%s]",
+                     query_contains_string 
+                        if query_contains_string is not None 
+                        else '<none>', 
+                     query_is_string 
+                        if query_is_string is not None 
+                        else '<none>', 
+                     parent_id 
+                        if parent_id is not None 
+                        else '<none>')
+
+        page_token = None
+        page_num = 0
+        entries = []
+        while 1:
+            (page_entries, page_token) = self.list_files_page(
+                                            query_contains_string=\
+                                                query_contains_string, 
+                                            query_is_string=query_is_string, 
+                                            parent_id=parent_id, 
+                                            page_token=page_token)
+
+            _logger.debug("(%d) entries were presented for page-number "
+                          "(%d).", len(page_entries), page_num)
+
+            entries += page_entries
+
+            if page_token is None:
                 _logger.debug("No more pages in file listing.")
                 break
 
             _logger.debug("Next page-token in file-listing is [%s].", 
-                          result[u'nextPageToken'])
+                          page_token)
 
-            page_token = result[u'nextPageToken']
             page_num += 1
 
         return entries
@@ -450,15 +900,27 @@ class _GdriveManager(object):
 
         # Go and get the file.
 
-        authed_http = self.__auth.get_authed_http()
-
         url = normalized_entry.download_links[mime_type]
 
-        with open(output_file_path, 'wb') as f:
+        if self.__is_parallel_download(normalized_entry, mime_type) is True:
+            self.__download_in_parallel(
+                output_file_path, 
+                url, 
+                normalized_entry.file_size)
+
+            utime(output_file_path, (time.time(), gd_mtime_epoch))
+
+            return (normalized_entry.file_size, True)
+
+        # The connection is held for the whole download.
+        with self.__borrow_download_http() as http, \
+             open(output_file_path, 'wb') as f:
+            chunk_sizer = self.__build_chunk_sizer()
             downloader = gdrivefs.gdtool.chunked_download.ChunkedDownload(
                             f, 
-                            authed_http, 
-                            url)
+                            http, 
+                            url, 
+                            chunk_sizer=chunk_sizer)
 
             progresses = []
 
@@ -493,10 +955,110 @@ class _GdriveManager(object):
 
             _logger.debug("Download complete. Offset is: (%d)", f.tell())
 
+            _logger.info("Downloaded (%d) bytes with chunks of up to (%d) "
+                         "bytes. BANDWIDTH=(%s) RTT=(%s)", 
+                         total_size, chunk_sizer.size, 
+                         chunk_sizer.bandwidth_bps, chunk_sizer.rtt_s)
+
         utime(output_file_path, (time.time(), gd_mtime_epoch))
 
         return (total_size, True)
 
+    def __is_parallel_download(self, normalized_entry, mime_type):
+        """Large files are downloaded as several ranges at once. Exports 
+        have no size that we know up-front, so they're downloaded serially.
+        """
+
+        min_size_b = int(Conf.get('file_download_parallel_min_kb')) * 1024
+
+        return min_size_b > 0 and \
+               mime_type == normalized_entry.mime_type and \
+               normalized_entry.requires_mimetype is False and \
+               normalized_entry.file_size >= min_size_b
+
+    def __build_chunk_sizer(self):
+        return gdrivefs.gdtool.chunked_download.ChunkSizer(
+                int(Conf.get('file_chunk_initial_size_kb')) * 1024, 
+                int(Conf.get('file_chunk_size_kb')) * 1024)
+
+    @contextlib.contextmanager
+    def __borrow_download_http(self):
+        """Lend a connection for downloading. Unless we've been told not to,
+        it writes the data to the file as it arrives, rather than holding 
+        whole chunks in memory.
+        """
+
+        if Conf.get('file_download_streaming') is True:
+            with self.__auth.borrow_streaming_http() as http:
+                yield http
+        else:
+            with self.__auth.borrow_http() as http:
+                yield _CountingHttp(http)
+
+    def __download_in_parallel(self, output_file_path, url, total_size):
+        downloader = gdrivefs.gdtool.chunked_download.ParallelDownload(
+                        output_file_path, 
+                        self.__borrow_download_http, 
+                        url, 
+                        total_size, 
+                        range_size=\
+                            int(Conf.get('file_download_range_kb')) * 1024, 
+                        num_workers=\
+                            int(Conf.get('file_download_parallel_workers')), 
+                        chunksize=int(Conf.get('file_chunk_size_kb')) * 1024, 
+                        initial_chunksize=\
+                            int(Conf.get('file_chunk_initial_size_kb')) * 1024)
+
+        downloader.download()
+
+    @_marshall
+    def download_range(self, normalized_entry, mime_type, f, offset, length):
+        """Write `length` bytes of the given file, from `offset`, to `f` 
+        (which only needs write() and tell(), and starts at `offset`) as they
+        arrive. A reattempt carries on from wherever `f` got to. These are big
+        reads, so they're made on the download connections rather than held 
+        up behind (or holding up) the metadata calls.
+        """
+
+        _logger.debug("Downloading (%d) bytes at offset (%d) of entry with "
+                      "ID [%s] and mime-type [%s].", 
+                      length, offset, normalized_entry.id, mime_type)
+
+        url = normalized_entry.download_links[mime_type]
+        end_at = offset + length - 1
+
+        def download(http):
+            # If an earlier attempt failed part of the way through, what it 
+            # wrote is already in place. Carry on from where it stopped 
+            # rather than writing the range again from there.
+            start_at = f.tell()
+            if start_at > end_at:
+                return
+
+            if start_at != offset:
+                _logger.debug("Resuming the range at offset (%d) from "
+                              "offset (%d).", offset, start_at)
+
+            downloader = gdrivefs.gdtool.chunked_download.ChunkedDownload(
+                            f, 
+                            http, 
+                            url, 
+                            chunksize=end_at - start_at + 1, 
+                            start_at=start_at, 
+                            end_at=end_at)
+
+            while 1:
+                received_b = f.tell()
+
+                (status, done, total_size) = downloader.next_chunk()
+                if done is True:
+                    break
+                elif f.tell() == received_b:
+                    raise IOError("No data was received for the range at "
+                                  "offset (%d)." % (received_b,))
+
+        self.__call(download, borrow_http=self.__auth.borrow_streaming_http)
+
     @_marshall
     def create_directory(self, filename, parents, **kwargs):
 
@@ -627,7 +1189,7 @@ class _GdriveManager(object):
             'media_body': file_,
         }
 
-        response = client.files().update(**args).execute()
+        response = self.__execute(client.files().update(**args))
         self.__assert_response_kind(response, 'drive#file')
 
         _logger.debug("Truncate complete: [%s]", normalized_entry.id)
@@ -721,14 +1283,15 @@ class _GdriveManager(object):
         """
 
         if has_file is False:
-            return request.execute()
+            return self.__execute(request)
 
         _logger.debug("We need to finish updating the entry's data: [%s]", 
                       filename)
 
         result = None
         while result is None:
-            status, result = request.next_chunk()
+            status, result = self.__call(
+                                lambda http: request.next_chunk(http=http))
 
             if status:
                 if status.total_size == 0:
@@ -761,7 +1324,7 @@ class _GdriveManager(object):
         args = { 'fileId': normalized_entry.id }
 
         try:
-            result = client.files().delete(**args).execute()
+            result = self.__execute(client.files().delete(**args))
         except (Exception) as e:
             if e.__class__.__name__ == 'HttpError' and \
                str(e).find('File not found') != -1:
@@ -773,19 +1336,18 @@ class _GdriveManager(object):
 
         _logger.info("Entry deleted successfully.")
 
-_THREAD_STORAGE = None
+_instance = None
+_instance_lock = threading.Lock()
 def get_gdrive():
-    """Return an instance of _GdriveManager unique to each thread (we can't 
-    reuse sockets between threads).
+    """Return the _GdriveManager that all threads share. Its requests are 
+    executed with connections borrowed from a pool (we can't reuse a socket 
+    between threads at the same time).
     """
 
-    global _THREAD_STORAGE
+    global _instance
 
-    if _THREAD_STORAGE is None:
-        _THREAD_STORAGE = threading.local()
+    with _instance_lock:
+        if _instance is None:
+            _instance = _GdriveManager()
 
-    try:
-        return _THREAD_STORAGE.gm
-    except AttributeError:
-        _THREAD_STORAGE.gm = _GdriveManager()
-        return _THREAD_STORAGE.gm
+        return _instance
@@ -0,0 +1,88 @@
+import logging
+import threading
+
+from collections import OrderedDict
+
+from gdrivefs.conf import Conf
+
+_logger = logging.getLogger(__name__)
+
+
+class EtagCache(object):
+    """Remembers the ETag and the response of the most recent requests, so 
+    that they can be made conditionally (If-None-Match), and the response 
+    reused when the server tells us that nothing has changed (304). The 
+    least-recently-used are dropped once we reach the maximum size.
+    """
+
+    def __init__(self, max_entries):
+        self.__max_entries = max_entries
+
+        self.__lock = threading.Lock()
+
+        # key => (ETag, response), least-recently-used first.
+        self.__entries = OrderedDict()
+
+        self.__requests = 0
+        self.__not_modified = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        """Return the (ETag, response) 2-tuple that we have for the given key,
+        or None. This is counted as a request.
+        """
+
+        with self.__lock:
+            self.__requests += 1
+
+            try:
+                cached = self.__entries.pop(key)
+            except KeyError:
+                return None
+
+            self.__entries[key] = cached
+            return cached
+
+    def set(self, key, etag, response):
+        if self.__max_entries <= 0:
+            return
+
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+            while len(self.__entries) >= self.__max_entries:
+                self.__entries.popitem(last=False)
+
+            self.__entries[key] = (etag, response)
+
+    def mark_not_modified(self):
+        with self.__lock:
+            self.__not_modified += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_stats(self):
+        with self.__lock:
+            hit_ratio = float(self.__not_modified) / self.__requests \
+                            if self.__requests > 0 \
+                            else 0.0
+
+            return { 'entries': len(self.__entries),
+                     'requests': self.__requests,
+                     'not_modified': self.__not_modified,
+                     'hit_ratio': hit_ratio }
+
+_instance = None
+_instance_lock = threading.Lock()
+def get_etag_cache():
+    global _instance
+
+    with _instance_lock:
+        if _instance is None:
+            _instance = EtagCache(int(Conf.get('etag_cache_max_entries')))
+
+        return _instance
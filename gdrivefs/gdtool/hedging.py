@@ -0,0 +1,284 @@
+import logging
+import threading
+import sys
+import Queue
+
+from collections import deque
+
+import six
+
+from gdrivefs.conf import Conf
+from gdrivefs.time_support import get_monotonic_time
+from gdrivefs.gdtool.rate_limiter import get_priority, priority
+from gdrivefs.general.metrics import get_labels, labels
+
+_logger = logging.getLogger(__name__)
+
+# How many of the most recent latencies we keep for each method.
+_WINDOW_SIZE = 1000
+
+# Don't hedge until we know what's normal.
+_MIN_SAMPLES = 20
+
+# How often (in samples) to recompute when to hedge.
+_RECOMPUTE_INTERVAL = 20
+
+
+class _LatencyWindow(object):
+    def __init__(self):
+        self.__samples = deque(maxlen=_WINDOW_SIZE)
+
+    def __len__(self):
+        return len(self.__samples)
+
+    def add(self, latency_s):
+        self.__samples.append(latency_s)
+
+    def percentile(self, p):
+        if not self.__samples:
+            return None
+
+        samples = sorted(self.__samples)
+        i = int(round(p / 100.0 * (len(samples) - 1)))
+
+        return samples[i]
+
+
+class _MethodLatency(object):
+    def __init__(self):
+        # The latency of each request, hedged or not (what we'd see without
+        # hedging).
+        self.attempts = _LatencyWindow()
+
+        # The latency that our callers saw.
+        self.calls = _LatencyWindow()
+
+        self.num_calls = 0
+        self.num_hedged = 0
+        self.num_hedge_wins = 0
+
+        self.hedge_delay_s = None
+        self.samples_since_recompute = 0
+
+
+class _AttemptPool(object):
+    """Runs attempts on threads that are kept for reuse. A thread is only
+    started when none is idle, and exits once it has been idle for a while.
+    """
+
+    def __init__(self, max_idle_s=60):
+        self.__max_idle_s = max_idle_s
+
+        self.__lock = threading.Lock()
+        self.__q = Queue.Queue()
+        self.__idle = 0
+
+    def submit(self, f):
+        with self.__lock:
+            self.__q.put(f)
+
+            # An idle thread will take it.
+            if self.__idle > 0:
+                self.__idle -= 1
+                return
+
+        t = threading.Thread(target=self.__work)
+        t.daemon = True
+        t.start()
+
+    def __work(self):
+        while 1:
+            f = self.__q.get()
+
+            try:
+                f()
+            except:
+                _logger.exception("Attempt failed unexpectedly.")
+
+            with self.__lock:
+                self.__idle += 1
+
+            # Wait for more work. If we time-out but something was submitted
+            # for us in the meantime, we keep going.
+            while 1:
+                try:
+                    f = self.__q.get(timeout=self.__max_idle_s)
+                except Queue.Empty:
+                    with self.__lock:
+                        if self.__idle > 0:
+                            self.__idle -= 1
+                            return
+                else:
+                    self.__q.put(f)
+                    break
+
+
+class _Hedger(object):
+    """Makes a second, identical request when the first is taking longer than
+    a given percentile of recent ones, and takes whichever answer (or error)
+    arrives first. Hedges are limited to a percentage of calls.
+
+    A call that can't be hedged (we don't know what's normal yet, or the
+    budget is spent) is made on the calling thread. Otherwise, the attempts
+    are made on a pool of reusable threads, so that the caller can take
+    whichever finishes first.
+    """
+
+    def __init__(self, percentile, budget_ratio):
+        self.__percentile = percentile
+        self.__budget_ratio = budget_ratio
+
+        self.__lock = threading.Lock()
+        self.__methods = {}
+
+        self.__pool = _AttemptPool()
+
+    def __get_method(self, name):
+        """Must be called with the lock held."""
+
+        try:
+            return self.__methods[name]
+        except KeyError:
+            m = _MethodLatency()
+            self.__methods[name] = m
+            return m
+
+    def __record_attempt(self, m, latency_s):
+        with self.__lock:
+            m.attempts.add(latency_s)
+
+            m.samples_since_recompute += 1
+            if len(m.attempts) >= _MIN_SAMPLES and \
+               (m.hedge_delay_s is None or
+                m.samples_since_recompute >= _RECOMPUTE_INTERVAL):
+                m.hedge_delay_s = m.attempts.percentile(self.__percentile)
+                m.samples_since_recompute = 0
+
+    def __is_within_budget(self, m):
+        """Must be called with the lock held."""
+
+        return m.num_hedged < self.__budget_ratio * m.num_calls
+
+    def __attempt(self, m, f):
+        """Return a 2-tuple of the result of f() and the exception-info (one
+        of which is None).
+        """
+
+        started_at = get_monotonic_time()
+
+        try:
+            result = (f(), None)
+        except:
+            result = (None, sys.exc_info())
+
+        self.__record_attempt(m, get_monotonic_time() - started_at)
+        return result
+
+    def __start_attempt(self, m, f, results, is_hedge):
+        priority_class = get_priority()
+        labels_ = get_labels()
+
+        def attempt():
+            # Requests are paced under the caller's priority, and are
+            # attributed to what the caller is doing.
+            with priority(priority_class):
+                with labels(**labels_):
+                    result = self.__attempt(m, f)
+
+            results.put((is_hedge, result))
+
+        self.__pool.submit(attempt)
+
+    def __finish(self, m, started_at, is_hedge, result, exc_info):
+        with self.__lock:
+            m.calls.add(get_monotonic_time() - started_at)
+
+            if is_hedge is True:
+                m.num_hedge_wins += 1
+
+        if exc_info is not None:
+            six.reraise(*exc_info)
+
+        return result
+
+    def call(self, name, f):
+        """Invoke f(), hedging it if it takes too long. f() must be safe to
+        invoke more than once, concurrently.
+        """
+
+        started_at = get_monotonic_time()
+
+        with self.__lock:
+            m = self.__get_method(name)
+            m.num_calls += 1
+            hedge_delay_s = m.hedge_delay_s
+
+            is_hedgeable = hedge_delay_s is not None and \
+                           self.__is_within_budget(m) is True
+
+        if is_hedgeable is False:
+            (result, exc_info) = self.__attempt(m, f)
+            return self.__finish(m, started_at, False, result, exc_info)
+
+        results = Queue.Queue()
+        self.__start_attempt(m, f, results, False)
+
+        try:
+            item = results.get(timeout=hedge_delay_s)
+        except Queue.Empty:
+            with self.__lock:
+                is_allowed = self.__is_within_budget(m)
+                if is_allowed is True:
+                    m.num_hedged += 1
+
+            if is_allowed is True:
+                _logger.debug("Call to [%s] is taking longer than (%.3f) "
+                              "seconds. Hedging.", name, hedge_delay_s)
+
+                self.__start_attempt(m, f, results, True)
+
+            item = results.get()
+
+        # Whichever attempt finishes first is the answer, even if it's an 
+        # error (e.g. a 304). We only hedge against latency.
+        (is_hedge, (result, exc_info)) = item
+
+        return self.__finish(m, started_at, is_hedge, result, exc_info)
+
+    def get_stats(self):
+        """Return, for each method, the median and 99th-percentile latencies
+        of the individual requests (what we'd see without hedging) and of the
+        calls (what we see with it).
+        """
+
+        with self.__lock:
+            stats = {}
+            for (name, m) in self.__methods.iteritems():
+                stats[name] = { 'calls': m.num_calls,
+                                'hedged': m.num_hedged,
+                                'hedge_wins': m.num_hedge_wins,
+                                'hedge_delay_s': m.hedge_delay_s,
+                                'unhedged_p50_s': m.attempts.percentile(50),
+                                'unhedged_p99_s': m.attempts.percentile(99),
+                                'p50_s': m.calls.percentile(50),
+                                'p99_s': m.calls.percentile(99) }
+
+            return stats
+
+_instance = None
+_instance_lock = threading.Lock()
+def get_hedger():
+    """Return the hedger, or None if hedging is disabled."""
+
+    global _instance
+
+    if Conf.get('hedge_requests') is False:
+        return None
+
+    with _instance_lock:
+        if _instance is None:
+            _instance = _Hedger(
+                            float(Conf.get('hedge_percentile')),
+                            float(Conf.get('hedge_budget_percent')) / 100.0)
+
+        return _instance
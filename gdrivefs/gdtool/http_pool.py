@@ -0,0 +1,89 @@
+import logging
+import threading
+import contextlib
+import Queue
+
+_logger = logging.getLogger(__name__)
+
+
+class HttpPool(object):
+    """A bounded set of HTTP connection-objects that can be shared between
+    threads. Each one is only ever used by one thread at a time (httplib2 isn't
+    thread-safe), and they're kept, so their connections stay alive between
+    requests. A thread that needs one while all of them are in use waits for
+    one to be returned.
+    """
+
+    def __init__(self, factory, max_size):
+        self.__factory = factory
+        self.__max_size = max_size
+
+        self.__lock = threading.Lock()
+        self.__idle = Queue.LifoQueue()
+        self.__created = 0
+
+        # The connection that each thread has, so that a thread that borrows
+        # again (e.g. a call within a call) gets the same one rather than
+        # waiting on itself.
+        self.__local = threading.local()
+
+        self.__borrows = 0
+        self.__waits = 0
+
+    def __acquire(self):
+        try:
+            return self.__idle.get_nowait()
+        except Queue.Empty:
+            pass
+
+        with self.__lock:
+            is_creating = self.__created < self.__max_size
+            if is_creating is True:
+                self.__created += 1
+            else:
+                self.__waits += 1
+
+        if is_creating is False:
+            return self.__idle.get()
+
+        _logger.debug("Creating HTTP connection (%d) of (%d).",
+                      self.__created, self.__max_size)
+
+        try:
+            return self.__factory()
+        except:
+            with self.__lock:
+                self.__created -= 1
+
+            raise
+
+    @contextlib.contextmanager
+    def borrow(self):
+        """Lend a connection-object to the current thread for the duration of
+        the block.
+        """
+
+        http = getattr(self.__local, 'http', None)
+        if http is not None:
+            yield http
+            return
+
+        http = self.__acquire()
+        self.__local.http = http
+
+        with self.__lock:
+            self.__borrows += 1
+
+        try:
+            yield http
+        finally:
+            self.__local.http = None
+            self.__idle.put(http)
+
+    def get_stats(self):
+        with self.__lock:
+            return { 'max_size': self.__max_size,
+                     'created': self.__created,
+                     'idle': self.__idle.qsize(),
+                     'borrows': self.__borrows,
+                     'waits': self.__waits }
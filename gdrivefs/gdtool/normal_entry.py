@@ -39,6 +39,7 @@ class NormalEntry(object):
         self.__info = {}
         self.__parents = []
         self.__raw_data = raw_data
+        self.__raw_data_full = None
         self.__cache_data = None
         self.__cache_mimetypes = None
         self.__cache_dict = {}
@@ -213,9 +214,13 @@ class NormalEntry(object):
             return data
 
     def get_data(self):
+            raw_data = self.__raw_data_full \
+                        if self.__raw_data_full is not None \
+                        else self.__raw_data
+
             original = dict([(key.encode('ASCII'), value) 
                                 for key, value 
-                                in self.__raw_data.iteritems()])
+                                in raw_data.iteritems()])
 
             distilled = self.__info
 
@@ -245,6 +250,26 @@ class NormalEntry(object):
 
         return self.__cache_data
 
+    @property
+    def raw_data(self):
+        return self.__raw_data
+
+    @property
+    def has_full_raw_data(self):
+        """We normally only retrieve the fields that we need. Return True if 
+        we've since been given the complete resource.
+        """
+
+        return self.__raw_data_full is not None
+
+    def set_full_raw_data(self, raw_data):
+        """Provide the complete resource, to be presented in the 
+        "user.original.*" xattrs.
+        """
+
+        self.__raw_data_full = raw_data
+        self.__cache_data = None
+
     @property
     def is_directory(self):
         """Return True if we represent a directory."""
@@ -0,0 +1,217 @@
+import logging
+import threading
+import contextlib
+
+from gdrivefs.conf import Conf
+from gdrivefs.time_support import get_monotonic_time
+
+_logger = logging.getLogger(__name__)
+
+# Priority classes, highest first. Calls are made under PRIORITY_INTERACTIVE
+# unless the thread says otherwise.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BACKGROUND = 2
+
+_PRIORITY_NAMES = { PRIORITY_INTERACTIVE: 'interactive',
+                    PRIORITY_PREFETCH: 'prefetch',
+                    PRIORITY_BACKGROUND: 'background' }
+
+# Don't cut the rate more than once within this long, since the calls that
+# were already in flight will often all be rejected together.
+_MIN_DECREASE_INTERVAL_S = 1.0
+
+_local = threading.local()
+
+def get_priority():
+    return getattr(_local, 'priority', PRIORITY_INTERACTIVE)
+
+@contextlib.contextmanager
+def priority(priority_class):
+    """Make the calls in the enclosed block, on this thread, under the given
+    priority-class.
+    """
+
+    previous = get_priority()
+    _local.priority = priority_class
+
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class _RateLimiter(object):
+    """A token-bucket shared by every thread that talks to Drive. The rate
+    adapts to what the server will take: it's increased additively as calls
+    succeed, and cut multiplicatively when we're told that we've exceeded our
+    rate (AIMD). When there's a wait, a higher priority-class always goes
+    before a lower one.
+
+    Nothing is paced until the first time that we're told that we've exceeded
+    our rate. From there, we start from the maximum rate (cut accordingly).
+    """
+
+    def __init__(self, min_rate, max_rate, burst, increase_per_s, 
+                 decrease_factor):
+        self.__rate = float(max_rate)
+        self.__min_rate = float(min_rate)
+        self.__max_rate = float(max_rate)
+        self.__burst = float(burst)
+        self.__increase_per_s = float(increase_per_s)
+        self.__decrease_factor = float(decrease_factor)
+
+        self.__cond = threading.Condition()
+
+        self.__tokens = self.__burst
+        self.__refilled_at = get_monotonic_time()
+        self.__decreased_at = None
+        self.__is_pacing = False
+
+        # priority-class => number of threads waiting
+        self.__waiting = dict([(p, 0) for p in _PRIORITY_NAMES])
+
+        self.__acquired = dict([(p, 0) for p in _PRIORITY_NAMES])
+        self.__waits = dict([(p, 0) for p in _PRIORITY_NAMES])
+        self.__wait_s = dict([(p, 0.0) for p in _PRIORITY_NAMES])
+        self.__throttled = 0
+
+    def __refill(self, now):
+        elapsed_s = now - self.__refilled_at
+        self.__refilled_at = now
+
+        self.__tokens = min(self.__burst,
+                            self.__tokens + elapsed_s * self.__rate)
+
+    def __is_turn(self, priority_class):
+        for p in xrange(priority_class):
+            if self.__waiting[p] > 0:
+                return False
+
+        return self.__tokens >= 1.0
+
+    def acquire(self, count=1):
+        """Wait for our turn to make `count` calls. A batch may take us into
+        debt, which later callers wait-out.
+        """
+
+        priority_class = get_priority()
+
+        with self.__cond:
+            if self.__is_pacing is False:
+                self.__acquired[priority_class] += count
+                return
+
+            now = get_monotonic_time()
+            self.__refill(now)
+
+            if self.__is_turn(priority_class) is False:
+                started_at = now
+                self.__waiting[priority_class] += 1
+
+                try:
+                    while 1:
+                        # Wake when the next token should be there, or when
+                        # someone else takes or returns one.
+                        timeout_s = max(0.01, (1.0 - self.__tokens) /
+                                              self.__rate)
+
+                        self.__cond.wait(timeout_s)
+                        self.__refill(get_monotonic_time())
+
+                        if self.__is_turn(priority_class) is True:
+                            break
+                finally:
+                    self.__waiting[priority_class] -= 1
+
+                self.__waits[priority_class] += 1
+                self.__wait_s[priority_class] += \
+                    get_monotonic_time() - started_at
+
+            self.__tokens -= count
+            self.__acquired[priority_class] += count
+
+            # Let the next one in line check.
+            self.__cond.notify_all()
+
+    def on_success(self):
+        with self.__cond:
+            if self.__is_pacing is False:
+                return
+
+            self.__rate = min(self.__max_rate,
+                              self.__rate +
+                                self.__increase_per_s / self.__rate)
+
+    def on_throttled(self):
+        with self.__cond:
+            self.__throttled += 1
+
+            now = get_monotonic_time()
+            if self.__decreased_at is not None and \
+               now - self.__decreased_at < _MIN_DECREASE_INTERVAL_S:
+                return
+
+            self.__decreased_at = now
+
+            if self.__is_pacing is False:
+                # We've just gone over, so start with an empty bucket.
+                self.__is_pacing = True
+                self.__tokens = 0.0
+                self.__refilled_at = now
+
+            previous_rate = self.__rate
+            self.__rate = max(self.__min_rate,
+                              self.__rate * self.__decrease_factor)
+
+            _logger.warning("Drive is throttling us. Reducing our rate from "
+                            "(%.2f) to (%.2f) calls/second.",
+                            previous_rate, self.__rate)
+
+    def get_stats(self):
+        with self.__cond:
+            by_priority = {}
+            for (p, name) in _PRIORITY_NAMES.iteritems():
+                by_priority[name] = { 'acquired': self.__acquired[p],
+                                      'waits': self.__waits[p],
+                                      'wait_s': self.__wait_s[p],
+                                      'waiting': self.__waiting[p] }
+
+            return { 'pacing': self.__is_pacing,
+                     'rate': self.__rate,
+                     'tokens': self.__tokens,
+                     'throttled': self.__throttled,
+                     'priorities': by_priority }
+
+
+class _NullRateLimiter(object):
+    def acquire(self, count=1):
+        pass
+
+    def on_success(self):
+        pass
+
+    def on_throttled(self):
+        pass
+
+    def get_stats(self):
+        return {}
+
+_instance = None
+_instance_lock = threading.Lock()
+def get_rate_limiter():
+    global _instance
+
+    with _instance_lock:
+        if _instance is None:
+            if Conf.get('api_rate_limit') is True:
+                _instance = _RateLimiter(
+                                Conf.get('api_rate_min_per_s'),
+                                Conf.get('api_rate_max_per_s'),
+                                Conf.get('api_rate_burst'),
+                                Conf.get('api_rate_increase_per_s'),
+                                Conf.get('api_rate_decrease_factor'))
+            else:
+                _instance = _NullRateLimiter()
+
+        return _instance
@@ -0,0 +1,147 @@
+import logging
+import httplib
+import socket
+import urlparse
+
+import httplib2
+
+from gdrivefs.general.metrics import get_metrics
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+_MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class StreamingHttp(object):
+    """Makes authorized GET requests whose successful responses are written
+    to a file as they arrive, a buffer at a time, rather than being read into
+    memory whole (as httplib2 does). Memory use doesn't depend on how much is
+    requested. Like httplib2.Http, the connections are kept alive between
+    requests, and this isn't thread-safe.
+    """
+
+    def __init__(self, credentials, buffer_size=DEFAULT_BUFFER_SIZE,
+                 timeout_s=None):
+        self.__credentials = credentials
+        self.__buffer_size = buffer_size
+        self.__timeout_s = timeout_s
+
+        # (scheme, netloc) => connection
+        self.__connections = {}
+
+    def __get_connection(self, scheme, netloc):
+        try:
+            return self.__connections[(scheme, netloc)]
+        except KeyError:
+            pass
+
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(netloc,
+                                                 timeout=self.__timeout_s)
+        elif scheme == 'http':
+            connection = httplib.HTTPConnection(netloc,
+                                                timeout=self.__timeout_s)
+        else:
+            raise ValueError("Scheme [%s] is not supported." % (scheme,))
+
+        self.__connections[(scheme, netloc)] = connection
+        return connection
+
+    def __close_connection(self, scheme, netloc):
+        connection = self.__connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def __send(self, uri, headers):
+        """Send the request and return the response, with its body unread."""
+
+        parts = urlparse.urlsplit(uri)
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        headers = dict(headers)
+        self.__credentials.apply(headers)
+
+        # The server may have closed a connection that we kept alive. Try once
+        # more, on a new one.
+        for attempt in xrange(2):
+            connection = self.__get_connection(parts.scheme, parts.netloc)
+
+            try:
+                connection.request('GET', path, headers=headers)
+                return connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                self.__close_connection(parts.scheme, parts.netloc)
+
+                if attempt > 0:
+                    raise
+
+                _logger.debug("Request to [%s] failed. Reconnecting.",
+                              parts.netloc)
+
+    def stream(self, uri, headers, fd):
+        """Request the URI and write a successful (2xx) response's body to
+        `fd`. Redirects are followed, and the credentials are refreshed if
+        they're rejected. Return a 3-tuple of the response (whose
+        "content-location" is the URI that was finally requested), the body if
+        it wasn't successful, and how many bytes were written.
+        """
+
+        is_refreshed = False
+        num_redirects = 0
+
+        while 1:
+            r = self.__send(uri, headers)
+
+            if r.status == 401 and is_refreshed is False:
+                r.read()
+
+                _logger.info("Credentials were rejected. Refreshing.")
+                self.__credentials.refresh(httplib2.Http())
+
+                is_refreshed = True
+            elif r.status in _REDIRECT_STATUSES and \
+                 num_redirects < _MAX_REDIRECTS:
+                r.read()
+
+                uri = urlparse.urljoin(uri, r.getheader('location'))
+                num_redirects += 1
+            else:
+                break
+
+        response = httplib2.Response(r)
+        response['content-location'] = uri
+
+        if r.status < 200 or r.status >= 300:
+            return (response, r.read(), 0)
+
+        written_b = 0
+        try:
+            while 1:
+                data = r.read(self.__buffer_size)
+                if not data:
+                    break
+
+                fd.write(data)
+                written_b += len(data)
+        except:
+            # We don't know where we are in the response.
+            parts = urlparse.urlsplit(uri)
+            self.__close_connection(parts.scheme, parts.netloc)
+
+            raise
+        finally:
+            get_metrics().increment('drive_response_bytes_total', written_b)
+
+        return (response, None, written_b)
+
+    def close(self):
+        for connection in self.__connections.values():
+            connection.close()
+
+        self.__connections = {}
@@ -0,0 +1,51 @@
+import logging
+import threading
+import contextlib
+
+_logger = logging.getLogger(__name__)
+
+
+class DemandGate(object):
+    """Keeps track of the work that somebody is waiting on, so that background
+    work can hold off while there is any.
+    """
+
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__active = 0
+
+    @contextlib.contextmanager
+    def demand(self):
+        """Mark the enclosed work as being waited on."""
+
+        with self.__cond:
+            self.__active += 1
+
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__active -= 1
+
+                if self.__active == 0:
+                    self.__cond.notify_all()
+
+    def wait_for_idle(self, timeout_s=None):
+        """Wait until nothing is being waited on. Return False if we timed-out
+        first.
+        """
+
+        with self.__cond:
+            if self.__active > 0:
+                self.__cond.wait(timeout_s)
+
+            return self.__active == 0
+
+    @property
+    def active(self):
+        with self.__cond:
+            return self.__active
+
+_gate = DemandGate()
+def get_demand_gate():
+    return _gate
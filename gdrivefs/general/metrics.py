@@ -0,0 +1,430 @@
+import logging
+import threading
+import contextlib
+import socket
+import os
+import os.path
+import tempfile
+import re
+
+from collections import deque
+
+import gdrivefs.state
+
+from gdrivefs.conf import Conf
+
+_logger = logging.getLogger(__name__)
+
+_PREFIX = 'gdfs'
+
+# The upper-bounds of the histogram buckets, in seconds.
+_LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                      10.0, 30.0)
+
+# How many observations we hold for statsd between exports.
+_MAX_PENDING_TIMINGS = 10000
+
+# The most that we'll put in one statsd datagram.
+_MAX_DATAGRAM_SIZE = 1400
+
+_STATSD_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_\-]')
+
+_local = threading.local()
+
+def get_labels():
+    """Return the labels that are applied to what the current thread
+    records.
+    """
+
+    return getattr(_local, 'labels', {})
+
+@contextlib.contextmanager
+def labels(**kwargs):
+    """Apply the given labels to everything that the current thread records
+    in the enclosed block (in addition to any that are already applied).
+    """
+
+    previous = get_labels()
+
+    current = dict(previous)
+    current.update(kwargs)
+    _local.labels = current
+
+    try:
+        yield
+    finally:
+        _local.labels = previous
+
+def _get_key(name, extra_labels):
+    labels_ = get_labels()
+    if extra_labels:
+        labels_ = dict(labels_)
+        labels_.update(extra_labels)
+
+    return (name, tuple(sorted(labels_.iteritems())))
+
+def _format_prometheus_labels(labels_, extra=()):
+    pairs = list(labels_) + list(extra)
+    if not pairs:
+        return ''
+
+    return '{%s}' % (','.join([('%s="%s"' %
+                                (k, str(v).replace('\\', '\\\\').\
+                                           replace('"', '\\"')))
+                               for (k, v)
+                               in pairs]),)
+
+def _format_statsd_name(name, labels_):
+    parts = [_PREFIX, name] + [_STATSD_UNSAFE_RE.sub('_', str(v))
+                               for (k, v)
+                               in labels_]
+
+    return '.'.join(parts)
+
+def _flatten(prefix, value, labels_, label_name, out):
+    """Turn what a collector returned into (name, labels, value) 3-tuples."""
+
+    if isinstance(value, dict):
+        for (k, v) in value.iteritems():
+            if label_name is not None:
+                _flatten(prefix, v, labels_ + ((label_name, k),), None, out)
+            else:
+                _flatten(('%s_%s' % (prefix, k)), v, labels_, None, out)
+    elif isinstance(value, (bool, int, long, float)):
+        out.append((prefix, labels_, float(value)))
+
+
+class _Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(_LATENCY_BUCKETS_S) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        for upper_bound in _LATENCY_BUCKETS_S:
+            if value <= upper_bound:
+                break
+
+            i += 1
+
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metrics(object):
+    """Counters and latency-histograms, labeled (e.g. by Drive method and by
+    the FUSE operation that it was called for), plus the statistics that the
+    other components already keep, gathered on demand from "collectors".
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+
+        # (name, labels) => value
+        self.__counters = {}
+
+        # (name, labels) => _Histogram
+        self.__histograms = {}
+
+        # name => (callable, label-name)
+        self.__collectors = {}
+
+        # (name, labels, value), for statsd
+        self.__pending_timings = deque(maxlen=_MAX_PENDING_TIMINGS)
+        self.__exported_counters = {}
+
+    def increment(self, name, value=1, **extra_labels):
+        key = _get_key(name, extra_labels)
+
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name, value_s, **extra_labels):
+        key = _get_key(name, extra_labels)
+
+        with self.__lock:
+            try:
+                histogram = self.__histograms[key]
+            except KeyError:
+                histogram = _Histogram()
+                self.__histograms[key] = histogram
+
+            histogram.observe(value_s)
+            self.__pending_timings.append((key, value_s))
+
+    def register_collector(self, name, f, label_name=None):
+        """Gather f()'s dictionary of statistics whenever we're read. If
+        `label_name` is given, the top-level keys are taken to be values of
+        that label (e.g. method names).
+        """
+
+        with self.__lock:
+            self.__collectors[name] = (f, label_name)
+
+    def __collect(self):
+        with self.__lock:
+            collectors = self.__collectors.items()
+
+        collected = []
+        for (name, (f, label_name)) in collectors:
+            try:
+                _flatten(name, f(), (), label_name, collected)
+            except:
+                _logger.exception("Could not collect statistics from [%s].",
+                                  name)
+
+        return collected
+
+    def get_snapshot(self):
+        """Return everything that we've recorded and collected, as a
+        dictionary.
+        """
+
+        # Everything is keyed by (name, ((label, value), ...)).
+
+        with self.__lock:
+            counters = dict(self.__counters)
+
+            histograms = {}
+            for ((name, labels_), histogram) in self.__histograms.iteritems():
+                histograms[(name, labels_)] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': zip(_LATENCY_BUCKETS_S + (float('inf'),),
+                                   histogram.counts) }
+
+        collected = dict([((name, labels_), value)
+                          for (name, labels_, value)
+                          in self.__collect()])
+
+        return { 'counters': counters,
+                 'histograms': histograms,
+                 'collected': collected }
+
+    def format_prometheus(self):
+        """Render everything in the Prometheus text format."""
+
+        lines = []
+
+        with self.__lock:
+            counters = sorted(self.__counters.iteritems())
+
+            histograms = [(key, list(histogram.counts), histogram.sum,
+                           histogram.count)
+                          for (key, histogram)
+                          in sorted(self.__histograms.iteritems())]
+
+        typed = set()
+        for ((name, labels_), value) in counters:
+            full_name = ('%s_%s' % (_PREFIX, name))
+            if full_name not in typed:
+                lines.append('# TYPE %s counter' % (full_name,))
+                typed.add(full_name)
+
+            lines.append('%s%s %s' % (full_name,
+                                      _format_prometheus_labels(labels_),
+                                      repr(float(value))))
+
+        for ((name, labels_), counts, sum_, count) in histograms:
+            full_name = ('%s_%s' % (_PREFIX, name))
+            if full_name not in typed:
+                lines.append('# TYPE %s histogram' % (full_name,))
+                typed.add(full_name)
+
+            cumulative = 0
+            for (upper_bound, n) in zip(_LATENCY_BUCKETS_S + ('+Inf',),
+                                        counts):
+                cumulative += n
+                lines.append('%s_bucket%s %d' %
+                             (full_name,
+                              _format_prometheus_labels(
+                                labels_,
+                                (('le', upper_bound),)),
+                              cumulative))
+
+            lines.append('%s_sum%s %s' %
+                         (full_name, _format_prometheus_labels(labels_),
+                          repr(sum_)))
+
+            lines.append('%s_count%s %d' %
+                         (full_name, _format_prometheus_labels(labels_),
+                          count))
+
+        for (name, labels_, value) in sorted(self.__collect()):
+            full_name = ('%s_%s' % (_PREFIX, name))
+            if full_name not in typed:
+                lines.append('# TYPE %s gauge' % (full_name,))
+                typed.add(full_name)
+
+            lines.append('%s%s %s' % (full_name,
+                                      _format_prometheus_labels(labels_),
+                                      repr(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def format_statsd(self):
+        """Return statsd lines for what's changed since the last time that
+        this was called: counter increments, each latency observation, and
+        the current value of everything that's collected.
+        """
+
+        with self.__lock:
+            counters = self.__counters.items()
+            timings = list(self.__pending_timings)
+            self.__pending_timings.clear()
+
+            deltas = []
+            for (key, value) in counters:
+                delta = value - self.__exported_counters.get(key, 0)
+                if delta != 0:
+                    deltas.append((key, delta))
+                    self.__exported_counters[key] = value
+
+        lines = []
+
+        for ((name, labels_), delta) in deltas:
+            lines.append('%s:%s|c' % (_format_statsd_name(name, labels_),
+                                      delta))
+
+        for ((name, labels_), value_s) in timings:
+            lines.append('%s:%.3f|ms' % (_format_statsd_name(name, labels_),
+                                         value_s * 1000.0))
+
+        for (name, labels_, value) in self.__collect():
+            lines.append('%s:%s|g' % (_format_statsd_name(name, labels_),
+                                      value))
+
+        return lines
+
+
+class _MetricsExporter(object):
+    """Periodically sends our metrics to statsd and/or writes them to a file
+    in the Prometheus text format (e.g. for node_exporter's textfile
+    collector).
+    """
+
+    def __init__(self, metrics, statsd_address, prometheus_filepath,
+                 interval_s):
+        self.__metrics = metrics
+        self.__statsd_address = statsd_address
+        self.__prometheus_filepath = prometheus_filepath
+        self.__interval_s = interval_s
+
+        self.__t = None
+        self.__t_quit_ev = threading.Event()
+
+    def __send_statsd(self, s):
+        datagram = []
+        size = 0
+
+        for line in self.__metrics.format_statsd():
+            if datagram and size + len(line) + 1 > _MAX_DATAGRAM_SIZE:
+                s.sendto('\n'.join(datagram), self.__statsd_address)
+                datagram = []
+                size = 0
+
+            datagram.append(line)
+            size += len(line) + 1
+
+        if datagram:
+            s.sendto('\n'.join(datagram), self.__statsd_address)
+
+    def __write_prometheus(self):
+        filepath = self.__prometheus_filepath
+
+        # Write it alongside and then move it into place, so that a reader
+        # never sees a partial file.
+        (fd, temp_filepath) = tempfile.mkstemp(
+                                dir=os.path.dirname(filepath),
+                                prefix='.metrics.')
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.__metrics.format_prometheus())
+
+            os.rename(temp_filepath, filepath)
+        except:
+            os.remove(temp_filepath)
+            raise
+
+    def __export(self):
+        _logger.info("Metrics-export thread running.")
+
+        s = None
+        if self.__statsd_address is not None:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        try:
+            while self.__t_quit_ev.is_set() is False and \
+                    gdrivefs.state.GLOBAL_EXIT_EVENT.is_set() is False:
+                self.__t_quit_ev.wait(self.__interval_s)
+
+                try:
+                    if s is not None:
+                        self.__send_statsd(s)
+
+                    if self.__prometheus_filepath is not None:
+                        self.__write_prometheus()
+                except:
+                    _logger.exception("Could not export metrics.")
+        finally:
+            if s is not None:
+                s.close()
+
+        _logger.info("Metrics-export thread terminating.")
+
+    def start(self):
+        _logger.info("Starting metrics-export thread.")
+
+        self.__t = threading.Thread(target=self.__export)
+        self.__t.daemon = True
+        self.__t.start()
+
+    def stop(self):
+        _logger.info("Stopping metrics-export thread.")
+
+        self.__t_quit_ev.set()
+
+        if self.__t is not None:
+            self.__t.join()
+
+_metrics = _Metrics()
+def get_metrics():
+    return _metrics
+
+_exporter = None
+def start_exporter():
+    """Start exporting, if we've been told where to. Return the exporter, or
+    None.
+    """
+
+    global _exporter
+
+    statsd_address = Conf.get('metrics_statsd_address')
+    prometheus_filepath = Conf.get('metrics_prometheus_filepath')
+
+    if statsd_address is None and prometheus_filepath is None:
+        _logger.info("Metrics won't be exported.")
+        return None
+
+    if statsd_address is not None:
+        (host, port) = statsd_address.rsplit(':', 1)
+        statsd_address = (host, int(port))
+
+    if prometheus_filepath is not None:
+        prometheus_filepath = os.path.abspath(prometheus_filepath)
+
+    _exporter = _MetricsExporter(
+                    _metrics,
+                    statsd_address,
+                    prometheus_filepath,
+                    float(Conf.get('metrics_export_interval_s')))
+
+    _exporter.start()
+    return _exporter
+
+def stop_exporter():
+    if _exporter is not None:
+        _exporter.stop()
@@ -0,0 +1,67 @@
+import logging
+import threading
+import sys
+
+import six
+
+_logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Makes sure that only one invocation is in progress for a given key at
+    any one time. Callers that arrive while it's running wait for it, and
+    receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+    def do(self, key, f, *args, **kwargs):
+        """Invoke f(*args, **kwargs) unless an invocation under the same key is
+        already running. Return a 2-tuple of the result and whether it was
+        shared with another caller.
+        """
+
+        with self.__lock:
+            call = self.__calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self.__calls[key] = call
+                is_leader = True
+
+        if is_leader is False:
+            call.event.wait()
+
+            if call.exc_info is not None:
+                six.reraise(*call.exc_info)
+
+            return (call.result, True)
+
+        try:
+            call.result = f(*args, **kwargs)
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+
+            call.event.set()
+
+        return (call.result, False)
+
+    def is_in_flight(self, key):
+        with self.__lock:
+            return key in self.__calls
@@ -1,3 +1,8 @@
+import sys
+import time
+import ctypes
+import ctypes.util
+
 from math import floor
 from datetime import datetime
 from dateutil.tz import tzlocal, tzutc
@@ -70,3 +75,43 @@ def get_flat_normal_fs_time_from_epoch(epoch):
 
 #    print("get_flat_normal_fs_time_from_epoch(%s) => %s" % (epoch, flat_normal))
     return flat_normal
+
+def _build_monotonic_clock():
+    """Return a function that gives seconds on a clock that never goes 
+    backwards (and isn't affected by changes to the system time). This is only 
+    good for measuring intervals.
+    """
+
+    try:
+        return time.monotonic
+    except AttributeError:
+        pass
+
+    # Python 2 doesn't expose one, so go to clock_gettime() directly.
+
+    class _timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), 
+                    ('tv_nsec', ctypes.c_long)]
+
+    clock_id = 6 if sys.platform == 'darwin' else 1 # CLOCK_MONOTONIC
+
+    try:
+        library_name = ctypes.util.find_library('rt') or \
+                       ctypes.util.find_library('c')
+
+        clock_gettime = ctypes.CDLL(library_name, use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def monotonic():
+        ts = _timespec()
+        if clock_gettime(clock_id, ctypes.pointer(ts)) != 0:
+            raise OSError(ctypes.get_errno(), "clock_gettime() failed.")
+
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic
+
+get_monotonic_time = _build_monotonic_clock()
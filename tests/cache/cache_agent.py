@@ -0,0 +1,134 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.time_support import get_monotonic_time
+from gdrivefs.cache.cache_agent import CacheAgent
+
+class CacheAgentTestCase(TestCase):
+    """Test the CacheAgent class."""
+
+    def setUp(self):
+        self.resource_name = 'test-%s' % (id(self))
+
+        self.fault_calls = []
+        self.fault_ev = threading.Event()
+
+    def __fault_handler(self, resource_name, key):
+        self.fault_calls.append(key)
+        self.fault_ev.wait(10)
+
+        value = 'new-%s' % (key,)
+        self.agent.set(key, value)
+
+        return value
+
+    def __wait_for(self, f, timeout_s=10):
+        stop_at = time.time() + timeout_s
+        while f() is False:
+            self.assertLess(time.time(), stop_at)
+            time.sleep(0.01)
+
+    def test_stale_while_revalidate(self):
+        """Test that a stale entry is returned as-is while exactly one 
+        refresh of it happens in the background, and that the refreshed 
+        value is returned after that.
+        """
+
+        self.agent = CacheAgent(self.resource_name, 
+                                0.5, 
+                                fault_handler=self.__fault_handler, 
+                                max_stale_age=60)
+
+        self.agent.set('a', 'old-a')
+        time.sleep(0.6)
+
+        for i in xrange(5):
+            self.assertEqual(self.agent.get('a'), 'old-a')
+
+        self.__wait_for(lambda: len(self.fault_calls) == 1)
+
+        # The refresh is still in progress, so no others are started.
+        self.assertEqual(self.agent.get('a'), 'old-a')
+        time.sleep(0.1)
+        self.assertEqual(self.fault_calls, ['a'])
+
+        self.fault_ev.set()
+
+        self.__wait_for(lambda: self.agent.get('a') == 'new-a')
+
+        self.assertEqual(self.fault_calls, ['a'])
+        self.assertGreaterEqual(self.agent.get_stats()['stale_hits'], 6)
+
+    def test_stale_too_old(self):
+        """Test that an entry older than the stale-age is retrieved again, 
+        in the foreground.
+        """
+
+        self.fault_ev.set()
+
+        self.agent = CacheAgent(self.resource_name, 
+                                0.01, 
+                                fault_handler=self.__fault_handler, 
+                                max_stale_age=0.05)
+
+        self.agent.set('a', 'old-a')
+        time.sleep(0.1)
+
+        self.assertEqual(self.agent.get('a'), 'new-a')
+        self.assertEqual(self.fault_calls, ['a'])
+
+    def test_lease(self):
+        """Test that entries don't expire while the lease is held, and that 
+        they expire by age once it's revoked.
+        """
+
+        self.fault_ev.set()
+
+        self.agent = CacheAgent(self.resource_name, 
+                                0.05, 
+                                fault_handler=self.__fault_handler)
+
+        self.agent.set('a', 'old-a')
+        self.agent.extend_validity(60)
+
+        time.sleep(0.1)
+
+        self.assertTrue(self.agent.exists('a'))
+        self.assertEqual(self.agent.get('a'), 'old-a')
+        self.assertEqual(self.fault_calls, [])
+
+        # Nothing is due until the lease runs out.
+        self.assertGreater(self.agent.cleanup_expired(), 
+                           get_monotonic_time() + 30)
+        self.assertTrue(self.agent.exists('a'))
+
+        stats = self.agent.get_stats()
+        self.assertTrue(stats['lease_valid'])
+        self.assertEqual(stats['lease_hits'], 1)
+
+        self.agent.revoke_validity()
+
+        self.assertFalse(self.agent.get_stats()['lease_valid'])
+        self.assertEqual(self.agent.get('a'), 'new-a')
+        self.assertEqual(self.fault_calls, ['a'])
+
+    def test_lease_lapsed(self):
+        """Test that entries expire by age once a lease that isn't extended 
+        runs out.
+        """
+
+        self.agent = CacheAgent(self.resource_name, 0.05)
+
+        self.agent.set('a', 'old-a')
+        self.agent.extend_validity(0.1)
+
+        time.sleep(0.06)
+        self.assertTrue(self.agent.exists('a'))
+
+        time.sleep(0.1)
+        self.assertFalse(self.agent.exists('a'))
+
+if __name__ == '__main__':
+    main()
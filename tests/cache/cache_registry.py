@@ -0,0 +1,131 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.time_support import get_monotonic_time
+from gdrivefs.cache.cache_registry import CacheRegistry, CacheFault
+
+class CacheRegistryTestCase(TestCase):
+    """Test the CacheRegistry class."""
+
+    def setUp(self):
+        self.resource_name = 'test-%s' % (id(self))
+        self.registry = CacheRegistry.get_instance(self.resource_name)
+
+    def test_cleanup_expired(self):
+        """Test that only expired entries are cleaned-up, and that the
+        pre-cleanup trigger sees each of them.
+        """
+
+        triggered = []
+        pretrigger = lambda resource_name, key, force: triggered.append(key)
+
+        self.registry.set(self.resource_name, 'a', 1)
+        self.registry.set(self.resource_name, 'b', 2)
+
+        self.assertEqual(self.registry.cleanup_expired(self.resource_name, 60, 
+                                                       pretrigger), 0)
+
+        time.sleep(0.05)
+
+        # Setting an entry again restarts its clock.
+        self.registry.set(self.resource_name, 'b', 3)
+
+        removed = self.registry.cleanup_expired(self.resource_name, 0.01, 
+                                                pretrigger)
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(triggered, ['a'])
+        self.assertEqual(self.registry.get(self.resource_name, 'b', None), 3)
+
+        self.assertRaises(CacheFault, self.registry.get, 
+                          self.resource_name, 'a', None)
+
+    def test_next_expiry(self):
+        """Test that the next expiry follows the oldest entry."""
+
+        self.assertIsNone(self.registry.get_next_expiry(self.resource_name, 
+                                                        10))
+
+        self.registry.set(self.resource_name, 'a', 1)
+
+        next_expiry = self.registry.get_next_expiry(self.resource_name, 10)
+        self.assertLessEqual(next_expiry - get_monotonic_time(), 10)
+        self.assertGreater(next_expiry - get_monotonic_time(), 9)
+
+    def test_evict_over_limit(self):
+        """Test that the least-recently-used entries are evicted once we're 
+        over the limit.
+        """
+
+        self.registry.set_limits(self.resource_name, max_count=2)
+
+        self.registry.set(self.resource_name, 'a', 1)
+        self.registry.set(self.resource_name, 'b', 2)
+        self.registry.get(self.resource_name, 'a', None)
+        self.registry.set(self.resource_name, 'c', 3)
+
+        self.assertTrue(self.registry.is_over_limit(self.resource_name))
+        self.assertEqual(self.registry.evict_over_limit(self.resource_name), 1)
+
+        self.assertFalse(self.registry.exists(self.resource_name, 'b', None))
+        self.assertTrue(self.registry.exists(self.resource_name, 'a', None))
+        self.assertEqual(self.registry.get_stats(self.resource_name)['evictions'],
+                         1)
+
+    def test_evict_set_again(self):
+        """Test that an entry that is set again after it was selected for 
+        eviction is neither pruned by the pre-cleanup trigger nor removed.
+        """
+
+        self.registry.set_limits(self.resource_name, max_count=1)
+
+        self.registry.set(self.resource_name, 'a', 1)
+        self.registry.set(self.resource_name, 'b', 2)
+        self.registry.set(self.resource_name, 'c', 3)
+
+        triggered = []
+        def pretrigger(resource_name, key, force):
+            triggered.append(key)
+
+            # Both 'a' and 'b' were selected. Set 'b' again before we get to
+            # it.
+            if key == 'a':
+                self.registry.set(self.resource_name, 'b', 4)
+
+        self.assertEqual(self.registry.evict_over_limit(self.resource_name, 
+                                                        pretrigger), 1)
+
+        self.assertEqual(triggered, ['a'])
+        self.assertEqual(self.registry.get(self.resource_name, 'b', None), 4)
+
+    def test_stale_pretrigger_unlocked(self):
+        """Test that the pre-cleanup trigger of an entry found to be stale 
+        runs without the registry lock held (the trigger usually takes a lock
+        that is held while entries are set).
+        """
+
+        self.registry.set(self.resource_name, 'a', 1)
+        time.sleep(0.05)
+
+        set_ev = threading.Event()
+
+        def set_other():
+            self.registry.set(self.resource_name, 'b', 2)
+            set_ev.set()
+
+        def pretrigger(resource_name, key, force):
+            t = threading.Thread(target=set_other)
+            t.start()
+
+            set_ev.wait(2)
+
+        self.assertRaises(CacheFault, self.registry.get, 
+                          self.resource_name, 'a', 0.01, pretrigger)
+
+        self.assertTrue(set_ev.is_set())
+        self.assertFalse(self.registry.exists(self.resource_name, 'a', None))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+from unittest import TestCase, main
+
+from gdrivefs.cache.name_index import NameIndex, MAX_DUPLICATE_SUFFIX
+
+def _clause(entry_id):
+    return [None, None, None, entry_id, False]
+
+class NameIndexTestCase(TestCase):
+    """Test the NameIndex class."""
+
+    def setUp(self):
+        self.index = NameIndex()
+
+    def tearDown(self):
+        self.index = None
+
+    def test_duplicates(self):
+        """Test that duplicates get the first free "name (N)" variation."""
+
+        self.assertEqual(self.index.add('a', _clause('1')), 'a')
+        self.assertEqual(self.index.add('a', _clause('2')), 'a (1)')
+        self.assertEqual(self.index.add('a', _clause('3')), 'a (2)')
+
+        self.assertEqual(self.index.remove('2'), 'a (1)')
+        self.assertEqual(self.index.add('a', _clause('4')), 'a (1)')
+
+        self.assertEqual(self.index.remove('1'), 'a')
+        self.assertEqual(self.index.add('a', _clause('5')), 'a')
+
+        self.assertEqual(self.index.get('a (2)')[3], '3')
+        self.assertEqual(self.index.get_name('4'), 'a (1)')
+        self.assertEqual(len(self.index), 3)
+
+    def test_literal_variation(self):
+        """Test titles that already look like a variation of another name."""
+
+        self.index.add('a', _clause('1'))
+        self.index.add('a (1)', _clause('2'))
+
+        self.assertEqual(self.index.add('a', _clause('3')), 'a (2)')
+
+        self.index.remove('2')
+        self.assertEqual(self.index.add('a', _clause('4')), 'a (1)')
+
+    def test_limit(self):
+        """Test that we refuse more duplicates than we can name."""
+
+        for i in range(MAX_DUPLICATE_SUFFIX + 1):
+            self.assertIsNotNone(self.index.add('a', _clause(str(i))))
+
+        self.assertIsNone(self.index.add('a', _clause('x')))
+
+    def test_iteration(self):
+        """Test that children are listed in the order they were added."""
+
+        self.index.add('b', _clause('1'))
+        self.index.add('a', _clause('2'))
+        self.index.add('b', _clause('3'))
+        self.index.remove('2')
+
+        self.assertEqual([filename for (filename, clause) in self.index], 
+                         ['b', 'b (1)'])
+
+if __name__ == '__main__':
+    main()
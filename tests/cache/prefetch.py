@@ -0,0 +1,157 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+import gdrivefs.cache.prefetch
+
+from gdrivefs.cache.prefetch import _DirectoryPrefetcher
+
+
+class _FakePathRelations(object):
+    """Serves the subdirectories of each directory from a dictionary. A 
+    prefetch of the directory in `hold_id` waits on `hold_ev`.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.prefetched = []
+
+        self.hold_id = None
+        self.hold_ev = threading.Event()
+        self.held_ev = threading.Event()
+
+    def get_instance(self):
+        return self
+
+    def are_children_loaded(self, entry_id):
+        return entry_id in self.prefetched
+
+    def prefetch_children(self, entry_id):
+        if entry_id == self.hold_id:
+            self.held_ev.set()
+            self.hold_ev.wait(10)
+
+        self.prefetched.append(entry_id)
+
+        return [ (entry_id + '-' + name, entry_id + '-' + name)
+                 for name 
+                 in self.tree.get(entry_id, []) ]
+
+
+class DirectoryPrefetcherTestCase(TestCase):
+    """Test the _DirectoryPrefetcher class against a stand-in for the 
+    PathRelations.
+    """
+
+    def setUp(self):
+        self.pr = None
+        self.prefetcher = None
+
+        self.__original_path_relations = \
+            gdrivefs.cache.prefetch.PathRelations
+
+    def tearDown(self):
+        if self.prefetcher is not None:
+            self.pr.hold_ev.set()
+            self.prefetcher.stop()
+
+        gdrivefs.cache.prefetch.PathRelations = \
+            self.__original_path_relations
+
+    def __start(self, tree, max_depth=1, max_queued=1000):
+        self.pr = _FakePathRelations(tree)
+        gdrivefs.cache.prefetch.PathRelations = self.pr
+
+        self.prefetcher = _DirectoryPrefetcher(max_depth, 1, max_queued)
+
+    def __wait_for_idle(self, timeout_s=10):
+        stop_at = time.time() + timeout_s
+        while 1:
+            stats = self.prefetcher.get_stats()
+            if stats['pending'] == 0 and \
+               stats['prefetched'] + stats['cancelled'] >= \
+                    stats['queued'] - stats['dropped']:
+                break
+
+            self.assertLess(time.time(), stop_at)
+            time.sleep(0.01)
+
+    def test_cancel(self):
+        """Test that what was queued for a directory is dropped once the walk
+        leaves it.
+        """
+
+        self.__start({})
+        self.pr.hold_id = 'a'
+
+        self.prefetcher.notify_listed(1, '/d', [('a', 'a'), ('b', 'b')])
+        self.pr.held_ev.wait(10)
+
+        # Another process's walk doesn't affect ours.
+        self.prefetcher.notify_listed(2, '/other', [])
+
+        # We've moved on.
+        self.prefetcher.notify_listed(1, '/elsewhere', [])
+        self.pr.hold_ev.set()
+
+        self.__wait_for_idle()
+
+        self.assertEqual(self.pr.prefetched, ['a'])
+        self.assertEqual(self.prefetcher.get_stats()['cancelled'], 1)
+
+    def test_within(self):
+        """Test that moving deeper into the directory doesn't cancel what was
+        queued for it.
+        """
+
+        self.__start({})
+        self.pr.hold_id = 'a'
+
+        self.prefetcher.notify_listed(1, '/d', [('a', 'a'), ('b', 'b')])
+        self.pr.held_ev.wait(10)
+
+        self.prefetcher.notify_listed(1, '/d/a', [])
+        self.pr.hold_ev.set()
+
+        self.__wait_for_idle()
+
+        self.assertEqual(self.pr.prefetched, ['a', 'b'])
+
+    def test_depth(self):
+        """Test that subdirectories are only prefetched down to the maximum
+        depth.
+        """
+
+        self.__start({ 'a': ['b'], 'a-b': ['c'] }, max_depth=2)
+
+        self.prefetcher.notify_listed(1, '/', [('a', 'a')])
+
+        self.__wait_for_idle()
+
+        self.assertEqual(self.pr.prefetched, ['a', 'a-b'])
+
+    def test_max_queued(self):
+        """Test that the oldest of what's queued is dropped past the 
+        maximum.
+        """
+
+        self.__start({}, max_queued=2)
+        self.pr.hold_id = 'x'
+
+        # Occupy the worker.
+        self.prefetcher.notify_listed(1, '/', [('x', 'x')])
+        self.pr.held_ev.wait(10)
+
+        self.prefetcher.notify_listed(1, '/', [('a', 'a'), ('b', 'b')])
+        self.prefetcher.notify_listed(1, '/', [('c', 'c'), ('d', 'd')])
+
+        self.pr.hold_ev.set()
+
+        self.__wait_for_idle()
+
+        self.assertEqual(self.pr.prefetched, ['x', 'c', 'd'])
+        self.assertEqual(self.prefetcher.get_stats()['dropped'], 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import os.path
+import shutil
+import sqlite3
+import tempfile
+
+from unittest import TestCase, main
+
+from gdrivefs.conf import Conf
+from gdrivefs.cache.snapshot import _MetadataSnapshot, _SCHEMA_VERSION
+
+
+class _FakeEntry(object):
+    def __init__(self, entry_id, title):
+        self.id = entry_id
+        self.raw_data = { u'id': entry_id, u'title': title }
+
+
+class MetadataSnapshotTestCase(TestCase):
+    """Test the _MetadataSnapshot class."""
+
+    def setUp(self):
+        self.__original_interval_s = \
+            Conf.get('metadata_snapshot_flush_interval_s')
+
+        # As it would arrive as a mount-option.
+        Conf.set('metadata_snapshot_flush_interval_s', '0.01')
+
+        self.path = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.path, 'snapshot')
+
+    def tearDown(self):
+        Conf.set('metadata_snapshot_flush_interval_s', 
+                 self.__original_interval_s)
+
+        shutil.rmtree(self.path)
+
+    def __write(self, callback):
+        snapshot = _MetadataSnapshot(self.filepath)
+        snapshot.start()
+
+        try:
+            callback(snapshot)
+        finally:
+            snapshot.stop()
+
+    def test_restore(self):
+        """Test that what one mount records is what the next one loads."""
+
+        def record(snapshot):
+            snapshot.set_value('root_id', 'root')
+            snapshot.put_entry(_FakeEntry('dir1', u'dir1'))
+            snapshot.put_entry(_FakeEntry('file1', u'file1'))
+            snapshot.set_children_loaded('dir1')
+            snapshot.set_change_id(123)
+
+        self.__write(record)
+
+        (values, raw_entries, loaded_ids) = \
+            _MetadataSnapshot(self.filepath).load()
+
+        self.assertEqual(values['root_id'], 'root')
+        self.assertEqual(int(values['at_change_id']), 123)
+
+        self.assertEqual(sorted(raw_entry[u'id'] 
+                                for raw_entry 
+                                in raw_entries), 
+                         ['dir1', 'file1'])
+
+        self.assertEqual(loaded_ids, ['dir1'])
+
+    def test_invalidate(self):
+        """Test that removing an entry or flagging a directory as no longer 
+        loaded is reflected in what the next mount loads, and that a 
+        snapshot is discarded when cleared or written by another version.
+        """
+
+        def record(snapshot):
+            snapshot.put_entry(_FakeEntry('dir1', u'dir1'))
+            snapshot.put_entry(_FakeEntry('dir2', u'dir2'))
+            snapshot.set_children_loaded('dir1')
+            snapshot.set_children_loaded('dir2')
+            snapshot.set_change_id(5)
+
+        self.__write(record)
+
+        def invalidate(snapshot):
+            snapshot.remove_entry('dir1')
+            snapshot.set_children_loaded('dir2', False)
+
+        self.__write(invalidate)
+
+        (values, raw_entries, loaded_ids) = \
+            _MetadataSnapshot(self.filepath).load()
+
+        self.assertEqual([raw_entry[u'id'] for raw_entry in raw_entries], 
+                         ['dir2'])
+
+        self.assertEqual(loaded_ids, [])
+
+        _MetadataSnapshot(self.filepath).clear()
+
+        (values, raw_entries, loaded_ids) = \
+            _MetadataSnapshot(self.filepath).load()
+
+        self.assertNotIn('at_change_id', values)
+        self.assertEqual(raw_entries, [])
+
+        # A snapshot from another version is thrown away when opened.
+
+        self.__write(record)
+
+        conn = sqlite3.connect(self.filepath)
+        with conn:
+            conn.execute("UPDATE state SET value = ? WHERE key = 'version'",
+                         (str(_SCHEMA_VERSION + 1),))
+        conn.close()
+
+        (values, raw_entries, loaded_ids) = \
+            _MetadataSnapshot(self.filepath).load()
+
+        self.assertEqual(values, { 'version': str(_SCHEMA_VERSION) })
+        self.assertEqual(raw_entries, [])
+        self.assertEqual(loaded_ids, [])
+
+if __name__ == '__main__':
+    main()
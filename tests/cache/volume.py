@@ -0,0 +1,366 @@
+import itertools
+import threading
+import time
+
+from unittest import TestCase, main
+
+import gdrivefs.cache.volume
+
+from gdrivefs.conf import Conf
+from gdrivefs.gdtool.normal_entry import NormalEntry
+from gdrivefs.cache.volume import PathRelations, EntryCache, CLAUSE_ID
+
+_test_serials = itertools.count()
+
+def _build_raw_entry(entry_id, title, parent_id=None, is_directory=False):
+    raw_data = {
+        u'id': entry_id,
+        u'title': title,
+        u'mimeType': Conf.get('directory_mimetype')
+                        if is_directory is True
+                        else u'text/plain',
+        u'labels': {},
+        u'lastModifyingUserName': u'user',
+        u'writersCanShare': True,
+        u'ownerNames': [u'user'],
+        u'editable': True,
+        u'userPermission': {},
+        u'modifiedDate': u'2015-01-01T00:00:00.000Z',
+        u'modifiedByMeDate': u'2015-01-01T00:00:00.000Z',
+        u'lastViewedByMeDate': u'2015-01-01T00:00:00.000Z',
+        u'parents': [{ u'id': parent_id }] if parent_id is not None else [],
+    }
+
+    if is_directory is False:
+        raw_data[u'fileSize'] = u'0'
+
+    return raw_data
+
+
+class _FakeAccountInfo(object):
+    root_id = None
+
+    @classmethod
+    def get_instance(cls):
+        return cls
+
+
+class _FakeDrive(object):
+    """Serves a single directory (the root) of files, a page at a time. 
+    Each page after the first repeats the last `overlap` entries of the one 
+    before it. Any `unlisted` files can only be found by name.
+    """
+
+    def __init__(self, root_id, filenames, page_size, overlap=0, 
+                 unlisted=[]):
+        self.root_id = root_id
+        self.page_size = page_size
+        self.overlap = overlap
+
+        # If set, listings wait on this.
+        self.gate = None
+        self.listing_ev = threading.Event()
+
+        self.raw_entries = {
+            root_id: _build_raw_entry(root_id, u'root', is_directory=True) }
+
+        self.children_ids = []
+        self.unlisted_ids = []
+        for filename in filenames + unlisted:
+            entry_id = root_id + '-' + filename
+            self.raw_entries[entry_id] = _build_raw_entry(entry_id, filename,
+                                                          root_id)
+
+            if filename in unlisted:
+                self.unlisted_ids.append(entry_id)
+            else:
+                self.children_ids.append(entry_id)
+
+        self.page_calls = 0
+        self.name_calls = 0
+        self.batches = []
+
+    def get_entry(self, entry_id):
+        return NormalEntry('direct_read', self.raw_entries[entry_id])
+
+    def get_entries(self, entry_ids):
+        self.batches.append(list(entry_ids))
+
+        return dict([ (entry_id, self.get_entry(entry_id)) 
+                      for entry_id 
+                      in entry_ids ])
+
+    def list_files_page(self, parent_id=None, page_token=None,
+                        max_results=None, **kwargs):
+        self.page_calls += 1
+        self.listing_ev.set()
+
+        if self.gate is not None:
+            self.gate.wait()
+
+        children_ids = self.children_ids if parent_id == self.root_id else []
+
+        start_at = page_token or 0
+        page_size = self.page_size
+        if max_results is not None:
+            page_size = min(page_size, max_results)
+
+        page_ids = children_ids[start_at:start_at + page_size]
+        entries = [ self.get_entry(entry_id) for entry_id in page_ids ]
+
+        next_token = start_at + page_size - self.overlap
+        if next_token >= len(children_ids):
+            next_token = None
+
+        return (entries, next_token)
+
+    def list_files(self, parent_id=None, query_is_string=None, **kwargs):
+        self.name_calls += 1
+
+        return [ self.get_entry(entry_id)
+                 for entry_id
+                 in self.children_ids + self.unlisted_ids
+                 if parent_id == self.root_id and \
+                    self.raw_entries[entry_id][u'title'] == query_is_string ]
+
+
+class PathRelationsTestCase(TestCase):
+    """Test the PathRelations class against a stand-in for Drive."""
+
+    def setUp(self):
+        # The entries are cached by ID in shared singletons, so every test
+        # gets its own IDs.
+        self.root_id = 'root%d' % (next(_test_serials))
+
+        self.gd = _FakeDrive(self.root_id, ['a', 'b', 'c', 'd', 'e'], 2)
+
+        self.__original_get_gdrive = gdrivefs.cache.volume.get_gdrive
+        self.__original_account_info = gdrivefs.cache.volume.AccountInfo
+
+        gdrivefs.cache.volume.get_gdrive = lambda: self.gd
+        gdrivefs.cache.volume.AccountInfo = _FakeAccountInfo
+        _FakeAccountInfo.root_id = self.root_id
+
+        # The entry-cache holds onto whichever drive it was created with.
+        EntryCache.get_instance()._EntryCache__gd = self.gd
+
+        self.pr = PathRelations.get_instance()
+
+    def tearDown(self):
+        gdrivefs.cache.volume.get_gdrive = self.__original_get_gdrive
+        gdrivefs.cache.volume.AccountInfo = self.__original_account_info
+
+        with PathRelations.rlock:
+            PathRelations.entry_ll.clear()
+            PathRelations.path_cache.clear()
+            PathRelations.path_cache_byid.clear()
+
+    def test_missing_after_eviction(self):
+        """Test that a child that was evicted from a directory that had been
+        completely listed is looked-up again rather than reported missing.
+        """
+
+        self.pr.get_children_from_entry_id(self.root_id)
+        self.assertTrue(self.pr.are_children_loaded(self.root_id))
+
+        # Everything is known, so this doesn't need to ask.
+        self.assertIsNone(self.pr.get_clause_from_path('/x'))
+        self.assertEqual(self.gd.name_calls, 0)
+
+        child_id = self.root_id + '-b'
+        self.pr.remove_entry_recursive(child_id, is_eviction=True)
+
+        self.assertFalse(self.pr.are_children_loaded(self.root_id))
+
+        clause = self.pr.get_clause_from_path('/b')
+
+        self.assertIsNotNone(clause)
+        self.assertEqual(clause[CLAUSE_ID], child_id)
+        self.assertEqual(self.gd.name_calls, 1)
+
+    def test_missing_after_removal(self):
+        """Test that a child that was removed from the account (e.g. by the 
+        change-feed) leaves its directory completely listed, and is 
+        remembered as missing.
+        """
+
+        self.pr.get_children_from_entry_id(self.root_id)
+
+        missing_count = self.pr.get_missing_stats()['entries']
+
+        child_id = self.root_id + '-b'
+        self.pr.remove_entry_all(child_id)
+
+        self.assertTrue(self.pr.are_children_loaded(self.root_id))
+        self.assertEqual(self.pr.get_missing_stats()['entries'], 
+                         missing_count + 1)
+
+        self.assertIsNone(self.pr.get_clause_from_path('/b'))
+        self.assertEqual(self.gd.name_calls, 0)
+
+    def test_refresh(self):
+        """Test that refreshing a directory (as the stale-while-revalidate 
+        refresh does) keeps its children, and that it's still completely 
+        listed.
+        """
+
+        self.pr.get_children_from_entry_id(self.root_id)
+        page_calls = self.gd.page_calls
+
+        EntryCache.get_instance().fault_handler('entries', self.root_id)
+
+        self.assertTrue(self.pr.are_children_loaded(self.root_id))
+        self.assertEqual(
+            len(self.pr.get_children_from_entry_id(self.root_id)), 5)
+
+        clause = self.pr.get_clause_from_path('/b')
+
+        self.assertIsNotNone(clause)
+        self.assertEqual(clause[CLAUSE_ID], self.root_id + '-b')
+
+        self.assertEqual(self.gd.page_calls, page_calls)
+        self.assertEqual(self.gd.name_calls, 0)
+
+    def test_several_parents(self):
+        """Test that the directories of an entry that is in several, and 
+        that we don't have yet, are retrieved together.
+        """
+
+        parent_ids = [ self.root_id + '-p1', self.root_id + '-p2' ]
+        for parent_id in parent_ids:
+            self.gd.raw_entries[parent_id] = _build_raw_entry(
+                                                parent_id, 
+                                                parent_id, 
+                                                self.root_id, 
+                                                is_directory=True)
+
+        child_id = self.root_id + '-x'
+        raw_data = _build_raw_entry(child_id, u'x')
+        raw_data[u'parents'] = [ { u'id': parent_id } 
+                                 for parent_id 
+                                 in parent_ids ]
+
+        self.gd.raw_entries[child_id] = raw_data
+
+        EntryCache.get_instance().fault_handler('entries', child_id)
+
+        self.assertEqual(self.gd.batches, [parent_ids])
+
+        for parent_id in parent_ids:
+            self.assertTrue(self.pr.is_cached(parent_id))
+
+        self.assertTrue(self.pr.is_cached(child_id))
+
+    def __wait_for(self, f, timeout_s=10):
+        stop_at = time.time() + timeout_s
+        while f() is False:
+            self.assertLess(time.time(), stop_at)
+            time.sleep(0.01)
+
+    def __get_names(self, entry_tuples):
+        return [ filename for (filename, entry) in entry_tuples ]
+
+    def test_streamed_listing(self):
+        """Test that the pages are read as the listing is consumed, rather 
+        than all up-front.
+        """
+
+        self.gd = _FakeDrive(self.root_id, list('abcdefghij'), 2)
+        EntryCache.get_instance()._EntryCache__gd = self.gd
+
+        children = self.pr.iterate_children_entries_from_entry_id(
+                    self.root_id)
+
+        names = [ next(children)[0] ]
+
+        # The first page is being consumed, the second is waiting, and the 
+        # third may be being read. The last two haven't been.
+        time.sleep(0.1)
+        self.assertLessEqual(self.gd.page_calls, 3)
+        self.assertFalse(self.pr.are_children_loaded(self.root_id))
+
+        names += self.__get_names(children)
+
+        self.assertEqual(names, list('abcdefghij'))
+        self.assertEqual(self.gd.page_calls, 5)
+        self.assertTrue(self.pr.are_children_loaded(self.root_id))
+
+    def test_streamed_listing_overlap(self):
+        """Test that a child that comes back on two pages, and one that is 
+        already known but isn't on any page, are each produced once.
+        """
+
+        self.gd = _FakeDrive(self.root_id, list('abcde'), 2, overlap=1, 
+                             unlisted=['z'])
+        EntryCache.get_instance()._EntryCache__gd = self.gd
+
+        self.assertIsNotNone(self.pr.get_clause_from_path('/z'))
+
+        names = self.__get_names(
+                    self.pr.iterate_children_entries_from_entry_id(
+                        self.root_id))
+
+        self.assertEqual(sorted(names), list('abcdez'))
+
+    def test_streamed_listing_abandoned(self):
+        """Test that the listing still completes (and is registered) if we 
+        stop consuming it part-way.
+        """
+
+        self.gd = _FakeDrive(self.root_id, list('abcdefghij'), 2)
+        EntryCache.get_instance()._EntryCache__gd = self.gd
+
+        children = self.pr.iterate_children_entries_from_entry_id(
+                    self.root_id)
+
+        next(children)
+        children.close()
+
+        self.__wait_for(lambda: self.pr.are_children_loaded(self.root_id))
+
+        self.assertEqual(self.gd.page_calls, 5)
+        self.assertEqual(
+            len(self.pr.get_children_from_entry_id(self.root_id)), 10)
+
+    def test_streamed_listing_shared(self):
+        """Test that a listing that joins one already in progress produces 
+        all of the children, and that they're only read once.
+        """
+
+        self.gd = _FakeDrive(self.root_id, list('abcde'), 2)
+        EntryCache.get_instance()._EntryCache__gd = self.gd
+
+        # Make sure that the directory itself is loaded before we hold up the 
+        # listings.
+        self.pr.get_clause_from_path('/')
+
+        self.gd.gate = threading.Event()
+
+        t = threading.Thread(
+                target=self.pr.get_children_from_entry_id, 
+                args=(self.root_id,))
+
+        t.start()
+        self.gd.listing_ev.wait()
+
+        results = []
+        def consume():
+            results.extend(
+                self.__get_names(
+                    self.pr.iterate_children_entries_from_entry_id(
+                        self.root_id)))
+
+        t2 = threading.Thread(target=consume)
+        t2.start()
+
+        time.sleep(0.1)
+        self.gd.gate.set()
+
+        t.join()
+        t2.join()
+
+        self.assertEqual(results, list('abcde'))
+        self.assertEqual(self.gd.page_calls, 3)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import time
+
+from unittest import TestCase, main
+
+import gdrivefs.change
+
+from gdrivefs.conf import Conf
+from gdrivefs.cache.cache_agent import CacheAgent
+
+
+class _FakeAccountInfo(object):
+    largest_change_id = 10
+
+    @classmethod
+    def get_instance(cls):
+        return cls
+
+
+class _FakeEntryCache(object):
+    cache = None
+
+    @classmethod
+    def get_instance(cls):
+        return cls
+
+
+class _FakePathRelations(object):
+    """Fails to apply any change."""
+
+    @classmethod
+    def get_instance(cls):
+        return cls
+
+    @classmethod
+    def invalidate_missing(cls, entry_id, normalized_entry=None):
+        pass
+
+    @classmethod
+    def remove_entry_all(cls, entry_id, is_update=False):
+        raise IOError("Change could not be applied.")
+
+
+class _FakeDrive(object):
+    """Reports the given changes (none, by default)."""
+
+    def __init__(self):
+        self.changes = []
+
+    def list_changes(self, start_change_id=None):
+        largest_change_id = start_change_id - 1
+        if self.changes:
+            largest_change_id = self.changes[-1][0]
+
+        return (largest_change_id, None, self.changes)
+
+
+class ChangeManagerTestCase(TestCase):
+    """Test that the change-manager vouches for the cached entries while it's
+    caught-up.
+    """
+
+    def setUp(self):
+        self.gd = _FakeDrive()
+
+        self.__original_get_gdrive = gdrivefs.change.get_gdrive
+        self.__original_account_info = gdrivefs.change.AccountInfo
+        self.__original_entry_cache = gdrivefs.change.EntryCache
+        self.__original_path_relations = gdrivefs.change.PathRelations
+        self.__original_validity = Conf.get('cache_change_feed_validity')
+        self.__original_lease_s = Conf.get('cache_change_feed_lease_s')
+
+        gdrivefs.change.get_gdrive = lambda: self.gd
+        gdrivefs.change.AccountInfo = _FakeAccountInfo
+        gdrivefs.change.EntryCache = _FakeEntryCache
+        gdrivefs.change.PathRelations = _FakePathRelations
+
+        # As they would arrive as mount-options.
+        Conf.set('cache_change_feed_validity', True)
+        Conf.set('cache_change_feed_lease_s', '60')
+
+        self.agent = CacheAgent('test-%s' % (id(self)), 0.05)
+        _FakeEntryCache.cache = self.agent
+
+        self.cm = gdrivefs.change._ChangeManager()
+
+    def tearDown(self):
+        gdrivefs.change.get_gdrive = self.__original_get_gdrive
+        gdrivefs.change.AccountInfo = self.__original_account_info
+        gdrivefs.change.EntryCache = self.__original_entry_cache
+        gdrivefs.change.PathRelations = self.__original_path_relations
+
+        Conf.set('cache_change_feed_validity', self.__original_validity)
+        Conf.set('cache_change_feed_lease_s', self.__original_lease_s)
+
+    def test_lease(self):
+        """Test that entries don't expire while we're caught-up, and that 
+        they expire by age again once a change can't be applied.
+        """
+
+        self.agent.set('a', 1)
+
+        self.assertTrue(self.cm.process_updates())
+        self.assertTrue(self.agent.get_stats()['lease_valid'])
+
+        time.sleep(0.1)
+        self.assertTrue(self.agent.exists('a'))
+
+        self.gd.changes = [(11, ('b', True, None))]
+
+        self.assertFalse(self.cm.process_updates())
+        self.assertEqual(self.cm.at_change_id, 10)
+
+        self.assertFalse(self.agent.get_stats()['lease_valid'])
+        self.assertFalse(self.agent.exists('a'))
+
+if __name__ == '__main__':
+    main()
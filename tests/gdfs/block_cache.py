@@ -0,0 +1,85 @@
+import tempfile
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.gdfs.block_cache import BlockCache
+
+_DATA = ''.join([chr(i % 256) for i in xrange(1000)])
+
+class BlockCacheTestCase(TestCase):
+    """Test the BlockCache class."""
+
+    def __get_cache(self, fetched):
+        fh = tempfile.TemporaryFile()
+        fh.truncate(len(_DATA))
+
+        def fetch(f, offset, length):
+            time.sleep(0.05)
+            fetched.append((offset, length))
+
+            # Arrives in pieces.
+            for i in xrange(offset, offset + length, 30):
+                f.write(_DATA[i:min(i + 30, offset + length)])
+
+        return BlockCache(fh, len(_DATA), 100, fetch)
+
+    def test_read(self):
+        """Test that only the missing blocks of a read are fetched, in one
+        range.
+        """
+
+        fetched = []
+        cache = self.__get_cache(fetched)
+
+        self.assertEqual(cache.read(150, 100), _DATA[150:250])
+        self.assertEqual(fetched, [(100, 200)])
+
+        self.assertEqual(cache.read(120, 250), _DATA[120:370])
+        self.assertEqual(fetched, [(100, 200), (300, 100)])
+
+        self.assertFalse(cache.is_complete)
+
+        cache.materialize()
+        self.assertTrue(cache.is_complete)
+        self.assertEqual(cache.read(0, 2000), _DATA)
+
+    def test_concurrent_read(self):
+        """Test that a block being fetched by one reader isn't fetched again
+        by another.
+        """
+
+        fetched = []
+        cache = self.__get_cache(fetched)
+
+        threads = [threading.Thread(target=cache.read, args=(0, 50))
+                   for i in xrange(5)]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        self.assertEqual(fetched, [(0, 100)])
+
+    def test_short_fetch(self):
+        """Test that blocks that didn't completely arrive aren't taken as
+        present.
+        """
+
+        fh = tempfile.TemporaryFile()
+        fh.truncate(len(_DATA))
+
+        def fetch(f, offset, length):
+            f.write(_DATA[offset:offset + length - 1])
+
+        cache = BlockCache(fh, len(_DATA), 100, fetch)
+
+        self.assertRaises(IOError, cache.read, 0, 50)
+        self.assertEqual(cache.get_stats()['present'], 0)
+        self.assertEqual(cache.get_stats()['in_flight'], 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.gdfs.dir_listing import DirectoryListings
+
+class DirectoryListingsTestCase(TestCase):
+    """Test the DirectoryListings class."""
+
+    def setUp(self):
+        self.builds = 0
+        self.closed = []
+
+    def __build_items(self, names):
+        def build_items():
+            self.builds += 1
+
+            try:
+                for name in names:
+                    yield (name, None)
+            finally:
+                self.closed.append(self.builds)
+
+        return build_items
+
+    def __read(self, listings, path, offset, build_items, count):
+        """Take up to `count` entries, like the kernel filling a buffer. As
+        with FUSE, the entry that didn't fit is produced but not taken.
+        """
+
+        taken = []
+        items = listings.produce(path, offset, build_items)
+
+        for (name, stat_result, item_offset) in items:
+            if len(taken) == count:
+                break
+
+            taken.append((name, item_offset))
+
+        items.close()
+
+        return taken
+
+    def test_installments(self):
+        """Test that a listing that's cut short is continued from where the
+        kernel left off, without being built again.
+        """
+
+        listings = DirectoryListings()
+        build_items = self.__build_items(list('abcde'))
+
+        taken = self.__read(listings, '/d', 0, build_items, 2)
+        self.assertEqual(taken, [('a', 1), ('b', 2)])
+        self.assertEqual(len(listings), 1)
+
+        taken = self.__read(listings, '/d', 2, build_items, 2)
+        self.assertEqual(taken, [('c', 3), ('d', 4)])
+
+        taken = self.__read(listings, '/d', 4, build_items, 2)
+        self.assertEqual(taken, [('e', 5)])
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(self.closed, [1])
+        self.assertEqual(len(listings), 0)
+
+    def test_not_continued(self):
+        """Test that a listing is started over (and the given number of 
+        entries skipped) if there's nothing to continue, and that one that 
+        isn't continued in time is dropped.
+        """
+
+        listings = DirectoryListings(max_idle_s=0.05)
+        build_items = self.__build_items(list('abcde'))
+
+        taken = self.__read(listings, '/d', 3, build_items, 10)
+        self.assertEqual(taken, [('d', 4), ('e', 5)])
+        self.assertEqual(self.builds, 1)
+
+        self.__read(listings, '/d', 0, build_items, 1)
+        self.assertEqual(len(listings), 1)
+
+        time.sleep(0.1)
+
+        # Any use of the listings drops the stale ones.
+        taken = self.__read(listings, '/other', 0, 
+                            self.__build_items(list('xyz')), 10)
+
+        self.assertEqual(len(taken), 3)
+        self.assertEqual(len(listings), 0)
+        self.assertEqual(self.closed, [1, 2, 3])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.gdfs.readahead import Readahead
+
+class _FakeBlocks(object):
+    def __init__(self):
+        self.ensured = []
+        self.event = threading.Event()
+
+    def ensure(self, offset, length):
+        self.ensured.append((offset, length))
+        self.event.set()
+
+class ReadaheadTestCase(TestCase):
+    """Test the Readahead class."""
+
+    def __read(self, readahead, blocks, offset, length):
+        blocks.event.clear()
+        readahead.notify_read(offset, length)
+        blocks.event.wait(1)
+
+        # Let the readahead finish-up.
+        time.sleep(0.05)
+
+    def test_window(self):
+        """Test that the window grows while reads are sequential, and 
+        collapses on a random one.
+        """
+
+        blocks = _FakeBlocks()
+        readahead = Readahead(blocks, 10000000, 1000, 4000)
+
+        readahead.notify_read(0, 100)
+        self.assertEqual(readahead.window_b, 0)
+
+        self.__read(readahead, blocks, 100, 100)
+        self.__read(readahead, blocks, 200, 100)
+        self.__read(readahead, blocks, 300, 100)
+        self.__read(readahead, blocks, 400, 100)
+
+        self.assertEqual(blocks.ensured, [(200, 1000), (300, 2000), 
+                                          (400, 4000), (500, 4000)])
+
+        readahead.notify_read(5000000, 100)
+        self.assertEqual(readahead.window_b, 0)
+
+if __name__ == '__main__':
+    main()
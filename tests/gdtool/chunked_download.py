@@ -0,0 +1,104 @@
+import contextlib
+import os
+import re
+import tempfile
+import threading
+
+from unittest import TestCase, main
+
+from gdrivefs.gdtool.chunked_download import ParallelDownload, ChunkSizer
+
+_DATA = ''.join([chr(i % 256) for i in xrange(1000)])
+
+class _Response(dict):
+    status = 206
+    reason = 'Partial Content'
+
+class _FakeHttp(object):
+    """Serves ranges of _DATA, failing the first request for the range at
+    offset (500).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.requested = []
+
+    def request(self, uri, headers):
+        (start, end) = [int(x) for x 
+                        in re.match(r'bytes=(\d+)-(\d+)', 
+                                    headers['range']).groups()]
+
+        with self.__lock:
+            is_failing = start == 500 and (start, end) not in self.requested
+            self.requested.append((start, end))
+
+        response = _Response()
+        if is_failing is True:
+            response.status = 503
+            return (response, '')
+
+        response['content-range'] = ('bytes %d-%d/%d' % 
+                                     (start, end, len(_DATA)))
+
+        return (response, _DATA[start:end + 1])
+
+class ParallelDownloadTestCase(TestCase):
+    """Test the ParallelDownload class."""
+
+    def test_download(self):
+        """Test that the ranges are reassembled in place, and that a range 
+        that fails is retried.
+        """
+
+        http = _FakeHttp()
+
+        @contextlib.contextmanager
+        def borrow_http():
+            yield http
+
+        (fd, filepath) = tempfile.mkstemp()
+        os.close(fd)
+
+        try:
+            downloader = ParallelDownload(filepath, borrow_http, 'uri', 
+                                          len(_DATA), range_size=250, 
+                                          num_workers=3, chunksize=100)
+
+            downloader._sleep = lambda s: None
+            downloader.download()
+
+            with open(filepath, 'rb') as f:
+                self.assertEqual(f.read(), _DATA)
+        finally:
+            os.remove(filepath)
+
+        self.assertEqual(http.requested.count((500, 600)), 2)
+
+class ChunkSizerTestCase(TestCase):
+    """Test the ChunkSizer class."""
+
+    def test_adapt(self):
+        """Test that chunks grow toward the size at which the round-trip is 
+        a tenth of each request, and shrink after an error.
+        """
+
+        rtt_s = 0.05
+        bandwidth_bps = 1024 * 1024
+
+        sizer = ChunkSizer(16 * 1024, 4 * 1024 * 1024)
+        self.assertEqual(sizer.size, 16 * 1024)
+
+        for i in xrange(20):
+            sizer.on_chunk(sizer.size, 
+                           rtt_s + float(sizer.size) / bandwidth_bps)
+
+        # bandwidth * RTT * 0.9 / 0.1
+        self.assertAlmostEqual(sizer.size, 9 * 0.05 * 1024 * 1024, 
+                               delta=32 * 1024)
+
+        size = sizer.size
+        sizer.on_error()
+        self.assertEqual(sizer.size, size // 2)
+
+if __name__ == '__main__':
+    main()
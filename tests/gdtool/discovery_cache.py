@@ -0,0 +1,159 @@
+import json
+import os.path
+import shutil
+import tempfile
+import time
+
+from unittest import TestCase, main
+
+import gdrivefs.gdtool.discovery_cache
+
+from gdrivefs.conf import Conf
+from gdrivefs.gdtool.discovery_cache import build_client
+
+_DISCOVERY_URL = 'https://example.com/discovery/{api}/{apiVersion}'
+
+
+class _FakeResponse(object):
+    def __init__(self, status):
+        self.status = status
+        self.reason = 'test'
+
+
+class _FakeHttp(object):
+    """Serves the discovery document for the given version, or fails."""
+
+    def __init__(self, version):
+        self.version = version
+        self.fail = False
+        self.requests = []
+
+    def request(self, url):
+        self.requests.append(url)
+
+        if self.fail is True:
+            return (_FakeResponse(500), '')
+
+        return (_FakeResponse(200), 
+                json.dumps({ 'name': 'drive', 'version': self.version }))
+
+
+class BuildClientTestCase(TestCase):
+    """Test that the discovery document is stored and reused."""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.path, 'discovery')
+
+        self.__original_filepath = Conf.get('discovery_document_filepath')
+        self.__original_max_age_s = Conf.get('discovery_document_max_age_s')
+        self.__original_build_from_document = \
+            gdrivefs.gdtool.discovery_cache.build_from_document
+
+        Conf.set('discovery_document_filepath', self.filepath)
+        Conf.set('discovery_document_max_age_s', '3600')
+
+        # Rather than a client, we get back the document that it would've 
+        # been built from.
+        gdrivefs.gdtool.discovery_cache.build_from_document = \
+            lambda document, base, http: json.loads(document)
+
+        self.http = _FakeHttp('v2')
+
+    def tearDown(self):
+        Conf.set('discovery_document_filepath', self.__original_filepath)
+        Conf.set('discovery_document_max_age_s', self.__original_max_age_s)
+
+        gdrivefs.gdtool.discovery_cache.build_from_document = \
+            self.__original_build_from_document
+
+        shutil.rmtree(self.path)
+
+    def __build(self):
+        return build_client('drive', 'v2', self.http, _DISCOVERY_URL)
+
+    def __age(self, age_s):
+        with open(self.filepath) as f:
+            stored = json.load(f)
+
+        stored['retrieved_at'] -= age_s
+
+        with open(self.filepath, 'w') as f:
+            json.dump(stored, f)
+
+    def test_reuse(self):
+        """Test that a fresh copy is used without retrieving it again."""
+
+        self.assertEqual(self.__build()['version'], 'v2')
+        self.assertEqual(self.__build()['version'], 'v2')
+
+        self.assertEqual(self.http.requests, 
+                         ['https://example.com/discovery/drive/v2'])
+
+    def test_refresh(self):
+        """Test that a copy that's too old is retrieved again."""
+
+        self.__build()
+        self.__age(7200)
+
+        self.__build()
+        self.assertEqual(len(self.http.requests), 2)
+
+        # The new copy is fresh.
+        self.__build()
+        self.assertEqual(len(self.http.requests), 2)
+
+    def test_stale_fallback(self):
+        """Test that a copy that's too old is used if a new one can't be 
+        retrieved, and that nothing is used if there's no copy at all.
+        """
+
+        self.http.fail = True
+        self.assertRaises(Exception, self.__build)
+
+        self.http.fail = False
+        self.__build()
+        self.__age(7200)
+
+        self.http.fail = True
+        self.assertEqual(self.__build()['version'], 'v2')
+        self.assertEqual(len(self.http.requests), 3)
+
+    def test_ignore_invalid(self):
+        """Test that a corrupt copy, or one for another version, is replaced.
+        """
+
+        with open(self.filepath, 'w') as f:
+            f.write('{"format_version": 1, "docu')
+
+        self.__build()
+        self.assertEqual(len(self.http.requests), 1)
+
+        # Stored under a different format.
+
+        with open(self.filepath) as f:
+            stored = json.load(f)
+
+        stored['format_version'] += 1
+
+        with open(self.filepath, 'w') as f:
+            json.dump(stored, f)
+
+        self.__build()
+        self.assertEqual(len(self.http.requests), 2)
+
+        # For a different version of the API.
+
+        with open(self.filepath) as f:
+            stored = json.load(f)
+
+        stored['document'] = json.dumps({ 'name': 'drive', 'version': 'v1' })
+
+        with open(self.filepath, 'w') as f:
+            json.dump(stored, f)
+
+        self.assertEqual(self.__build()['version'], 'v2')
+        self.assertEqual(len(self.http.requests), 3)
+
+if __name__ == '__main__':
+    main()
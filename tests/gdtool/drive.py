@@ -0,0 +1,305 @@
+import contextlib
+import ssl
+import tempfile
+import threading
+import time
+
+from unittest import TestCase, main
+
+import httplib2
+
+from apiclient.errors import HttpError
+
+from gdrivefs.gdtool.drive import _coalesce, _marshall, \
+                                  get_coalescing_stats, _GdriveManager
+from gdrivefs.general.metrics import get_metrics
+from gdrivefs.gdtool.streaming_http import StreamingHttp
+from gdrivefs.gdfs.block_cache import BlockCache
+
+
+class _FakeClient(object):
+    """Holds up every read until it's released."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+        self.started_ev = threading.Event()
+        self.release_ev = threading.Event()
+
+    @_coalesce
+    def read_for_test(self, entry_id):
+        self.calls.append(entry_id)
+        self.started_ev.set()
+        self.release_ev.wait(10)
+
+        if self.fail is True:
+            raise ValueError(entry_id)
+
+        return [entry_id]
+
+
+class CoalesceTestCase(TestCase):
+    """Test that concurrent identical reads are coalesced."""
+
+    def __read_concurrently(self, client, count):
+        outcomes = []
+        outcomes_lock = threading.Lock()
+
+        def read():
+            try:
+                outcome = client.read_for_test('a')
+            except Exception as e:
+                outcome = e
+
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+        threads = [ threading.Thread(target=read) for i in xrange(count) ]
+
+        threads[0].start()
+        client.started_ev.wait(10)
+
+        for t in threads[1:]:
+            t.start()
+
+        # Give the others a chance to join the read in progress.
+        time.sleep(0.1)
+        client.release_ev.set()
+
+        for t in threads:
+            t.join()
+
+        return outcomes
+
+    def test_shared(self):
+        """Test that concurrent identical calls share one execution, and that
+        each caller gets its own copy of the result.
+        """
+
+        client = _FakeClient()
+
+        outcomes = self.__read_concurrently(client, 5)
+
+        self.assertEqual(client.calls, ['a'])
+        self.assertEqual(outcomes, [['a']] * 5)
+        self.assertEqual(len(set(id(outcome) for outcome in outcomes)), 5)
+
+        stats = get_coalescing_stats()['read_for_test']
+        self.assertEqual(stats['calls'], 5)
+        self.assertEqual(stats['coalesced'], 4)
+
+    def test_exception(self):
+        """Test that a failure reaches every caller."""
+
+        client = _FakeClient(fail=True)
+
+        outcomes = self.__read_concurrently(client, 5)
+
+        self.assertEqual(client.calls, ['a'])
+        self.assertEqual(len(outcomes), 5)
+
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, ValueError)
+
+
+class _FakeNestingClient(object):
+    @_marshall
+    def outer_for_test(self):
+        return self.inner_for_test()
+
+    @_marshall
+    def inner_for_test(self):
+        return 'result'
+
+
+class MarshallTestCase(TestCase):
+    """Test the _marshall wrapper."""
+
+    def __get_calls(self, method):
+        counters = get_metrics().get_snapshot()['counters']
+        return counters.get(('drive_calls_total', (('method', method),)), 0)
+
+    def test_nested(self):
+        """Test that a call made from within another is only counted as part 
+        of that one.
+        """
+
+        client = _FakeNestingClient()
+
+        self.assertEqual(client.outer_for_test(), 'result')
+        self.assertEqual(client.inner_for_test(), 'result')
+
+        self.assertEqual(self.__get_calls('outer_for_test'), 1)
+        self.assertEqual(self.__get_calls('inner_for_test'), 1)
+
+_DATA = 'AAAABBBBCCCCDDDD'
+
+
+class _FakeStreamingHttp(StreamingHttp):
+    """Serves ranges of _DATA. If told to, the next request fails after 
+    writing part of what was asked for.
+    """
+
+    def __init__(self):
+        self.requested = []
+        self.fail_next = False
+
+    def stream(self, uri, headers, fd):
+        (start, end) = headers['range'][len('bytes='):].split('-')
+        (start, end) = (int(start), int(end))
+
+        self.requested.append((start, end))
+
+        data = _DATA[start:end + 1]
+        if self.fail_next is True:
+            self.fail_next = False
+
+            fd.write(data[:3])
+            raise ssl.SSLError('connection reset')
+
+        fd.write(data)
+
+        response = httplib2.Response({ 'status': 206 })
+        response['content-range'] = \
+            'bytes %d-%d/%d' % (start, end, len(_DATA))
+
+        return (response, None, len(data))
+
+
+class _FakeAuth(object):
+    def __init__(self, http):
+        self.__http = http
+
+    @contextlib.contextmanager
+    def borrow_streaming_http(self):
+        yield self.__http
+
+
+class _FakeEntry(object):
+    id = 'a'
+    download_links = { 'text/plain': 'https://example.com/a' }
+
+
+class DownloadRangeTestCase(TestCase):
+    """Test downloading a range into the block-cache."""
+
+    def test_resume(self):
+        """Test that a reattempt after a partial write carries on from where
+        it stopped, rather than writing the range again from there (over the
+        next block).
+        """
+
+        http = _FakeStreamingHttp()
+
+        gd = _GdriveManager.__new__(_GdriveManager)
+        gd._GdriveManager__auth = _FakeAuth(http)
+
+        fh = tempfile.TemporaryFile()
+        fh.truncate(len(_DATA))
+
+        def fetch(f, offset, length):
+            gd.download_range(_FakeEntry(), 'text/plain', f, offset, length)
+
+        cache = BlockCache(fh, len(_DATA), 4, fetch)
+
+        # Have the last block, already.
+        self.assertEqual(cache.read(12, 4), 'DDDD')
+
+        http.fail_next = True
+        self.assertEqual(cache.read(8, 4), 'CCCC')
+        self.assertEqual(cache.read(12, 4), 'DDDD')
+
+        self.assertEqual(http.requested, [(12, 15), (8, 11), (11, 11)])
+
+
+class _FakeGetRequest(object):
+    """Answers with the entry, or with a 304 if it's asked for 
+    conditionally.
+    """
+
+    def __init__(self, requests, entry_id):
+        self.__requests = requests
+        self.__entry_id = entry_id
+        self.headers = {}
+
+    def execute(self, http=None):
+        self.__requests.append(dict(self.headers))
+
+        if 'If-None-Match' in self.headers:
+            raise HttpError(httplib2.Response({ 'status': 304 }), '')
+
+        return { u'kind': u'drive#file',
+                 u'etag': u'etag-1',
+                 u'id': self.__entry_id,
+                 u'title': u'a',
+                 u'mimeType': u'text/plain',
+                 u'labels': {},
+                 u'lastModifyingUserName': u'user',
+                 u'writersCanShare': True,
+                 u'ownerNames': [u'user'],
+                 u'editable': True,
+                 u'userPermission': {},
+                 u'modifiedDate': u'2015-01-01T00:00:00.000Z',
+                 u'modifiedByMeDate': u'2015-01-01T00:00:00.000Z',
+                 u'lastViewedByMeDate': u'2015-01-01T00:00:00.000Z',
+                 u'fileSize': u'0',
+                 u'exportLinks': {},
+                 u'parents': [] }
+
+
+class _FakeFiles(object):
+    def __init__(self, requests):
+        self.__requests = requests
+
+    def get(self, fileId=None, **kwargs):
+        return _FakeGetRequest(self.__requests, fileId)
+
+
+class _FakeMetadataClient(object):
+    def __init__(self):
+        self.requests = []
+
+    def files(self):
+        return _FakeFiles(self.requests)
+
+
+class _FakeMetadataAuth(object):
+    def __init__(self, client):
+        self.__client = client
+
+    def get_client(self):
+        return self.__client
+
+    @contextlib.contextmanager
+    def borrow_http(self):
+        yield httplib2.Http()
+
+
+class ConditionalTestCase(TestCase):
+    """Test the requests that are made conditional on their ETag."""
+
+    def test_not_modified_copy(self):
+        """Test that every caller of a request that wasn't modified gets its
+        own entry, so that one can't change what the others see.
+        """
+
+        client = _FakeMetadataClient()
+
+        gd = _GdriveManager.__new__(_GdriveManager)
+        gd._GdriveManager__auth = _FakeMetadataAuth(client)
+
+        entry_id = 'conditional-%d' % (id(self),)
+
+        entry1 = gd.get_entry(entry_id)
+        entry1.download_links['text/html'] = 'https://example.com/a'
+
+        entry2 = gd.get_entry(entry_id)
+
+        self.assertEqual(client.requests, 
+                         [{}, { 'If-None-Match': u'etag-1' }])
+
+        self.assertIsNot(entry2, entry1)
+        self.assertEqual(entry2.download_links, {})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+from unittest import TestCase, main
+
+from gdrivefs.gdtool.etag_cache import EtagCache
+
+class EtagCacheTestCase(TestCase):
+    """Test the EtagCache class."""
+
+    def test_bounded(self):
+        """Test that the least-recently-used are dropped first."""
+
+        cache = EtagCache(2)
+
+        cache.set('a', 'etag-a', 1)
+        cache.set('b', 'etag-b', 2)
+
+        # "a" is now more recent than "b".
+        self.assertEqual(cache.get('a'), ('etag-a', 1))
+
+        cache.set('c', 'etag-c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), ('etag-c', 3))
+
+    def test_hit_ratio(self):
+        cache = EtagCache(10)
+
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'etag-a', 1)
+
+        cache.get('a')
+        cache.mark_not_modified()
+
+        stats = cache.get_stats()
+
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['not_modified'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+if __name__ == '__main__':
+    main()
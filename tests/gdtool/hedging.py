@@ -0,0 +1,127 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.gdtool.hedging import _Hedger, _MIN_SAMPLES
+
+
+class HedgerTestCase(TestCase):
+    """Test the _Hedger class."""
+
+    def __warm_up(self, hedger):
+        """Give the hedger enough fast calls to know what's normal."""
+
+        for i in xrange(_MIN_SAMPLES):
+            hedger.call('test', lambda: None)
+
+    def test_hedge(self):
+        """Test that a slow call is hedged, and that the hedge's answer is
+        taken when it arrives first.
+        """
+
+        hedger = _Hedger(50, 1.0)
+        self.__warm_up(hedger)
+
+        release = threading.Event()
+        attempts = []
+
+        def f():
+            attempts.append(None)
+            if len(attempts) == 1:
+                release.wait(5)
+                return 'primary'
+
+            return 'hedge'
+
+        try:
+            self.assertEqual(hedger.call('test', f), 'hedge')
+        finally:
+            release.set()
+
+        stats = hedger.get_stats()['test']
+        self.assertEqual(stats['hedged'], 1)
+        self.assertEqual(stats['hedge_wins'], 1)
+
+    def test_not_hedged(self):
+        """Test that a call isn't hedged until we know what's normal, and
+        that it's then made on the calling thread.
+        """
+
+        hedger = _Hedger(50, 1.0)
+
+        thread = []
+        hedger.call('test', lambda: thread.append(threading.current_thread()))
+
+        self.assertIs(thread[0], threading.current_thread())
+        self.assertEqual(hedger.get_stats()['test']['hedged'], 0)
+
+    def test_budget(self):
+        """Test that no hedge is made once the budget is spent."""
+
+        hedger = _Hedger(50, 0.0)
+        self.__warm_up(hedger)
+
+        def f():
+            time.sleep(0.05)
+            return 'primary'
+
+        self.assertEqual(hedger.call('test', f), 'primary')
+        self.assertEqual(hedger.get_stats()['test']['hedged'], 0)
+
+    def test_failure_first(self):
+        """Test that a failure that arrives first is raised right away, 
+        rather than waiting on the other attempt.
+        """
+
+        hedger = _Hedger(50, 1.0)
+        self.__warm_up(hedger)
+
+        release = threading.Event()
+        attempts = []
+
+        def f():
+            attempts.append(None)
+            if len(attempts) == 1:
+                time.sleep(0.1)
+                raise ValueError('primary')
+
+            release.wait(5)
+            return 'hedge'
+
+        try:
+            with self.assertRaises(ValueError) as context:
+                hedger.call('test', f)
+        finally:
+            release.set()
+
+        self.assertEqual(str(context.exception), 'primary')
+
+        stats = hedger.get_stats()['test']
+        self.assertEqual(stats['hedged'], 1)
+        self.assertEqual(stats['hedge_wins'], 0)
+
+    def test_failure_unhedged(self):
+        """Test that a failure that arrives before we'd hedge is raised 
+        without a hedge being made.
+        """
+
+        hedger = _Hedger(50, 1.0)
+
+        # Normal calls take a while.
+        for i in xrange(_MIN_SAMPLES):
+            hedger.call('test', lambda: time.sleep(0.02))
+
+        attempts = []
+
+        def f():
+            attempts.append(None)
+            raise ValueError('primary')
+
+        self.assertRaises(ValueError, hedger.call, 'test', f)
+
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(hedger.get_stats()['test']['hedged'], 0)
+
+if __name__ == '__main__':
+    main()
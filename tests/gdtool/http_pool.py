@@ -0,0 +1,56 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.gdtool.http_pool import HttpPool
+
+class HttpPoolTestCase(TestCase):
+    """Test the HttpPool class."""
+
+    def test_bounded(self):
+        """Test that no more than the maximum are created, and that the
+        threads that have to wait get one that was returned.
+        """
+
+        pool = HttpPool(object, 2)
+
+        seen = set()
+        seen_lock = threading.Lock()
+
+        def use():
+            for i in xrange(50):
+                with pool.borrow() as http:
+                    with seen_lock:
+                        seen.add(id(http))
+
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=use) for i in xrange(8)]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        stats = pool.get_stats()
+
+        self.assertLessEqual(stats['created'], 2)
+        self.assertEqual(stats['idle'], stats['created'])
+        self.assertEqual(len(seen), stats['created'])
+
+    def test_reentrant(self):
+        """Test that a thread borrowing again gets the same one, even when
+        there are none left.
+        """
+
+        pool = HttpPool(object, 1)
+
+        with pool.borrow() as outer:
+            with pool.borrow() as inner:
+                self.assertIs(inner, outer)
+
+        self.assertEqual(pool.get_stats()['idle'], 1)
+
+if __name__ == '__main__':
+    main()
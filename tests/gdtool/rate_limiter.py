@@ -0,0 +1,87 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.gdtool.rate_limiter import _RateLimiter, priority, \
+                                         PRIORITY_INTERACTIVE, \
+                                         PRIORITY_BACKGROUND
+
+class RateLimiterTestCase(TestCase):
+    """Test the _RateLimiter class."""
+
+    def test_priority(self):
+        """Test that a waiting interactive call goes before a background call
+        that has been waiting longer.
+        """
+
+        limiter = _RateLimiter(1, 10, 1, 1, 0.5)
+
+        # Start pacing, with an empty bucket.
+        limiter.on_throttled()
+
+        order = []
+
+        def acquire(priority_class):
+            with priority(priority_class):
+                limiter.acquire()
+
+            order.append(priority_class)
+
+        background = threading.Thread(target=acquire,
+                                      args=(PRIORITY_BACKGROUND,))
+        background.start()
+
+        time.sleep(0.05)
+
+        interactive = threading.Thread(target=acquire,
+                                       args=(PRIORITY_INTERACTIVE,))
+        interactive.start()
+
+        background.join()
+        interactive.join()
+
+        self.assertEqual(order, [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND])
+
+    def test_aimd(self):
+        """Test that the rate is cut once for a burst of rejections, and then
+        recovers gradually.
+        """
+
+        limiter = _RateLimiter(1, 20, 1, 1, 0.5)
+
+        limiter.on_throttled()
+        limiter.on_throttled()
+
+        stats = limiter.get_stats()
+        self.assertEqual(stats['rate'], 10.0)
+        self.assertEqual(stats['throttled'], 2)
+
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.get_stats()['rate'], 10.1)
+
+    def test_not_pacing(self):
+        """Test that nothing waits, and the rate isn't raised, until we're 
+        first throttled.
+        """
+
+        limiter = _RateLimiter(1, 20, 1, 1, 0.5)
+
+        started_at = time.time()
+        for i in xrange(100):
+            limiter.acquire()
+            limiter.on_success()
+
+        self.assertLess(time.time() - started_at, 1)
+
+        stats = limiter.get_stats()
+        self.assertFalse(stats['pacing'])
+        self.assertEqual(stats['rate'], 20.0)
+        self.assertEqual(stats['priorities']['interactive']['acquired'], 100)
+        self.assertEqual(stats['priorities']['interactive']['waits'], 0)
+
+        limiter.on_throttled()
+        self.assertTrue(limiter.get_stats()['pacing'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import threading
+import BaseHTTPServer
+
+from unittest import TestCase, main
+
+from gdrivefs.gdtool.streaming_http import StreamingHttp
+
+_DATA = ''.join([chr(i % 256) for i in xrange(100000)])
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Redirects /file to /data, which rejects the first token."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def __reply(self, status, headers={}, body=''):
+        self.send_response(status)
+
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/file':
+            self.__reply(302, { 'Location': '/data' })
+        elif self.headers.get('authorization') != 'Bearer 2':
+            self.__reply(401)
+        else:
+            self.__reply(200, body=_DATA)
+
+    def log_message(self, *args):
+        pass
+
+class _FakeCredentials(object):
+    token = 1
+
+    def apply(self, headers):
+        headers['authorization'] = ('Bearer %d' % (self.token,))
+
+    def refresh(self, http):
+        self.token += 1
+
+class _FakeFile(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+class StreamingHttpTestCase(TestCase):
+    """Test the StreamingHttp class."""
+
+    def test_stream(self):
+        """Test that the body is written a buffer at a time, after following
+        the redirect and refreshing the credentials.
+        """
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+
+        t = threading.Thread(target=server.serve_forever)
+        t.daemon = True
+        t.start()
+
+        try:
+            uri = ('http://127.0.0.1:%d/file' % (server.server_address[1],))
+
+            http = StreamingHttp(_FakeCredentials(), buffer_size=4096)
+            f = _FakeFile()
+
+            (response, content, written_b) = http.stream(uri, {}, f)
+            http.close()
+        finally:
+            server.shutdown()
+
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response['content-location'].endswith('/data'))
+        self.assertEqual(content, None)
+        self.assertEqual(written_b, len(_DATA))
+
+        self.assertEqual(''.join(f.writes), _DATA)
+        self.assertEqual(max([len(data) for data in f.writes]), 4096)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+from unittest import TestCase, main
+
+from gdrivefs.general.metrics import _Metrics, labels
+
+class MetricsTestCase(TestCase):
+    """Test the _Metrics class."""
+
+    def test_labels(self):
+        """Test that what's recorded is labeled with what the thread is doing,
+        and that statsd only gets the counters that changed.
+        """
+
+        metrics = _Metrics()
+
+        with labels(op='read'):
+            metrics.increment('drive_calls_total', method='get_entry')
+
+        metrics.increment('drive_calls_total', method='get_entry')
+
+        counters = metrics.get_snapshot()['counters']
+        self.assertEqual(
+            counters[('drive_calls_total', 
+                      (('method', 'get_entry'), ('op', 'read')))], 
+            1)
+
+        self.assertEqual(
+            counters[('drive_calls_total', (('method', 'get_entry'),))], 
+            1)
+
+        self.assertEqual(len(metrics.format_statsd()), 2)
+        self.assertEqual(metrics.format_statsd(), [])
+
+    def test_collector(self):
+        """Test that collected statistics are exported as gauges."""
+
+        metrics = _Metrics()
+        metrics.register_collector('hedging', 
+                                   lambda: { 'get_entry': { 'calls': 3 } }, 
+                                   label_name='method')
+
+        self.assertIn('gdfs_hedging_calls{method="get_entry"} 3.0', 
+                      metrics.format_prometheus())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from unittest import TestCase, main
+
+from gdrivefs.general.single_flight import SingleFlight
+
+class SingleFlightTestCase(TestCase):
+    """Test the SingleFlight class."""
+
+    def __run_concurrently(self, sf, f, count):
+        """Start `count` calls under the same key while the first one is held
+        up, and return the outcome of each.
+        """
+
+        release_ev = threading.Event()
+        started_ev = threading.Event()
+
+        def held(*args):
+            started_ev.set()
+            release_ev.wait(10)
+
+            return f(*args)
+
+        outcomes = []
+        outcomes_lock = threading.Lock()
+
+        def call():
+            try:
+                outcome = sf.do('key', held, 'arg')
+            except Exception as e:
+                outcome = e
+
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+        threads = [ threading.Thread(target=call) for i in xrange(count) ]
+
+        threads[0].start()
+        started_ev.wait(10)
+
+        for t in threads[1:]:
+            t.start()
+
+        # Give the followers a chance to join the call in progress.
+        while len(threads) > 1 and \
+              sf._SingleFlight__calls['key'].waiters < count - 1:
+            time.sleep(0.01)
+
+        release_ev.set()
+
+        for t in threads:
+            t.join()
+
+        return outcomes
+
+    def test_shared(self):
+        """Test that concurrent calls share one execution."""
+
+        sf = SingleFlight()
+        calls = []
+
+        def f(arg):
+            calls.append(arg)
+            return [arg]
+
+        outcomes = self.__run_concurrently(sf, f, 5)
+
+        self.assertEqual(calls, ['arg'])
+        self.assertEqual(sorted(outcomes), 
+                         [(['arg'], False)] + [(['arg'], True)] * 4)
+
+        self.assertFalse(sf.is_in_flight('key'))
+
+        # Once it's done, the next call runs again.
+        self.assertEqual(sf.do('key', f, 'arg'), (['arg'], False))
+        self.assertEqual(len(calls), 2)
+
+    def test_exception(self):
+        """Test that an exception reaches every caller."""
+
+        sf = SingleFlight()
+        calls = []
+
+        def f(arg):
+            calls.append(arg)
+            raise ValueError(arg)
+
+        outcomes = self.__run_concurrently(sf, f, 5)
+
+        self.assertEqual(calls, ['arg'])
+        self.assertEqual(len(outcomes), 5)
+
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, ValueError)
+
+if __name__ == '__main__':
+    main()